@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Book, BookFile, Author
+from .models import Book, BookFile, BookFileText, Author, UploadSession
 
 
 class BookFileInline(admin.TabularInline):
@@ -10,6 +10,7 @@ class BookFileInline(admin.TabularInline):
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
     list_display = ['title', 'author', 'status', 'overall_rating', 'user', 'created_at']
+    list_select_related = ['author', 'user']
     list_filter = ['status', 'user', 'created_at']
     search_fields = ['title', 'author__name']
     filter_horizontal = ['tags']
@@ -19,11 +20,29 @@ class BookAdmin(admin.ModelAdmin):
 @admin.register(Author)
 class AuthorAdmin(admin.ModelAdmin):
     list_display = ['name', 'user', 'created_at']
+    list_select_related = ['user']
     search_fields = ['name', 'user__username']
 
 
 @admin.register(BookFile)
 class BookFileAdmin(admin.ModelAdmin):
     list_display = ['book', 'file_type', 'original_filename', 'uploaded_at']
+    # Book.__str__ shows the author
+    list_select_related = ['book__author']
     list_filter = ['file_type', 'uploaded_at']
     search_fields = ['original_filename', 'book__title']
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['original_filename', 'book', 'user', 'received', 'size', 'updated_at']
+    list_select_related = ['book__author', 'user']
+    search_fields = ['original_filename', 'book__title', 'user__username']
+
+
+@admin.register(BookFileText)
+class BookFileTextAdmin(admin.ModelAdmin):
+    list_display = ['book_file', 'title', 'author', 'page_count', 'extracted_at']
+    list_select_related = ['book_file']
+    search_fields = ['title', 'author', 'book_file__book__title']
+    readonly_fields = ['book_file', 'extracted_at']
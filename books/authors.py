@@ -0,0 +1,71 @@
+import hashlib
+
+from django.core.cache import cache
+
+from core.versions import bump_version, current_version
+from .models import Author, normalize_author_name
+
+AUTHOR_SUGGESTION_LIMIT = 20
+AUTHOR_SUGGESTION_TIMEOUT = 60 * 60 * 24
+# Longer prefixes are cut; the datalist only needs to narrow the list down
+MAX_PREFIX_LENGTH = 50
+
+
+def author_suggestions_version(user_id):
+    """Version of the user's author list, embedded in suggestion URLs"""
+    return current_version('authors', user_id)
+
+
+def invalidate_author_suggestions(user_id):
+    bump_version('authors', user_id)
+
+
+def author_suggestions(user, prefix):
+    """Up to AUTHOR_SUGGESTION_LIMIT author names starting with `prefix`, cached per version"""
+    prefix = prefix.strip()[:MAX_PREFIX_LENGTH].lower()
+    digest = hashlib.md5(prefix.encode()).hexdigest()
+    key = f'author-suggestions:{user.pk}:{author_suggestions_version(user.pk)}:{digest}'
+    names = cache.get(key)
+    if names is None:
+        names = list(
+            Author.objects.filter(user=user, name__istartswith=prefix)
+            .order_by('name')
+            .values_list('name', flat=True)[:AUTHOR_SUGGESTION_LIMIT]
+        )
+        cache.set(key, names, AUTHOR_SUGGESTION_TIMEOUT)
+    return names
+
+
+def resolve_authors(user, names):
+    """
+    Map each of `names` to the user's Author of that name, creating missing
+    ones, in a single INSERT ... ON CONFLICT on (user, name_normalized).
+    Concurrent requests resolving the same new name get the same row.
+    Blank names are left out of the result. The returned instances are
+    meant for foreign keys: `name` holds the spelling that was asked for,
+    not necessarily the stored one.
+    """
+    wanted = {}
+    for name in names:
+        name = ' '.join(name.split())
+        if name:
+            wanted.setdefault(normalize_author_name(name), name)
+    if not wanted:
+        return {}
+
+    authors = Author.objects.bulk_create(
+        [Author(user=user, name=name, name_normalized=key) for key, name in wanted.items()],
+        # A no-op update, so existing rows keep their name and still return their pk
+        update_conflicts=True,
+        unique_fields=['user', 'name_normalized'],
+        update_fields=['name_normalized'],
+    )
+    # bulk_create skips save signals; new names must reach the suggestions
+    invalidate_author_suggestions(user.pk)
+    by_key = {author.name_normalized: author for author in authors}
+    return {name: by_key[normalize_author_name(name)] for name in names if name.strip()}
+
+
+def resolve_author(user, name):
+    """The user's Author called `name` (any case or spacing), created if needed"""
+    return resolve_authors(user, [name]).get(name)
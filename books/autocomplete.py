@@ -0,0 +1,55 @@
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import Q
+from django.db.models.functions import Left
+
+from core.models import Tag
+from core.search import build_prefix_query, search_rank
+from quotes.models import Quote
+from .models import Author, Book
+
+SUGGESTIONS_PER_GROUP = 5
+MIN_QUERY_LENGTH = 2
+# Shorter inputs are matched in full; longer ones are cut to keep lookups cheap
+MAX_QUERY_LENGTH = 100
+SNIPPET_LENGTH = 120
+
+
+def _ranked(queryset, field, term):
+    """
+    Rows whose `field` matches `term`, best first. Both the substring and
+    the fuzzy word match are served by the field's pg_trgm GIN index.
+    """
+    return (
+        queryset.filter(Q(**{f'{field}__icontains': term}) | Q(**{f'{field}__trigram_word_similar': term}))
+        .annotate(similarity=TrigramWordSimilarity(term, field))
+        .order_by('-similarity', field)
+    )
+
+
+def suggest(user, text, limit=SUGGESTIONS_PER_GROUP):
+    """Top titles, authors, tags and quote snippets for a partial search"""
+    term = text.strip()[:MAX_QUERY_LENGTH]
+    suggestions = {'books': [], 'authors': [], 'tags': [], 'quotes': []}
+    if len(term) < MIN_QUERY_LENGTH:
+        return suggestions
+
+    suggestions['books'] = list(
+        _ranked(Book.objects.filter(user=user), 'title', term)
+        .values('pk', 'title', 'author__name')[:limit]
+    )
+    suggestions['authors'] = list(
+        _ranked(Author.objects.filter(user=user), 'name', term).values('pk', 'name')[:limit]
+    )
+    suggestions['tags'] = list(
+        _ranked(Tag.objects.filter(user=user), 'name', term).values('pk', 'name')[:limit]
+    )
+
+    query = build_prefix_query(term)
+    if query is not None:
+        suggestions['quotes'] = list(
+            Quote.objects.filter(user=user, search_vector=query)
+            .annotate(rank=search_rank(query), snippet=Left('quote_text', SNIPPET_LENGTH))
+            .order_by('-rank', '-created_at')
+            .values('pk', 'book_id', 'book__title', 'snippet')[:limit]
+        )
+    return suggestions
@@ -0,0 +1,377 @@
+import json
+import os
+import posixpath
+import uuid
+import zipfile
+from datetime import datetime
+from itertools import groupby
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from core.conditional import bump_library_version
+from core.jobs import enqueue
+from core.models import Tag
+from notes.models import Note
+from quotes.models import Quote
+from .authors import resolve_authors
+from .blobs import adopt_blob
+from .extraction import EXTRACTABLE_TYPES
+from .importer import chunked, resolve_tags
+from .models import Book, BookFile, FileBlob
+from .search import refresh_search_vectors
+from .stats import invalidate_library_stats
+from .uploads import READ_SIZE, file_sha256
+
+EXPORT_FORMAT_VERSION = 1
+EXPORT_CHUNK_SIZE = 500
+MANIFEST_NAME = 'library.jsonl'
+# In the order they are written and must be restored
+RECORD_TYPES = ('tag', 'book', 'book_tag', 'note', 'quote', 'quote_tag', 'file', 'missing_file')
+# zipfile output is handed to the client whenever this much has piled up
+STREAM_BUFFER_SIZE = 256 * 1024
+
+BOOK_FIELDS = (
+    'id', 'title', 'author__name', 'publication_year', 'status', 'overall_rating',
+    'started_at', 'finished_at', 'cover_image', 'created_at', 'updated_at',
+)
+NOTE_FIELDS = ('id', 'book_id', 'note_type', 'title', 'body', 'page_start', 'page_end', 'created_at', 'updated_at')
+QUOTE_FIELDS = ('id', 'book_id', 'quote_text', 'page_number', 'my_comment', 'created_at')
+FILE_FIELDS = ('id', 'book_id', 'file_type', 'file', 'blob_id', 'blob__size', 'original_filename', 'mime_type', 'uploaded_at')
+
+
+def _archive_path(book_file):
+    """Where a file's bytes go in the zip; identical blobs share one entry"""
+    if book_file['blob_id']:
+        ext = os.path.splitext(book_file['file'])[1].lower()
+        return f"files/{book_file['blob_id']}{ext}"
+    return f"files/{book_file['id']}/{posixpath.basename(book_file['file'])}"
+
+
+def _cover_path(book):
+    return f"covers/{book['id']}/{posixpath.basename(book['cover_image'])}"
+
+
+class _ExportEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder cuts datetimes to milliseconds; keep them exact"""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _encode(record):
+    return (json.dumps(record, cls=_ExportEncoder) + '\n').encode()
+
+
+def _iterate(queryset, fields):
+    return queryset.order_by('pk').values(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def export_records(user, include_files=False):
+    """
+    Yield every record of the user's library as a dict, dependencies first.
+    Querysets are streamed with server-side cursors, so memory does not
+    grow with the library.
+    """
+    yield {'type': 'export', 'version': EXPORT_FORMAT_VERSION, 'files': include_files}
+    for tag in _iterate(Tag.objects.filter(user=user), ('id', 'name')):
+        yield {'type': 'tag', **tag}
+    for book in _iterate(Book.objects.filter(user=user), BOOK_FIELDS):
+        book['author'] = book.pop('author__name')
+        book['cover_image'] = _cover_path(book) if include_files and book['cover_image'] else None
+        yield {'type': 'book', **book}
+    for link in _iterate(Book.tags.through.objects.filter(book__user=user), ('book_id', 'tag_id')):
+        yield {'type': 'book_tag', **link}
+    for note in _iterate(Note.objects.filter(user=user), NOTE_FIELDS):
+        yield {'type': 'note', **note}
+    for quote in _iterate(Quote.objects.filter(user=user), QUOTE_FIELDS):
+        yield {'type': 'quote', **quote}
+    for link in _iterate(Quote.tags.through.objects.filter(quote__user=user), ('quote_id', 'tag_id')):
+        yield {'type': 'quote_tag', **link}
+    for book_file in _iterate(BookFile.objects.filter(book__user=user), FILE_FIELDS):
+        path = _archive_path(book_file) if include_files else None
+        yield {
+            'type': 'file',
+            'id': book_file['id'],
+            'book_id': book_file['book_id'],
+            'file_type': book_file['file_type'],
+            'original_filename': book_file['original_filename'],
+            'mime_type': book_file['mime_type'],
+            'uploaded_at': book_file['uploaded_at'],
+            'sha256': book_file['blob_id'],
+            'size': book_file['blob__size'],
+            'path': path,
+        }
+
+
+def export_jsonl(user):
+    """The library as JSON Lines, one encoded line at a time"""
+    for record in export_records(user):
+        yield _encode(record)
+
+
+class _StreamBuffer:
+    """Write-only file object collecting zipfile's output for a generator"""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks, self.size = [], 0
+        return data
+
+
+def _copy_into(archive, buffer, name, source, size):
+    """Stream `source` into a stored zip entry, yielding output as it fills"""
+    info = zipfile.ZipInfo(name)
+    # PDFs and EPUBs are already compressed
+    info.compress_type = zipfile.ZIP_STORED
+    with archive.open(info, 'w', force_zip64=size is None or size >= zipfile.ZIP64_LIMIT) as entry:
+        for block in iter(lambda: source.read(READ_SIZE), b''):
+            entry.write(block)
+            if buffer.size >= STREAM_BUFFER_SIZE:
+                yield buffer.drain()
+
+
+def _copy_stored(archive, buffer, name, path, size, missing):
+    """
+    Copy the stored file `name` into the zip as `path`. A file storage no
+    longer has is left out and noted in `missing`, since failing here would
+    cut off an archive that is already being downloaded.
+    """
+    try:
+        source = default_storage.open(name, 'rb')
+    except OSError:
+        missing.append(path)
+        return
+    with source:
+        yield from _copy_into(archive, buffer, path, source, size)
+
+
+def export_zip(user, include_files=True):
+    """
+    The library as a zip: book files and covers (with `include_files`),
+    then library.jsonl, which ends with a `missing_file` record for each
+    file that could not be read. zipfile writes to a buffer that is drained
+    after each block, so neither the archive nor any attachment is ever
+    held in memory.
+    """
+    buffer = _StreamBuffer()
+    missing = []
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        if include_files:
+            books = Book.objects.filter(user=user).exclude(cover_image='')
+            for book in _iterate(books.exclude(cover_image__isnull=True), ('id', 'cover_image')):
+                yield from _copy_stored(archive, buffer, book['cover_image'], _cover_path(book), None, missing)
+
+            written = set()
+            for book_file in _iterate(BookFile.objects.filter(book__user=user), FILE_FIELDS):
+                path = _archive_path(book_file)
+                if path in written:
+                    continue
+                written.add(path)
+                yield from _copy_stored(archive, buffer, book_file['file'], path, book_file['blob__size'], missing)
+
+        with archive.open(MANIFEST_NAME, 'w', force_zip64=True) as manifest:
+            for record in export_records(user, include_files):
+                manifest.write(_encode(record))
+                if buffer.size >= STREAM_BUFFER_SIZE:
+                    yield buffer.drain()
+            for path in missing:
+                manifest.write(_encode({'type': 'missing_file', 'path': path}))
+    yield buffer.drain()
+
+
+def _datetimes(record, *fields):
+    return {field: parse_datetime(record[field]) for field in fields if record.get(field)}
+
+
+class _Restore:
+    """State of one restore: ids of the export mapped to the rows created for them"""
+
+    def __init__(self, user, archive=None):
+        self.user = user
+        self.archive = archive
+        self.tags, self.books, self.quotes = {}, {}, {}
+        self.counts = {}
+
+    def tag(self, records):
+        tags = resolve_tags(self.user, [record['name'] for record in records])
+        for record in records:
+            self.tags[record['id']] = tags[record['name'][:50]].pk
+        return len(records)
+
+    def book(self, records):
+        authors = resolve_authors(self.user, [record['author'] or '' for record in records])
+        books = [
+            Book(
+                user=self.user,
+                title=record['title'],
+                author=authors.get(record['author'] or ''),
+                publication_year=record['publication_year'],
+                status=record['status'],
+                overall_rating=record['overall_rating'],
+                started_at=record['started_at'],
+                finished_at=record['finished_at'],
+                cover_image=self._restore_cover(record['cover_image']),
+            )
+            for record in records
+        ]
+        Book.objects.bulk_create(books)
+        self._keep_timestamps(books, records, 'created_at', 'updated_at')
+        self.books.update((record['id'], book.pk) for record, book in zip(records, books))
+        return len(books)
+
+    def book_tag(self, records):
+        return len(Book.tags.through.objects.bulk_create(
+            [Book.tags.through(book_id=self.books[r['book_id']], tag_id=self.tags[r['tag_id']]) for r in records],
+            ignore_conflicts=True,
+        ))
+
+    def note(self, records):
+        notes = [
+            Note(user=self.user, book_id=self.books[record['book_id']], **{
+                field: record[field] for field in ('note_type', 'title', 'body', 'page_start', 'page_end')
+            })
+            for record in records
+        ]
+        Note.objects.bulk_create(notes)
+        self._keep_timestamps(notes, records, 'created_at', 'updated_at')
+        return len(notes)
+
+    def quote(self, records):
+        quotes = [
+            Quote(user=self.user, book_id=self.books[record['book_id']], **{
+                field: record[field] for field in ('quote_text', 'page_number', 'my_comment')
+            })
+            for record in records
+        ]
+        Quote.objects.bulk_create(quotes)
+        self._keep_timestamps(quotes, records, 'created_at')
+        self.quotes.update((record['id'], quote.pk) for record, quote in zip(records, quotes))
+        return len(quotes)
+
+    def quote_tag(self, records):
+        return len(Quote.tags.through.objects.bulk_create(
+            [Quote.tags.through(quote_id=self.quotes[r['quote_id']], tag_id=self.tags[r['tag_id']]) for r in records],
+            ignore_conflicts=True,
+        ))
+
+    def file(self, records):
+        book_files, restored = [], []
+        for record in records:
+            blob = self._restore_blob(record)
+            if blob is None:
+                continue
+            restored.append(record)
+            book_files.append(BookFile(
+                book_id=self.books[record['book_id']],
+                blob=blob,
+                file=blob.file.name,
+                file_type=record['file_type'],
+                original_filename=record['original_filename'],
+                mime_type=record['mime_type'],
+            ))
+        BookFile.objects.bulk_create(book_files)
+        self._keep_timestamps(book_files, restored, 'uploaded_at')
+        for book_file in book_files:
+            if book_file.file_type in EXTRACTABLE_TYPES:
+                enqueue('books.extraction.extract_book_file', book_file_id=book_file.pk)
+        return len(book_files)
+
+    def missing_file(self, records):
+        """Files the export could not read; the records naming them were skipped above"""
+        return len(records)
+
+    def _keep_timestamps(self, objects, records, *fields):
+        """bulk_create stamps auto_now(_add) fields with the current time; put the exported ones back"""
+        if not objects:
+            return
+        for obj, record in zip(objects, records):
+            for field, value in _datetimes(record, *fields).items():
+                setattr(obj, field, value)
+        objects[0].__class__.objects.bulk_update(objects, fields)
+
+    def _restore_cover(self, path):
+        if not path or self.archive is None or path not in self.archive.NameToInfo:
+            return None
+        with self.archive.open(path) as source:
+            return default_storage.save(f'covers/{self.user.pk}/{posixpath.basename(path)}', File(source))
+
+    def _restore_blob(self, record):
+        """The blob with the file's content: already stored, or copied out of the archive"""
+        if record['sha256']:
+            blob = FileBlob.objects.filter(pk=record['sha256']).first()
+            if blob:
+                return blob
+        path = record['path']
+        if not path or self.archive is None or path not in self.archive.NameToInfo:
+            return None
+        ext = os.path.splitext(path)[1].lower()
+        with self.archive.open(path) as source:
+            name = default_storage.save(f'uploads/{self.user.pk}/{uuid.uuid4()}{ext}', File(source))
+        digest = file_sha256(default_storage, name)
+        if record['sha256'] and digest != record['sha256']:
+            default_storage.delete(name)
+            raise ValueError(f"{path} does not match its checksum")
+        return adopt_blob(name, digest, default_storage.size(name))
+
+    def run(self, records):
+        """Create everything in `records`, one transaction per chunk of one type"""
+        header = next(records, None)
+        if not header or header.get('type') != 'export' or header.get('version') != EXPORT_FORMAT_VERSION:
+            raise ValueError("Not a Mindfolio library export")
+
+        for kind, group in groupby(records, key=lambda record: record['type']):
+            if kind not in RECORD_TYPES:
+                raise ValueError(f"Unknown record type {kind!r}")
+            for chunk in chunked(group, EXPORT_CHUNK_SIZE):
+                self._flush(kind, getattr(self, kind), chunk)
+
+        # Books were created before their notes and quotes, which are part of the vector
+        for chunk in chunked(list(self.books.values()), EXPORT_CHUNK_SIZE):
+            refresh_search_vectors(chunk)
+        invalidate_library_stats(self.user.pk)
+        bump_library_version(self.user.pk)
+        return self.counts
+
+    def _flush(self, kind, handler, chunk):
+        with transaction.atomic():
+            created = handler(chunk)
+        self.counts[kind] = self.counts.get(kind, 0) + created
+
+
+def _read_lines(fh):
+    for line in fh:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def restore_library(user, path):
+    """
+    Restore a JSON Lines or zip export into the user's library and return
+    the number of records created per type. Files missing from the export
+    are only restored when their content is still stored on this server.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive, archive.open(MANIFEST_NAME) as manifest:
+            lines = (line.decode() for line in manifest)
+            return _Restore(user, archive).run(_read_lines(lines))
+    with open(path, encoding='utf-8') as fh:
+        return _Restore(user).run(_read_lines(fh))
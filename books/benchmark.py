@@ -0,0 +1,301 @@
+"""
+Synthetic libraries and a request-level benchmark of the read-heavy views.
+
+seed_library() fills one user's library with generated data shaped like a
+heavy reader's (skewed tag, author and quote distributions); run_benchmarks()
+requests every library/quotes/detail variant through the test client and
+records latency, query count and rows fetched, which compare_to_baseline()
+checks against a saved run. See the seed_benchmark and run_benchmark commands.
+"""
+import random
+import statistics
+import time
+from datetime import date
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.expressions import RawSQL
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.models import Tag
+from notes.models import Note
+from quotes.models import Quote
+from .authors import resolve_authors
+from .models import Book
+from .search import refresh_search_vectors
+
+SEED_BATCH_SIZE = 2000
+# Exponent of the Zipf-like weights: a few tags, authors and books get most of the use
+SKEW = 1.1
+BENCHMARK_ITERATIONS = 20
+# Relative growth of p50/p95/rows that counts as a regression
+REGRESSION_THRESHOLD = 0.25
+# Latency changes below this are noise, whatever the ratio
+LATENCY_NOISE_MS = 5
+
+WORDS = (
+    'time memory river light garden house silence city night stone winter war letters '
+    'journey mind order chaos machine empire mountain ocean fire shadow glass story truth '
+    'habit power language history music island dream forest signal road atlas theory '
+    'craft design spirit animal money question friendship kingdom border harvest code'
+).split()
+FIRST_NAMES = 'Ada Ursula Italo Octavia Jorge Toni Haruki Clarice Primo Wisława Chinua Elena Yuval Mary Isaac'.split()
+LAST_NAMES = 'Calvino Butler Borges Morrison Murakami Lispector Levi Szymborska Achebe Ferrante Harari Shelley Asimov'.split()
+STATUS_WEIGHTS = {'TO_READ': 40, 'READING': 10, 'FINISHED': 45, 'ABANDONED': 5}
+
+LIBRARY_SORTS = ['-updated_at', '-created_at', 'title', 'author__name', '-overall_rating', '-finished_at']
+QUOTE_SORTS = ['-created_at', 'created_at', 'book__title', 'page_number']
+
+
+class BenchmarkError(Exception):
+    """A benchmarked request did not answer 200"""
+
+
+def _skewed_weights(count):
+    return [1 / (rank + 1) ** SKEW for rank in range(count)]
+
+
+def _sentence(rng, low, high):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(low, high))).capitalize()
+
+
+def _spread_timestamps(queryset, *updated_fields, days=3 * 365):
+    """Random creation times over the past `days`, then update times after them, one UPDATE each"""
+    changes = {'created_at': RawSQL(f"now() - random() * interval '{int(days)} days'", [])}
+    queryset.update(**changes)
+    if updated_fields:
+        queryset.update(**{
+            field: RawSQL("created_at + random() * (now() - created_at)", []) for field in updated_fields
+        })
+
+
+def seed_library(username, books=10_000, quotes=100_000, notes=50_000, tags=500, seed=0, progress=None):
+    """
+    Create `username` (replacing any existing user of that name) with a
+    generated library. Rows are bulk-inserted SEED_BATCH_SIZE at a time.
+    Returns the user.
+    """
+    rng = random.Random(seed)
+    say = progress or (lambda message: None)
+
+    # Books first: Book.author is PROTECT, which blocks deleting the user with them
+    Book.objects.filter(user__username=username).delete()
+    User.objects.filter(username=username).delete()
+    user = User.objects.create_user(username, password=username)
+
+    with transaction.atomic():
+        tag_objects = Tag.objects.bulk_create(
+            [Tag(user=user, name=f'{WORDS[i % len(WORDS)]}-{i}') for i in range(tags)],
+        )
+        tag_weights = _skewed_weights(len(tag_objects))
+        say(f"{len(tag_objects)} tags")
+
+        names = [
+            f'{rng.choice(FIRST_NAMES)} {rng.choice("ABCDEFGHIJKLMNOPRSTW")}. {rng.choice(LAST_NAMES)}'
+            for _ in range(max(books // 4, 1))
+        ]
+        authors = list(resolve_authors(user, names).values())
+        author_weights = _skewed_weights(len(authors))
+
+        book_objects = []
+        for _ in range(books):
+            status = rng.choices(list(STATUS_WEIGHTS), weights=list(STATUS_WEIGHTS.values()))[0]
+            finished = status == 'FINISHED'
+            book_objects.append(Book(
+                user=user,
+                title=_sentence(rng, 1, 5),
+                author=rng.choices(authors, weights=author_weights)[0],
+                publication_year=rng.randint(1850, 2025),
+                status=status,
+                overall_rating=rng.randint(1, 10) / 2 if finished and rng.random() < 0.8 else None,
+                finished_at=date(rng.randint(2015, 2025), rng.randint(1, 12), rng.randint(1, 28)) if finished else None,
+            ))
+        Book.objects.bulk_create(book_objects, batch_size=SEED_BATCH_SIZE)
+        _spread_timestamps(Book.objects.filter(user=user), 'updated_at')
+        say(f"{books} books")
+
+        Through = Book.tags.through
+        links = {
+            (book.pk, tag.pk)
+            for book in book_objects
+            for tag in rng.choices(tag_objects, weights=tag_weights, k=rng.randint(0, 5))
+        } if tag_objects else set()
+        Through.objects.bulk_create(
+            [Through(book_id=book_id, tag_id=tag_id) for book_id, tag_id in links], batch_size=SEED_BATCH_SIZE,
+        )
+
+        # Quotes and notes cluster on a minority of books, as with real reading
+        book_weights = _skewed_weights(len(book_objects))
+        shuffled = rng.sample(book_objects, len(book_objects))
+        quote_objects = Quote.objects.bulk_create(
+            [
+                Quote(user=user, book=book, quote_text=_sentence(rng, 8, 40), page_number=rng.randint(1, 600),
+                      my_comment=_sentence(rng, 3, 15) if rng.random() < 0.3 else '')
+                for book in rng.choices(shuffled, weights=book_weights, k=quotes)
+            ] if shuffled else [],
+            batch_size=SEED_BATCH_SIZE,
+        )
+        _spread_timestamps(Quote.objects.filter(user=user))
+        Through = Quote.tags.through
+        links = {
+            (quote.pk, tag.pk)
+            for quote in quote_objects
+            for tag in rng.choices(tag_objects, weights=tag_weights, k=rng.randint(0, 2))
+        } if tag_objects else set()
+        Through.objects.bulk_create(
+            [Through(quote_id=quote_id, tag_id=tag_id) for quote_id, tag_id in links], batch_size=SEED_BATCH_SIZE,
+        )
+        say(f"{quotes} quotes")
+
+        Note.objects.bulk_create(
+            [
+                Note(user=user, book=book, note_type=rng.choice(['GENERAL', 'SUMMARY', 'REFLECTION']),
+                     title=_sentence(rng, 1, 4), body=_sentence(rng, 30, 150),
+                     page_start=rng.randint(1, 300))
+                for book in rng.choices(shuffled, weights=book_weights, k=notes)
+            ] if shuffled else [],
+            batch_size=SEED_BATCH_SIZE,
+        )
+        _spread_timestamps(Note.objects.filter(user=user), 'updated_at')
+        say(f"{notes} notes")
+
+        # bulk_create skips the signals that keep these up to date
+        refresh_search_vectors(Book.objects.filter(user=user))
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return user
+
+
+def _url(name, *args, **params):
+    query = urlencode({key: value for key, value in params.items() if value not in ('', None)})
+    return reverse(name, args=args) + (f'?{query}' if query else '')
+
+
+def benchmark_scenarios(client, user):
+    """
+    (name, url, htmx) for each request of the benchmark: every library sort
+    and filter with and without a search, the quotes page, the busiest book's
+    detail page and the HTMX partials behind infinite scroll and the tabs.
+    """
+    top_tag = Tag.objects.filter(user=user).annotate(uses=Count('books')).order_by('-uses', 'pk').first()
+    top_book = Book.objects.filter(user=user).annotate(uses=Count('quotes')).order_by('-uses', 'pk').first()
+    word = WORDS[0]
+    filters = {'none': {}, 'status': {'status': 'FINISHED'}, 'rating': {'rating': '4'}}
+    if top_tag:
+        filters['tag'] = {'tag': top_tag.pk}
+
+    scenarios = []
+    for filter_name, params in filters.items():
+        for query in ('', word):
+            sorts = LIBRARY_SORTS + (['relevance'] if query else [])
+            for sort in sorts:
+                name = f'library sort={sort} filter={filter_name}' + (' q' if query else '')
+                scenarios.append((name, _url('library', sort=sort, q=query, **params), False))
+    scenarios.append(('library partial', _url('library', sort='-updated_at'), True))
+    scenarios.append(('library suggest', _url('library_suggest', q=word[:3]), True))
+
+    for query in ('', word):
+        sorts = QUOTE_SORTS + (['relevance'] if query else [])
+        for sort in sorts:
+            scenarios.append((f'quotes sort={sort}' + (' q' if query else ''), _url('quotes_list', sort=sort, q=query), False))
+    if top_tag:
+        scenarios.append(('quotes filter=tag', _url('quotes_list', tag=top_tag.pk), False))
+
+    if top_book:
+        scenarios.append(('quotes filter=book', _url('quotes_list', book=top_book.pk), False))
+        scenarios.append(('book detail', _url('book_detail', top_book.pk), False))
+        for tab in ('notes', 'quotes', 'files'):
+            scenarios.append((f'book tab={tab}', _url('book_tab', top_book.pk, tab), True))
+
+    # Second pages, through the cursor the first page hands out
+    for name, url, context_key in (
+        ('library page 2', _url('library'), 'page'),
+        ('quotes page 2', _url('quotes_list'), 'page'),
+    ):
+        page = client.get(url).context[context_key]
+        if page.has_next:
+            separator = '&' if '?' in url else '?'
+            scenarios.append((name, f'{url}{separator}cursor={page.next_cursor}', True))
+    return scenarios
+
+
+class _RowCounter:
+    """execute_wrapper counting the rows each query returned"""
+
+    def __init__(self):
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        if sql.lstrip().upper().startswith('SELECT') and context['cursor'].rowcount > 0:
+            self.rows += context['cursor'].rowcount
+        return result
+
+
+def _get(client, url, htmx):
+    response = client.get(url, headers={'HX-Request': 'true'} if htmx else {})
+    if response.status_code != 200:
+        raise BenchmarkError(f"GET {url} answered {response.status_code}")
+    return response
+
+
+def measure(client, url, htmx=False, iterations=BENCHMARK_ITERATIONS):
+    """
+    p50/p95 latency over `iterations` requests after a warm-up one, plus the
+    query count and rows fetched of one instrumented request
+    """
+    _get(client, url, htmx)
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        _get(client, url, htmx)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    counter = _RowCounter()
+    with CaptureQueriesContext(connection) as queries, connection.execute_wrapper(counter):
+        _get(client, url, htmx)
+
+    p95 = statistics.quantiles(timings, n=20, method='inclusive')[18] if len(timings) > 1 else timings[0]
+    return {
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(p95, 2),
+        'queries': len(queries),
+        'rows': counter.rows,
+    }
+
+
+def run_benchmarks(user, iterations=BENCHMARK_ITERATIONS, only='', progress=None):
+    """Measure every scenario as `user`; returns {scenario name: measure() result}"""
+    client = Client()
+    client.force_login(user)
+    results = {}
+    for name, url, htmx in benchmark_scenarios(client, user):
+        if only not in name:
+            continue
+        results[name] = measure(client, url, htmx, iterations)
+        if progress:
+            progress(name, results[name])
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Human-readable regressions of `results` against a baseline of the same
+    shape: any extra query, or p50/p95/rows grown past `threshold`
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['queries'] > before['queries']:
+            regressions.append(f"{name}: {before['queries']} -> {result['queries']} queries")
+        for metric in ('p50_ms', 'p95_ms', 'rows'):
+            grown = result[metric] > before[metric] * (1 + threshold)
+            if grown and (metric == 'rows' or result[metric] - before[metric] > LATENCY_NOISE_MS):
+                regressions.append(f"{name}: {metric} {before[metric]} -> {result[metric]}")
+    return regressions
@@ -0,0 +1,131 @@
+import hashlib
+import os
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+
+from .models import FileBlob
+
+READ_SIZE = 64 * 1024
+
+
+class _HashingMixin:
+    """Hash uploaded bytes as they arrive, so storing them needs no second read"""
+
+    def new_file(self, *args, **kwargs):
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(_HashingMixin, MemoryFileUploadHandler):
+    def receive_data_chunk(self, raw_data, start):
+        if self.activated:
+            self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+
+class HashingTemporaryFileUploadHandler(_HashingMixin, TemporaryFileUploadHandler):
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+
+def content_sha256(content):
+    """SHA-256 of a File, using the digest computed during upload when there is one"""
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks(READ_SIZE):
+        hasher.update(chunk)
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+def _existing_blob(digest):
+    # The row lock keeps release_blob() from deleting the blob before the
+    # caller's BookFile referencing it is committed.
+    return FileBlob.objects.select_for_update().filter(pk=digest).first()
+
+
+def store_blob(content):
+    """Return the blob holding `content`, writing it to storage only if it is new"""
+    digest = content_sha256(content)
+    blob = _existing_blob(digest)
+    if blob:
+        return blob
+
+    blob = FileBlob(sha256=digest, size=content.size)
+    blob.file.save(os.path.basename(content.name or digest), content, save=False)
+    try:
+        with transaction.atomic():
+            blob.save(force_insert=True)
+    except IntegrityError:
+        # The same content was stored concurrently; keep that copy
+        blob.file.storage.delete(blob.file.name)
+        blob = _existing_blob(digest)
+    return blob
+
+
+def blob_name(blob, filename):
+    return FileBlob._meta.get_field('file').generate_filename(blob, os.path.basename(filename))
+
+
+def adopt_blob(name, digest, size):
+    """
+    Turn a file already written to storage (e.g. by a chunked upload) into
+    the blob for `digest`, or delete it when that content is stored already.
+    """
+    storage = FileBlob._meta.get_field('file').storage
+    blob = _existing_blob(digest)
+    if blob:
+        storage.delete(name)
+        return blob
+
+    blob = FileBlob(sha256=digest, size=size)
+    target = storage.get_available_name(blob_name(blob, name))
+    os.makedirs(os.path.dirname(storage.path(target)), exist_ok=True)
+    os.replace(storage.path(name), storage.path(target))
+    blob.file.name = target
+    try:
+        with transaction.atomic():
+            blob.save(force_insert=True)
+    except IntegrityError:
+        storage.delete(target)
+        blob = _existing_blob(digest)
+    return blob
+
+
+def release_blobs(digests):
+    """
+    Delete those of the blobs that no BookFile references anymore, and their
+    files once the transaction commits. Returns the digests released.
+    """
+    with transaction.atomic():
+        locked = dict(FileBlob.objects.select_for_update().filter(pk__in=list(digests)).values_list('pk', 'file'))
+        in_use = set(
+            FileBlob.objects.filter(pk__in=list(locked), book_files__isnull=False).values_list('pk', flat=True)
+        )
+        released = {digest: name for digest, name in locked.items() if digest not in in_use}
+        if released:
+            FileBlob.objects.filter(pk__in=list(released)).delete()
+            storage = FileBlob._meta.get_field('file').storage
+
+            def delete_files():
+                for name in released.values():
+                    storage.delete(name)
+
+            transaction.on_commit(delete_files)
+    return list(released)
+
+
+def release_blob(digest):
+    """Delete a blob and its file once no BookFile references it anymore"""
+    return bool(release_blobs([digest]))
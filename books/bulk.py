@@ -0,0 +1,95 @@
+from django.db import transaction
+from django.db.models.functions import Now
+
+from core.conditional import bump_library_version
+from notes.models import Note
+from quotes.models import Quote
+from .blobs import release_blobs
+from .fragments import bump_card_versions
+from .models import Book, BookFile, BookFileText, UploadSession
+from .stats import invalidate_library_stats
+
+# Upper bound on the books one request may change
+BULK_ACTION_LIMIT = 1000
+
+
+def _owned(user, book_ids):
+    # Every statement filters on the owner, so foreign ids simply match nothing
+    return Book.objects.filter(user=user, pk__in=book_ids)
+
+
+def _changed(user, book_ids):
+    """
+    Queryset updates, raw deletes and through-table writes send no signals,
+    so the caches those signals keep fresh are invalidated here, once for
+    the whole batch
+    """
+    bump_card_versions(book_ids)
+    invalidate_library_stats(user.pk)
+    bump_library_version(user.pk)
+
+
+def set_status(user, book_ids, status):
+    """
+    Move the books to `status` in one UPDATE and return how many changed.
+    Dates that do not apply to the new status are cleared, as the book form does.
+    """
+    changes = {'status': status, 'updated_at': Now()}
+    if status != 'FINISHED':
+        changes['finished_at'] = None
+    if status == 'TO_READ':
+        changes['started_at'] = None
+    with transaction.atomic():
+        updated = _owned(user, book_ids).update(**changes)
+        _changed(user, book_ids)
+    return updated
+
+
+def add_tags(user, book_ids, tags):
+    """Tag the books with each of `tags` (the user's own) in one INSERT; returns how many books matched"""
+    Through = Book.tags.through
+    with transaction.atomic():
+        owned = list(_owned(user, book_ids).values_list('pk', flat=True))
+        Through.objects.bulk_create(
+            [Through(book_id=book_id, tag_id=tag.pk) for book_id in owned for tag in tags if tag.user_id == user.pk],
+            ignore_conflicts=True,
+        )
+        _changed(user, owned)
+    return len(owned)
+
+
+def remove_tags(user, book_ids, tags):
+    """Remove `tags` from the books in one DELETE; returns how many books matched"""
+    with transaction.atomic():
+        owned = list(_owned(user, book_ids).values_list('pk', flat=True))
+        Book.tags.through.objects.filter(book_id__in=owned, tag_id__in=[tag.pk for tag in tags]).delete()
+        _changed(user, owned)
+    return len(owned)
+
+
+def delete_books(user, book_ids):
+    """
+    Delete the books and everything attached to them with one DELETE per
+    table, children first, and return how many went. Nothing is loaded into
+    memory and no delete signals are sent: blobs only these books used are
+    released in one pass, and _changed() does the cache invalidation.
+    """
+    with transaction.atomic():
+        # Locked so no note, quote or file can be added to them meanwhile
+        owned = list(_owned(user, book_ids).select_for_update().values_list('pk', flat=True))
+        files = BookFile.objects.filter(book_id__in=owned)
+        blob_ids = set(files.exclude(blob=None).values_list('blob_id', flat=True))
+        for queryset in (
+            Quote.tags.through.objects.filter(quote__book_id__in=owned),
+            Quote.objects.filter(book_id__in=owned),
+            Note.objects.filter(book_id__in=owned),
+            BookFileText.objects.filter(book_file__book_id__in=owned),
+            files,
+            UploadSession.objects.filter(book_id__in=owned),
+            Book.tags.through.objects.filter(book_id__in=owned),
+            Book.objects.filter(pk__in=owned),
+        ):
+            queryset._raw_delete(queryset.db)
+        release_blobs(blob_ids)
+        _changed(user, ())
+    return len(owned)
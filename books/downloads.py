@@ -0,0 +1,134 @@
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+# Uploads the browser may render inline. Anything else (HTML, SVG, XML, ...)
+# could run script under the app's origin, so it is only ever downloaded.
+INLINE_CONTENT_TYPES = frozenset({
+    'application/pdf',
+    'image/png', 'image/jpeg', 'image/gif', 'image/webp',
+    'audio/mpeg', 'audio/mp4', 'audio/ogg',
+    'video/mp4', 'video/webm',
+    'text/plain',
+})
+
+
+def _file_etag(size, modified):
+    return quote_etag(f'{size:x}-{int(modified.timestamp()):x}')
+
+
+def _parse_range(header, size):
+    """
+    (start, end) of a single `bytes=` range, inclusive, or None when the
+    header should be ignored. Raises ValueError for unsatisfiable ranges.
+
+    Multi-range requests are answered with the full file, which RFC 9110
+    allows and which saves building multipart/byteranges bodies.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def _if_range_matches(request, etag, modified):
+    """An If-Range precondition that no longer holds means "send everything" """
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        # Weak validators never match If-Range
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(modified.timestamp())
+
+
+def _stream(fh, start, length):
+    with fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _offload_response(field_file, content_type):
+    """Hand the transfer over to the front-end web server"""
+    response = HttpResponse(content_type=content_type)
+    if settings.FILE_DOWNLOAD_OFFLOAD == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.FILE_DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/' + field_file.name
+    else:
+        response['X-Sendfile'] = field_file.path
+    return response
+
+
+def _file_response(request, field_file, content_type, size, etag, modified):
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and _if_range_matches(request, etag, modified):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        return FileResponse(field_file.open('rb'), content_type=content_type)
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(_stream(field_file.open('rb'), start, length), status=206, content_type=content_type)
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def serve_file(request, field_file, *, content_type, filename, as_attachment=True, etag=None):
+    """
+    Serve a stored file with Range (206), conditional GET (304) and optional
+    X-Accel-Redirect/X-Sendfile support. Access checks are the caller's job.
+
+    `etag` defaults to one derived from the file's size and modification
+    time; pass the content hash when it is known. Raises FileNotFoundError
+    when the file is missing from storage.
+    """
+    storage = field_file.storage
+    size = storage.size(field_file.name)
+    modified = storage.get_modified_time(field_file.name)
+    etag = quote_etag(etag) if etag else _file_etag(size, modified)
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(modified.timestamp()))
+    if response is None:
+        if settings.FILE_DOWNLOAD_OFFLOAD:
+            # The web server answers Range and conditional requests itself
+            response = _offload_response(field_file, content_type)
+        else:
+            response = _file_response(request, field_file, content_type, size, etag, modified)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified.timestamp())
+    response['Accept-Ranges'] = 'bytes'
+    if response.status_code in (200, 206):
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
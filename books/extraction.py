@@ -0,0 +1,117 @@
+import posixpath
+import re
+import zipfile
+from html import unescape
+from urllib.parse import unquote
+from xml.etree import ElementTree
+
+from django.utils.html import strip_tags
+from PyPDF2 import PdfReader
+
+from .models import BookFile, BookFileText
+
+EXTRACTABLE_TYPES = ('SOURCE_PDF', 'SOURCE_EPUB')
+# Keeps the generated tsvector well inside PostgreSQL's 1 MB limit
+MAX_TEXT_LENGTH = 1_000_000
+# EPUB chapters larger than this are skipped rather than inflated in memory
+MAX_EPUB_ENTRY_SIZE = 20 * 1024 * 1024
+
+EPUB_NS = {
+    'container': 'urn:oasis:names:tc:opendocument:xmlns:container',
+    'opf': 'http://www.idpf.org/2007/opf',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+}
+NON_TEXT_ELEMENTS = re.compile(r'<(head|script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+
+
+def _join_limited(parts):
+    """Join text parts, stopping once MAX_TEXT_LENGTH is reached"""
+    collected, length = [], 0
+    for part in parts:
+        part = part.strip()
+        if not part:
+            continue
+        collected.append(part)
+        length += len(part)
+        if length >= MAX_TEXT_LENGTH:
+            break
+    # PostgreSQL text columns cannot hold NUL characters
+    return '\n\n'.join(collected)[:MAX_TEXT_LENGTH].replace('\x00', '')
+
+
+def extract_pdf(fh):
+    """(page_count, title, author, text) of a PDF"""
+    reader = PdfReader(fh)
+    metadata = reader.metadata
+    title = (metadata.title or '') if metadata else ''
+    author = (metadata.author or '') if metadata else ''
+    text = _join_limited(page.extract_text() or '' for page in reader.pages)
+    return len(reader.pages), title, author, text
+
+
+def _html_text(html):
+    return re.sub(r'\s+', ' ', unescape(strip_tags(NON_TEXT_ELEMENTS.sub(' ', html))))
+
+
+def _epub_chapters(archive, opf_path, opf):
+    base = posixpath.dirname(opf_path)
+    manifest = {
+        item.get('id'): item.get('href')
+        for item in opf.iterfind('opf:manifest/opf:item', EPUB_NS)
+    }
+    for itemref in opf.iterfind('opf:spine/opf:itemref', EPUB_NS):
+        href = manifest.get(itemref.get('idref'))
+        if not href:
+            continue
+        name = posixpath.normpath(posixpath.join(base, unquote(href)))
+        try:
+            info = archive.getinfo(name)
+        except KeyError:
+            continue
+        if info.file_size <= MAX_EPUB_ENTRY_SIZE:
+            yield _html_text(archive.read(info).decode('utf-8', 'replace'))
+
+
+def extract_epub(fh):
+    """(page_count, title, author, text) of an EPUB; EPUBs have no fixed pages"""
+    with zipfile.ZipFile(fh) as archive:
+        container = ElementTree.fromstring(archive.read('META-INF/container.xml'))
+        opf_path = container.find('.//container:rootfile', EPUB_NS).get('full-path')
+        opf = ElementTree.fromstring(archive.read(opf_path))
+        title = opf.findtext('opf:metadata/dc:title', '', EPUB_NS).strip()
+        author = opf.findtext('opf:metadata/dc:creator', '', EPUB_NS).strip()
+        text = _join_limited(_epub_chapters(archive, opf_path, opf))
+    return None, title, author, text
+
+
+EXTRACTORS = {
+    'SOURCE_PDF': extract_pdf,
+    'SOURCE_EPUB': extract_epub,
+}
+
+
+def extract_book_file(book_file_id):
+    """Background job: store the text and metadata of a source PDF/EPUB"""
+    book_file = BookFile.objects.filter(pk=book_file_id, file_type__in=EXTRACTABLE_TYPES).first()
+    if book_file is None:
+        # Deleted (or retyped) before the job ran
+        return
+
+    if book_file.blob_id:
+        # Identical content was extracted for another book already
+        done = (
+            BookFileText.objects.filter(book_file__blob=book_file.blob_id)
+            .exclude(book_file=book_file)
+            .values('page_count', 'title', 'author', 'text')
+            .first()
+        )
+        if done:
+            BookFileText.objects.update_or_create(book_file=book_file, defaults=done)
+            return
+
+    with book_file.file.open('rb') as fh:
+        page_count, title, author, text = EXTRACTORS[book_file.file_type](fh)
+    BookFileText.objects.update_or_create(
+        book_file=book_file,
+        defaults={'page_count': page_count, 'title': title[:500], 'author': author[:300], 'text': text},
+    )
@@ -1,5 +1,10 @@
+import io
+
 from django import forms
-from .models import Book, BookFile
+from .authors import resolve_author
+from .bulk import BULK_ACTION_LIMIT
+from .importer import ImportFormatError, read_export
+from .models import Book, BookFile, normalize_author_name
 from notes.models import Note
 from quotes.models import Quote
 from core.models import Tag
@@ -61,14 +66,9 @@ class BookForm(forms.ModelForm):
     def _get_author_instance(self, name):
         if not self.user or not name:
             return None
-        from .models import Author
-        normalized = name.strip()
-        if not normalized:
-            return None
-        author = Author.objects.filter(user=self.user, name__iexact=normalized).first()
-        if not author:
-            author = Author.objects.create(user=self.user, name=normalized)
-        return author
+        if self.instance.author_id and normalize_author_name(self.instance.author.name) == normalize_author_name(name):
+            return self.instance.author
+        return resolve_author(self.user, name)
 
     def save(self, commit=True):
         author_name = self.cleaned_data.get('author_name', '').strip()
@@ -138,3 +138,69 @@ class QuoteForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         if user:
             self.fields['tags'].queryset = Tag.objects.filter(user=user)
+
+
+class LibraryImportForm(forms.Form):
+    """Upload of a Goodreads or StoryGraph CSV export"""
+    export = forms.FileField(
+        label='CSV export',
+        widget=forms.FileInput(attrs={'class': 'input', 'accept': '.csv,text/csv'}),
+    )
+
+    def clean_export(self):
+        export = self.cleaned_data['export']
+        # Check the header now rather than failing later in the background job
+        text = io.TextIOWrapper(export, encoding='utf-8-sig', newline='')
+        try:
+            next(read_export(text), None)
+        except ImportFormatError as exc:
+            raise forms.ValidationError(str(exc))
+        except UnicodeDecodeError:
+            raise forms.ValidationError("The file is not UTF-8 text")
+        finally:
+            text.detach()
+            export.seek(0)
+        return export
+
+
+class BookIdsField(forms.Field):
+    """Repeated `book` values from the library grid's checkboxes, as ints"""
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        try:
+            ids = {int(pk) for pk in value or ()}
+        except (TypeError, ValueError):
+            raise forms.ValidationError("Invalid book selection.")
+        if len(ids) > BULK_ACTION_LIMIT:
+            raise forms.ValidationError(f"Select at most {BULK_ACTION_LIMIT} books at a time.")
+        return sorted(ids)
+
+
+class BulkBookActionForm(forms.Form):
+    """An action applied to the books selected in the library grid"""
+    ACTION_CHOICES = [
+        ('status', 'Set status'),
+        ('add_tags', 'Add tags'),
+        ('remove_tags', 'Remove tags'),
+        ('delete', 'Delete'),
+    ]
+
+    action = forms.ChoiceField(choices=ACTION_CHOICES)
+    book = BookIdsField()
+    status = forms.ChoiceField(choices=Book.STATUS_CHOICES, required=False)
+    tags = forms.ModelMultipleChoiceField(queryset=Tag.objects.none(), required=False)
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if user:
+            self.fields['tags'].queryset = Tag.objects.filter(user=user)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get('action')
+        if action == 'status' and not cleaned_data.get('status'):
+            self.add_error('status', "Choose a status.")
+        if action in ('add_tags', 'remove_tags') and not cleaned_data.get('tags'):
+            self.add_error('tags', "Choose at least one tag.")
+        return cleaned_data
@@ -0,0 +1,52 @@
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+
+# Rendered book cards live in their own cache alias (see settings.CACHES) so
+# they can be evicted without touching library stats and other small values
+FRAGMENT_CACHE = 'fragments'
+FRAGMENT_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def _version_key(book_id):
+    return f'book-card-version:{book_id}'
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def attach_card_versions(books):
+    """
+    Set `card_version` on each book, the cache key part that changes
+    whenever something shown on the card but not on the book row itself
+    (counts, tags, author, cover renditions) changes.
+
+    Versions are fresh timestamps rather than counters, so a version that
+    was evicted is replaced by one no cached card can have been stored under.
+    """
+    books = list(books)
+    fragments = caches[FRAGMENT_CACHE]
+    keys = {_version_key(book.pk): book for book in books}
+    versions = fragments.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        fragments.set_many(missing, FRAGMENT_TIMEOUT)
+        versions.update(missing)
+    for key, book in keys.items():
+        book.card_version = versions[key]
+    return books
+
+
+def bump_card_versions(book_ids):
+    """Invalidate the cached cards of these books once the transaction commits"""
+    book_ids = {book_id for book_id in book_ids if book_id}
+    if not book_ids:
+        return
+
+    def bump():
+        version = _new_version()
+        caches[FRAGMENT_CACHE].set_many({_version_key(book_id): version for book_id in book_ids}, FRAGMENT_TIMEOUT)
+
+    transaction.on_commit(bump)
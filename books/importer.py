@@ -0,0 +1,217 @@
+import csv
+import io
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from core.conditional import bump_library_version
+from core.models import Tag
+from .authors import resolve_authors
+from .models import Book
+from .search import refresh_search_vectors
+from .stats import invalidate_library_stats
+
+IMPORT_CHUNK_SIZE = 500
+
+# Shelf / read status of each export format -> Book.status
+STATUSES = {
+    'read': 'FINISHED',
+    'currently-reading': 'READING',
+    'to-read': 'TO_READ',
+    'did-not-finish': 'ABANDONED',
+}
+# Goodreads shelves that are statuses rather than tags
+STATUS_SHELVES = set(STATUSES) | {'paused'}
+DATE_FORMATS = ('%Y/%m/%d', '%Y-%m-%d', '%m/%d/%Y')
+
+
+class ImportFormatError(ValueError):
+    """The CSV is not a Goodreads or StoryGraph export"""
+
+
+def _parse_date(value):
+    value = (value or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_year(value):
+    value = (value or '').strip()
+    return int(value) if value.isdigit() and 0 < int(value) <= date.today().year + 1 else None
+
+
+def _parse_rating(value):
+    try:
+        rating = Decimal((value or '').strip())
+    except InvalidOperation:
+        return None
+    # Goodreads writes 0 for unrated books; round to the form's half stars
+    rating = (rating * 2).to_integral_value() / 2
+    return rating if Decimal('0.5') <= rating <= 5 else None
+
+
+def _split(value):
+    return [part.strip() for part in (value or '').split(',') if part.strip()]
+
+
+def _goodreads_row(row):
+    shelf = (row.get('Exclusive Shelf') or '').strip()
+    return {
+        'title': row['Title'],
+        'author': row.get('Author', ''),
+        'status': STATUSES.get(shelf, 'TO_READ'),
+        'overall_rating': _parse_rating(row.get('My Rating')),
+        'publication_year': _parse_year(row.get('Original Publication Year') or row.get('Year Published')),
+        'finished_at': _parse_date(row.get('Date Read')),
+        'tags': [shelf for shelf in _split(row.get('Bookshelves')) if shelf not in STATUS_SHELVES],
+    }
+
+
+def _storygraph_row(row):
+    authors = _split(row.get('Authors'))
+    return {
+        'title': row['Title'],
+        'author': authors[0] if authors else '',
+        'status': STATUSES.get((row.get('Read Status') or '').strip(), 'TO_READ'),
+        'overall_rating': _parse_rating(row.get('Star Rating')),
+        'publication_year': None,
+        'finished_at': _parse_date(row.get('Last Date Read')),
+        'tags': _split(row.get('Tags')),
+    }
+
+
+def read_export(fh):
+    """
+    Yield one normalized dict per book of a Goodreads or StoryGraph CSV
+    export, read from the text stream `fh` row by row.
+    """
+    reader = csv.DictReader(fh)
+    headers = set(reader.fieldnames or ())
+    if {'Title', 'Exclusive Shelf'} <= headers:
+        parse = _goodreads_row
+    elif {'Title', 'Read Status'} <= headers:
+        parse = _storygraph_row
+    else:
+        raise ImportFormatError("Expected a Goodreads or StoryGraph CSV export")
+
+    for row in reader:
+        book = parse(row)
+        book['title'] = ' '.join(book['title'].split())[:500]
+        if book['title']:
+            if book['status'] != 'FINISHED':
+                book['finished_at'] = None
+            yield book
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def resolve_tags(user, names):
+    """name -> Tag for `names`, creating missing ones in one upsert"""
+    names = {name[:50] for name in names}
+    if not names:
+        return {}
+    tags = Tag.objects.bulk_create(
+        [Tag(user=user, name=name) for name in names],
+        update_conflicts=True,
+        unique_fields=['user', 'name'],
+        update_fields=['name'],
+    )
+    return {tag.name: tag for tag in tags}
+
+
+def _import_chunk(user, rows):
+    """Create the books of one chunk, skipping ones already in the library; returns their count"""
+    authors = resolve_authors(user, [row['author'] for row in rows])
+    tags = resolve_tags(user, [name for row in rows for name in row['tags']])
+
+    existing = set(
+        Book.objects.filter(user=user, title__in={row['title'] for row in rows})
+        .values_list('title', 'author_id')
+    )
+    books, book_tags = [], []
+    for row in rows:
+        author = authors.get(row['author'])
+        key = (row['title'], author.pk if author else None)
+        if key in existing:
+            continue
+        existing.add(key)
+        books.append(Book(
+            user=user,
+            title=row['title'],
+            author=author,
+            status=row['status'],
+            overall_rating=row['overall_rating'],
+            publication_year=row['publication_year'],
+            finished_at=row['finished_at'],
+        ))
+        book_tags.append(row['tags'])
+
+    Book.objects.bulk_create(books)
+    Book.tags.through.objects.bulk_create(
+        [
+            Book.tags.through(book_id=book.pk, tag_id=tags[name[:50]].pk)
+            for book, names in zip(books, book_tags)
+            for name in set(names)
+        ],
+        ignore_conflicts=True,
+    )
+    # bulk_create skips the save signals that keep these up to date
+    refresh_search_vectors([book.pk for book in books])
+    return len(books)
+
+
+def import_library(user, fh, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    Import a Goodreads/StoryGraph export from the text stream `fh` into the
+    user's library. Rows are handled `chunk_size` at a time, each chunk in
+    its own transaction with a fixed number of queries, so memory and time
+    per row stay flat however large the file is. `progress` is called with
+    the running totals after every chunk.
+
+    Returns {'rows', 'created', 'skipped', 'seconds'}.
+    """
+    started = time.monotonic()
+    totals = {'rows': 0, 'created': 0, 'skipped': 0}
+    try:
+        for chunk in chunked(read_export(fh), chunk_size):
+            with transaction.atomic():
+                created = _import_chunk(user, chunk)
+            totals['rows'] += len(chunk)
+            totals['created'] += created
+            totals['skipped'] += len(chunk) - created
+            if progress:
+                progress(dict(totals, seconds=time.monotonic() - started))
+    finally:
+        if totals['created']:
+            invalidate_library_stats(user.pk)
+            bump_library_version(user.pk)
+    return dict(totals, seconds=time.monotonic() - started)
+
+
+def import_library_file(user_id, name):
+    """
+    Background job: import an uploaded export from storage, then delete it.
+    A failed run keeps the file; the retry skips the chunks already imported.
+    """
+    user = User.objects.get(pk=user_id)
+    with default_storage.open(name, 'rb') as fh:
+        # utf-8-sig drops the byte order mark some spreadsheet tools add
+        import_library(user, io.TextIOWrapper(fh, encoding='utf-8-sig', newline=''))
+    default_storage.delete(name)
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from books.models import UploadSession
+from books.uploads import discard_upload
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads that were abandoned before being finalized"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24,
+                            help="Discard uploads without a new chunk for this many hours (default: 24)")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = UploadSession.objects.filter(updated_at__lt=cutoff)
+        count = 0
+        for session in stale.iterator():
+            discard_upload(session)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Discarded {count} stale uploads."))
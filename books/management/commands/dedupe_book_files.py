@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from books.blobs import store_blob
+from books.models import BookFile
+
+
+class Command(BaseCommand):
+    help = (
+        "Move book files uploaded before content-addressed storage into the "
+        "blob store, keeping one copy of each distinct file"
+    )
+
+    def handle(self, *args, **options):
+        legacy = BookFile.objects.filter(blob__isnull=True).exclude(file='').order_by('pk')
+        moved = missing = 0
+        for book_file in legacy.iterator():
+            storage = book_file.file.storage
+            old_name = book_file.file.name
+            if not storage.exists(old_name):
+                missing += 1
+                self.stderr.write(f"BookFile {book_file.pk}: {old_name} is missing from storage")
+                continue
+            with transaction.atomic():
+                with book_file.file.open('rb') as content:
+                    blob = store_blob(content)
+                BookFile.objects.filter(pk=book_file.pk).update(blob=blob, file=blob.file.name)
+            if blob.file.name != old_name:
+                storage.delete(old_name)
+            moved += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} files into the blob store ({missing} missing)."))
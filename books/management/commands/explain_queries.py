@@ -0,0 +1,105 @@
+import argparse
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from books.models import Book
+from books.search import books_matching_title_or_author
+from books.views import BOOKS_PER_PAGE
+from core.pagination import KeysetPaginator
+from core.search import build_search_query, search_rank
+from notes.models import Note
+from quotes.models import Quote
+from quotes.views import QUOTES_PER_PAGE
+
+LIBRARY_SORTS = ['-updated_at', '-created_at', 'title', 'author__name', '-overall_rating', '-finished_at']
+QUOTE_SORTS = ['-created_at', 'created_at', 'book__title', 'page_number']
+SCAN_PATTERN = re.compile(r'((?:Parallel )?(?:Index Only Scan|Index Scan|Bitmap Index Scan|Seq Scan)(?: Backward)?) (?:using|on) (\S+)')
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN ANALYZE on the canonical library, quotes and book detail "
+        "queries for one user, to confirm the expected indexes are used. "
+        "Run it against realistic data: on tiny tables PostgreSQL prefers "
+        "sequential scans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--search', default='', help="Also explain full-text searches for this text")
+        parser.add_argument('--depth', type=int, default=1000,
+                            help="Row position used to build a deep-page cursor (default: 1000)")
+        parser.add_argument('--analyze', action=argparse.BooleanOptionalAction, default=True,
+                            help="Execute the queries (EXPLAIN ANALYZE); --no-analyze only plans them")
+        parser.add_argument('--summary', action='store_true',
+                            help="Print only the scans each plan uses instead of the full plans")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist")
+
+        self.options = options
+        for label, paginator in self._canonical_queries(user, options['search']):
+            self._explain(f"{label} (first page)", paginator.querysets()[0], paginator.per_page)
+            deep = paginator.queryset[options['depth'] - 1:options['depth']]
+            for row in deep:
+                for queryset in paginator.querysets(paginator.cursor_for(row)):
+                    self._explain(f"{label} (after row {options['depth']})", queryset, paginator.per_page)
+
+        book = Book.objects.filter(user=user).first()
+        if book:
+            self._explain("book detail notes", Note.objects.filter(book=book), None)
+            self._explain("book detail quotes", Quote.objects.filter(book=book).prefetch_related('tags'), None)
+            self._explain("book detail files", book.files.all(), None)
+
+    def _canonical_queries(self, user, search):
+        books = (
+            Book.objects.filter(user=user)
+            .select_related('user', 'author')
+            .defer('search_vector')
+            .with_counts()
+        )
+        for sort in LIBRARY_SORTS:
+            yield f"library sort={sort}", KeysetPaginator(books, [sort], BOOKS_PER_PAGE)
+        for status, _ in Book.STATUS_CHOICES:
+            yield f"library status={status}", KeysetPaginator(books.filter(status=status), ['-updated_at'], BOOKS_PER_PAGE)
+        yield "library status=FINISHED sort=-finished_at", KeysetPaginator(
+            books.filter(status='FINISHED'), ['-finished_at'], BOOKS_PER_PAGE
+        )
+
+        quotes = Quote.objects.filter(user=user).select_related('book', 'book__author', 'user').defer('search_vector')
+        for sort in QUOTE_SORTS:
+            yield f"quotes sort={sort}", KeysetPaginator(quotes, [sort], QUOTES_PER_PAGE)
+
+        if search:
+            query = build_search_query(search)
+            yield f"library q={search!r}", KeysetPaginator(
+                books.filter(search_vector=query).annotate(rank=search_rank(query)),
+                ['-rank', '-updated_at'], BOOKS_PER_PAGE,
+            )
+            yield f"quotes q={search!r}", KeysetPaginator(
+                quotes.filter(
+                    Q(search_vector=query) | Q(book_id__in=books_matching_title_or_author(user, query))
+                ).annotate(rank=search_rank(query)),
+                ['-rank', '-created_at'], QUOTES_PER_PAGE,
+            )
+
+    def _explain(self, label, queryset, limit):
+        if limit is not None:
+            queryset = queryset[:limit + 1]
+        plan = queryset.explain(analyze=self.options['analyze'])
+
+        if self.options['summary']:
+            scans = ', '.join(f"{kind} {target}" for kind, target in SCAN_PATTERN.findall(plan)) or 'no scans'
+            style = self.style.WARNING if 'Seq Scan' in scans else self.style.SUCCESS
+            self.stdout.write(f"{label}: " + style(scans))
+            return
+
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        self.stdout.write(plan)
+        self.stdout.write('')
@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from books.backup import export_jsonl, export_zip
+
+
+class Command(BaseCommand):
+    help = "Export a user's whole library as a zip (with files) or JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('output')
+        parser.add_argument('--format', choices=['zip', 'jsonl'], default='zip')
+        parser.add_argument('--no-files', action='store_true',
+                            help="Leave attached files and covers out of the zip")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}")
+
+        if options['format'] == 'jsonl':
+            chunks = export_jsonl(user)
+        else:
+            chunks = export_zip(user, include_files=not options['no_files'])
+        size = 0
+        with open(options['output'], 'wb') as fh:
+            for chunk in chunks:
+                fh.write(chunk)
+                size += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {size} bytes to {options['output']}"))
@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from PIL import UnidentifiedImageError
+
+from books.fragments import bump_card_versions
+from books.models import Book
+from books.thumbnails import generate_cover_renditions
+
+
+def _render(cover_name):
+    """Worker entry point: only touches storage, never the database"""
+    return generate_cover_renditions(cover_name)
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG renditions for book covers that do not have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Number of processes resizing images in parallel")
+        parser.add_argument('--force', action='store_true',
+                            help="Regenerate renditions for covers that already have them")
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(cover_image='').order_by('pk')
+        if not options['force']:
+            books = books.filter(cover_thumbnails=[])
+        covers = dict(books.values_list('pk', 'cover_image'))
+        if not covers:
+            self.stdout.write("No covers to process.")
+            return
+
+        # Forked workers must not inherit open database connections
+        connections.close_all()
+        failed = 0
+        updated = []
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as executor:
+            futures = {executor.submit(_render, name): pk for pk, name in covers.items()}
+            for future in as_completed(futures):
+                pk = futures[future]
+                try:
+                    widths = future.result()
+                except (OSError, UnidentifiedImageError) as exc:
+                    failed += 1
+                    self.stderr.write(f"Book {pk}: could not process {covers[pk]} ({exc})")
+                    continue
+                Book.objects.filter(pk=pk).update(cover_thumbnails=widths)
+                updated.append(pk)
+
+        # Cached cards carry the rendition URLs
+        bump_card_versions(updated)
+
+        self.stdout.write(self.style.SUCCESS(f"Generated renditions for {len(updated)} covers ({failed} failed)."))
@@ -0,0 +1,36 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from books.importer import IMPORT_CHUNK_SIZE, ImportFormatError, import_library
+
+
+class Command(BaseCommand):
+    help = "Import a Goodreads or StoryGraph CSV export into a user's library"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('csv_path')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                            help=f"Rows created per transaction (default: {IMPORT_CHUNK_SIZE})")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}")
+
+        def progress(totals):
+            rate = totals['rows'] / totals['seconds'] if totals['seconds'] else 0
+            self.stdout.write(f"{totals['rows']} rows, {totals['created']} books created ({rate:.0f} rows/s)")
+
+        # utf-8-sig drops the byte order mark some spreadsheet tools add
+        with open(options['csv_path'], encoding='utf-8-sig', newline='') as fh:
+            try:
+                totals = import_library(user, fh, chunk_size=options['chunk_size'], progress=progress)
+            except ImportFormatError as exc:
+                raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {totals['created']} books in {totals['seconds']:.1f}s; "
+            f"skipped {totals['skipped']} already in the library."
+        ))
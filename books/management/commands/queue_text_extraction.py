@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from books.extraction import EXTRACTABLE_TYPES
+from books.models import BookFile
+from core.jobs import enqueue
+
+
+class Command(BaseCommand):
+    help = "Queue text extraction for source PDFs/EPUBs that have not been extracted yet"
+
+    def handle(self, *args, **options):
+        pending = (
+            BookFile.objects.filter(file_type__in=EXTRACTABLE_TYPES, extracted__isnull=True)
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        count = 0
+        for book_file_id in pending.iterator():
+            enqueue('books.extraction.extract_book_file', book_file_id=book_file_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Queued extraction for {count} files."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from books.models import Book
+from books.search import refresh_search_vectors
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored full-text search vector of every book"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only rebuild books belonging to this username")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        books = Book.objects.order_by('pk')
+        if options['user']:
+            books = books.filter(user__username=options['user'])
+
+        book_ids = list(books.values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        updated = 0
+        for start in range(0, len(book_ids), batch_size):
+            updated += refresh_search_vectors(book_ids[start:start + batch_size])
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search vectors for {updated} books."))
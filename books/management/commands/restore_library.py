@@ -0,0 +1,26 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from books.backup import restore_library
+
+
+class Command(BaseCommand):
+    help = "Restore a library export (zip or JSON Lines) into a user's library"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}")
+
+        try:
+            counts = restore_library(user, options['path'])
+        except (KeyError, ValueError) as exc:
+            raise CommandError(f"Could not restore {options['path']}: {exc}")
+
+        summary = ', '.join(f"{count} {kind}" for kind, count in counts.items()) or 'nothing'
+        self.stdout.write(self.style.SUCCESS(f"Restored {summary}."))
@@ -0,0 +1,71 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from books.benchmark import (
+    BENCHMARK_ITERATIONS, REGRESSION_THRESHOLD, BenchmarkError, compare_to_baseline, run_benchmarks,
+)
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the library, quotes and book detail views (and their HTMX "
+        "partials) for a seeded user, and compare latency, query count and "
+        "rows fetched with a saved baseline. Exits non-zero on a regression."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', default='benchmark')
+        parser.add_argument('--iterations', type=int, default=BENCHMARK_ITERATIONS,
+                            help=f"Timed requests per scenario (default: {BENCHMARK_ITERATIONS})")
+        parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+        parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                            help=f"Allowed relative growth of latency and rows (default: {REGRESSION_THRESHOLD})")
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Write this run's results as the new baseline instead of comparing")
+        parser.add_argument('--only', default='', help="Run only scenarios whose name contains this text")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}; run seed_benchmark first")
+
+        def progress(name, result):
+            self.stdout.write(
+                f"{name:<48} p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+                f"{result['queries']:>3} queries  {result['rows']:>6} rows"
+            )
+
+        # The test environment lets the client reach 'testserver' and read
+        # response contexts; plain static storage avoids needing collectstatic
+        setup_test_environment()
+        storages = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}}
+        try:
+            with override_settings(STORAGES=storages):
+                results = run_benchmarks(user, options['iterations'], options['only'], progress)
+        except BenchmarkError as exc:
+            raise CommandError(str(exc))
+        finally:
+            teardown_test_environment()
+
+        baseline_path = options['baseline']
+        if options['update_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} scenarios to {baseline_path}"))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(f"No baseline at {baseline_path}; run with --update-baseline to save one.")
+            return
+
+        regressions = compare_to_baseline(results, json.loads(baseline_path.read_text()), options['threshold'])
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n" + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {baseline_path}"))
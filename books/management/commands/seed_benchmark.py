@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from books.benchmark import seed_library
+
+
+class Command(BaseCommand):
+    help = (
+        "Create a user with a large generated library for run_benchmark and "
+        "explain_queries. An existing user of that name is deleted first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', default='benchmark')
+        parser.add_argument('--books', type=int, default=10_000)
+        parser.add_argument('--quotes', type=int, default=100_000)
+        parser.add_argument('--notes', type=int, default=50_000)
+        parser.add_argument('--tags', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for repeatable data (default: 0)")
+
+    def handle(self, *args, **options):
+        user = seed_library(
+            options['username'],
+            books=options['books'],
+            quotes=options['quotes'],
+            notes=options['notes'],
+            tags=options['tags'],
+            seed=options['seed'],
+            progress=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {user.username!r} (password {user.username!r})."
+        ))
@@ -0,0 +1,58 @@
+# Generated by Django 5.0.1 on 2026-10-17 23:52
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Concat
+
+
+def populate_search_vectors(apps, schema_editor):
+    Author = apps.get_model('books', 'Author')
+    Book = apps.get_model('books', 'Book')
+    Note = apps.get_model('notes', 'Note')
+    Quote = apps.get_model('quotes', 'Quote')
+
+    def aggregated(model, first, second):
+        return Subquery(
+            model.objects.filter(book=OuterRef('pk'))
+            .order_by()
+            .values('book')
+            .annotate(text=StringAgg(Concat(F(first), Value(' '), F(second)), delimiter=' '))
+            .values('text')
+        )
+
+    Book.objects.update(search_vector=(
+        SearchVector('title', weight='A', config='english')
+        + SearchVector(Subquery(Author.objects.filter(pk=OuterRef('author_id')).values('name')[:1]),
+                       weight='A', config='english')
+        + SearchVector(aggregated(Quote, 'quote_text', 'my_comment'), weight='B', config='english')
+        + SearchVector(aggregated(Note, 'title', 'body'), weight='C', config='english')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_remove_book_primary_format_author_alter_book_author'),
+        ('core', '0001_initial'),
+        ('notes', '0001_initial'),
+        ('quotes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='book_search_vector_idx'),
+        ),
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+    ]
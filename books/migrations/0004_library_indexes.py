@@ -0,0 +1,51 @@
+# Generated by Django 5.0.1 on 2026-10-17 23:58
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build indexes without locking writes on large existing tables
+    atomic = False
+
+    dependencies = [
+        ('books', '0003_book_search_vector'),
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='book',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='book_user_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='book',
+            index=models.Index(fields=['user', 'status', '-updated_at', '-id'], name='book_user_status_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='book',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='book_user_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='book',
+            index=models.Index(fields=['user', 'title', 'id'], name='book_user_title_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='book',
+            index=models.Index(models.F('user'), models.OrderBy(models.F('overall_rating'), descending=True, nulls_last=True), models.OrderBy(models.F('id'), descending=True), name='book_user_rating_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='book',
+            index=models.Index(models.F('user'), models.OrderBy(models.F('finished_at'), descending=True, nulls_last=True), models.OrderBy(models.F('id'), descending=True), name='book_user_finished_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='book',
+            index=models.Index(models.F('user'), models.OrderBy(models.F('finished_at'), descending=True, nulls_last=True), models.OrderBy(models.F('id'), descending=True), condition=models.Q(('status', 'FINISHED')), name='book_user_finished_only_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='bookfile',
+            index=models.Index(fields=['book', '-uploaded_at'], name='bookfile_book_uploaded_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_library_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='cover_thumbnails',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-18 00:03
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_book_cover_thumbnails'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file_type', models.CharField(choices=[('SOURCE_PDF', 'Source PDF'), ('SOURCE_EPUB', 'Source EPUB'), ('SUMMARY', 'Summary'), ('MINDMAP', 'Mindmap'), ('OTHER', 'Other')], default='OTHER', max_length=20)),
+                ('file_name', models.CharField(max_length=500)),
+                ('original_filename', models.CharField(max_length=500)),
+                ('mime_type', models.CharField(blank=True, max_length=100)),
+                ('size', models.BigIntegerField()),
+                ('received', models.BigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='books.book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
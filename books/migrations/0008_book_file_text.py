@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-18 00:08
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_file_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookFileText',
+            fields=[
+                ('book_file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='extracted', serialize=False, to='books.bookfile')),
+                ('page_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('title', models.CharField(blank=True, max_length=500)),
+                ('author', models.CharField(blank=True, max_length=300)),
+                ('text', models.TextField(blank=True)),
+                ('search_vector', models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector('text', config='english', weight='D'), output_field=django.contrib.postgres.search.SearchVectorField())),
+                ('extracted_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='bookfiletext_search_idx')],
+            },
+        ),
+    ]
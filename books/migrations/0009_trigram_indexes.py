@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:12
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Build indexes without locking writes on large existing tables
+    atomic = False
+
+    dependencies = [
+        ('books', '0008_book_file_text'),
+        # Installs pg_trgm
+        ('core', '0003_tag_name_trgm_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='author',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='author_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='book_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
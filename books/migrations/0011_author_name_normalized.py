@@ -0,0 +1,39 @@
+# Generated by Django 5.0.1 on 2026-10-18 00:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_duplicate_authors(apps, schema_editor):
+    """Fill name_normalized and fold authors differing only in case/spacing into the oldest one"""
+    Author = apps.get_model('books', 'Author')
+    Book = apps.get_model('books', 'Book')
+
+    survivors = {}
+    for author in Author.objects.order_by('pk').iterator():
+        author.name_normalized = ' '.join(author.name.split()).lower()
+        key = (author.user_id, author.name_normalized)
+        if key in survivors:
+            Book.objects.filter(author_id=author.pk).update(author_id=survivors[key])
+            author.delete()
+        else:
+            survivors[key] = author.pk
+            author.save(update_fields=['name_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0010_author_name_prefix_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='name_normalized',
+            field=models.CharField(default='', editable=False, max_length=300),
+            preserve_default=False,
+        ),
+        migrations.RunPython(merge_duplicate_authors, migrations.RunPython.noop),
+    ]
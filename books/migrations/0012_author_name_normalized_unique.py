@@ -0,0 +1,25 @@
+# Generated by Django 5.0.1 on 2026-10-18 00:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Separate from 0011: PostgreSQL refuses to alter a table with FK checks
+    # still pending from the merge in the same transaction
+
+    dependencies = [
+        ('books', '0011_author_name_normalized'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='author',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='author',
+            constraint=models.UniqueConstraint(fields=('user', 'name_normalized'), name='author_user_name_normalized_uniq'),
+        ),
+    ]
@@ -1,8 +1,14 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Upper
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
 from core.models import Tag
+from core.search import weighted_vector
 import os
+import uuid
 
 
 def book_cover_path(instance, filename):
@@ -15,19 +21,74 @@ def book_file_path(instance, filename):
     return f"books/{instance.book.user.id}/{instance.book.id}/{filename}"
 
 
+def blob_path(instance, filename):
+    """Content-addressed path: blobs/ab/cd/<sha256><ext>"""
+    ext = os.path.splitext(filename)[1].lower()
+    return f"blobs/{instance.sha256[:2]}/{instance.sha256[2:4]}/{instance.sha256}{ext}"
+
+
+def _related_count(model):
+    """Correlated subquery counting `model` rows that point at the outer book"""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(book=OuterRef('pk'))
+            .order_by()
+            .values('book')
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+class BookQuerySet(models.QuerySet):
+    def with_counts(self):
+        """Annotate note, quote and file counts so templates don't query per book"""
+        from notes.models import Note
+        from quotes.models import Quote
+        return self.annotate(
+            num_notes=_related_count(Note),
+            num_quotes=_related_count(Quote),
+            num_files=_related_count(BookFile),
+        )
+
+
+def normalize_author_name(name):
+    """Case- and whitespace-insensitive form of an author name"""
+    return ' '.join(name.split()).lower()
+
+
 class Author(models.Model):
     """Author entity to prevent duplicates"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='authors')
     name = models.CharField(max_length=300)
+    # Set from `name` on save; unique per user so "le guin" and "Le Guin"
+    # resolve to one author (see books.authors.resolve_authors)
+    name_normalized = models.CharField(max_length=300, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['name']
-        unique_together = ('user', 'name')
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name_normalized'], name='author_user_name_normalized_uniq'),
+        ]
+        indexes = [
+            # Search-as-you-type (books.autocomplete); needs pg_trgm
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='author_name_trgm_idx'),
+            # Prefix lookups (name__istartswith) for author suggestions
+            models.Index('user', OpClass(Upper('name'), name='text_pattern_ops'), name='author_user_name_prefix_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.name_normalized = normalize_author_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_normalized'}
+        super().save(*args, **kwargs)
+
 
 class Book(models.Model):
     """Book model representing a book in the library"""
@@ -54,30 +115,82 @@ class Book(models.Model):
     started_at = models.DateField(null=True, blank=True)
     finished_at = models.DateField(null=True, blank=True)
     cover_image = models.ImageField(upload_to=book_cover_path, null=True, blank=True)
+    # Pixel widths of the resized renditions written by books.thumbnails
+    cover_thumbnails = models.JSONField(default=list, blank=True, editable=False)
     tags = models.ManyToManyField(Tag, related_name='books', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Title, author, notes and quotes; maintained by books.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = BookQuerySet.as_manager()
 
     class Meta:
         ordering = ['-updated_at']
+        # Library queries always filter by user and page with a pk
+        # tiebreaker (see core.pagination), so each sort gets a matching index.
+        indexes = [
+            GinIndex(fields=['search_vector'], name='book_search_vector_idx'),
+            GinIndex(fields=['title'], opclasses=['gin_trgm_ops'], name='book_title_trgm_idx'),
+            models.Index(fields=['user', '-updated_at', '-id'], name='book_user_updated_idx'),
+            models.Index(fields=['user', 'status', '-updated_at', '-id'], name='book_user_status_updated_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='book_user_created_idx'),
+            models.Index(fields=['user', 'title', 'id'], name='book_user_title_idx'),
+            models.Index(
+                'user', F('overall_rating').desc(nulls_last=True), F('id').desc(),
+                name='book_user_rating_idx',
+            ),
+            models.Index(
+                'user', F('finished_at').desc(nulls_last=True), F('id').desc(),
+                name='book_user_finished_idx',
+            ),
+            models.Index(
+                'user', F('finished_at').desc(nulls_last=True), F('id').desc(),
+                name='book_user_finished_only_idx',
+                condition=Q(status='FINISHED'),
+            ),
+        ]
 
     def __str__(self):
         author_name = self.author.name if self.author else "Unknown"
         return f"{self.title} by {author_name}"
 
+    # The counts below prefer values annotated by BookQuerySet.with_counts()
+    # and only fall back to a COUNT query (or the prefetch cache) without them.
+
     @property
     def notes_count(self):
+        if hasattr(self, 'num_notes'):
+            return self.num_notes
         return self.notes.count()
 
     @property
     def quotes_count(self):
+        if hasattr(self, 'num_quotes'):
+            return self.num_quotes
         return self.quotes.count()
 
     @property
     def files_count(self):
+        if hasattr(self, 'num_files'):
+            return self.num_files
         return self.files.count()
 
 
+class FileBlob(models.Model):
+    """
+    Stored file content, shared by every BookFile with the same SHA-256.
+    See books.blobs; a blob is deleted with the last BookFile using it.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(upload_to=blob_path, max_length=255)
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
 class BookFile(models.Model):
     """File attachments for books (PDFs, summaries, mindmaps, etc.)"""
 
@@ -92,12 +205,19 @@ class BookFile(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='files')
     file_type = models.CharField(max_length=20, choices=FILE_TYPE_CHOICES, default='OTHER')
     file = models.FileField(upload_to=book_file_path)
+    # Set for files stored through books.blobs; `file` then names the blob's file
+    blob = models.ForeignKey(
+        FileBlob, on_delete=models.PROTECT, related_name='book_files', null=True, blank=True, editable=False,
+    )
     original_filename = models.CharField(max_length=500)
     mime_type = models.CharField(max_length=100, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['book', '-uploaded_at'], name='bookfile_book_uploaded_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_file_type_display()} - {self.original_filename}"
@@ -105,4 +225,58 @@ class BookFile(models.Model):
     def save(self, *args, **kwargs):
         if not self.original_filename and self.file:
             self.original_filename = os.path.basename(self.file.name)
+        if self.file and not self.file._committed:
+            # A fresh upload: store its content once, shared by identical files
+            from .blobs import store_blob
+            with transaction.atomic():
+                self.blob = store_blob(self.file.file)
+                self.file = self.blob.file.name
+                super().save(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
+
+
+class BookFileText(models.Model):
+    """Text and metadata extracted from a source PDF/EPUB by books.extraction"""
+    book_file = models.OneToOneField(BookFile, on_delete=models.CASCADE, primary_key=True, related_name='extracted')
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    title = models.CharField(max_length=500, blank=True)
+    author = models.CharField(max_length=300, blank=True)
+    text = models.TextField(blank=True)
+    search_vector = models.GeneratedField(
+        expression=weighted_vector('text', 'D'),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='bookfiletext_search_idx'),
+        ]
+
+    def __str__(self):
+        return f"Text of {self.book_file}"
+
+
+class UploadSession(models.Model):
+    """
+    A chunked upload in progress. Chunks are written straight into
+    `file_name` in storage; the BookFile is only created at finalize.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='upload_sessions')
+    file_type = models.CharField(max_length=20, choices=BookFile.FILE_TYPE_CHOICES, default='OTHER')
+    file_name = models.CharField(max_length=500)
+    original_filename = models.CharField(max_length=500)
+    mime_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    # Optional SHA-256 hex digest announced by the client, checked at finalize
+    sha256 = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.original_filename} ({self.received}/{self.size} bytes)"
@@ -0,0 +1,65 @@
+from django.shortcuts import render
+
+from core.pagination import KeysetPaginator
+from notes.models import Note
+from quotes.models import Quote
+from .models import BookFile
+
+PANEL_PAGE_SIZE = 20
+# Book detail panel -> template variable holding one of its items
+PANELS = {
+    'notes': 'note',
+    'quotes': 'quote',
+    'files': 'file',
+}
+
+
+def panel_template(panel, kind):
+    """Partial for a panel: 'list' (first page), 'items' (later pages), 'item' or 'form'"""
+    return f'books/partials/{PANELS[panel]}_{kind}.html'
+
+
+def panel_queryset(book, panel):
+    """(queryset, ordering) for a panel, with everything its templates touch prefetched"""
+    if panel == 'notes':
+        return Note.objects.filter(book=book), ['-created_at']
+    if panel == 'quotes':
+        return Quote.objects.filter(book=book).prefetch_related('tags').defer('search_vector'), ['-created_at']
+    return BookFile.objects.filter(book=book), ['-uploaded_at']
+
+
+def load_panel(book, panel, cursor=None):
+    """Template context for one page of a book detail panel"""
+    queryset, ordering = panel_queryset(book, panel)
+    page = KeysetPaginator(queryset, ordering, PANEL_PAGE_SIZE).page(cursor)
+    return {'book': book, 'page': page, panel: page}
+
+
+def render_panel_change(request, book, panel, action, pk, form=None):
+    """
+    HTMX response to a created, updated or deleted panel item.
+
+    Only that item is sent, as an out-of-band swap, together with the
+    panel's count in the book overview, so long lists are not re-rendered.
+    The whole first page is sent instead when the list switches between
+    empty and non-empty, since the item container only exists when
+    there is something in it. With `form`, that (empty) form is the main
+    content, replacing the submitted form in its modal.
+    """
+    queryset, _ = panel_queryset(book, panel)
+    count = queryset.count()
+    context = {
+        'book': book,
+        'panel': panel,
+        'action': action,
+        'count': count,
+        'item_id': f'{PANELS[panel]}-{pk}',
+        'item_template': panel_template(panel, 'item'),
+    }
+    if form is not None:
+        context.update(form=form, form_template=panel_template(panel, 'form'))
+    if (action == 'created' and count == 1) or (action == 'deleted' and count == 0):
+        context.update(load_panel(book, panel), full=True, list_template=panel_template(panel, 'list'))
+    elif action != 'deleted':
+        context[PANELS[panel]] = queryset.get(pk=pk)
+    return render(request, 'books/partials/panel_change.html', context)
@@ -0,0 +1,59 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.db.models import F, OuterRef, QuerySet, Subquery, Value
+from django.db.models.functions import Concat
+
+from core.search import weight_filtered, weighted_vector
+from notes.models import Note
+from quotes.models import Quote
+from .models import Author, Book
+
+
+def _aggregated_text(queryset, *fields):
+    """Concatenate `fields` of every related row into one string per book"""
+    parts = []
+    for field in fields:
+        parts.extend([F(field), Value(' ')])
+    return Subquery(
+        queryset.filter(book=OuterRef('pk'))
+        .order_by()
+        .values('book')
+        .annotate(text=StringAgg(Concat(*parts[:-1]), delimiter=' '))
+        .values('text')
+    )
+
+
+# Weight of the title and author name in a book's search vector
+TITLE_AUTHOR_WEIGHT = 'A'
+
+
+def book_search_vector():
+    """Expression computing the stored search vector of a book"""
+    author_name = Subquery(Author.objects.filter(pk=OuterRef('author_id')).values('name')[:1])
+    return (
+        weighted_vector('title', TITLE_AUTHOR_WEIGHT)
+        + weighted_vector(author_name, TITLE_AUTHOR_WEIGHT)
+        + weighted_vector(_aggregated_text(Quote.objects, 'quote_text', 'my_comment'), 'B')
+        + weighted_vector(_aggregated_text(Note.objects, 'title', 'body'), 'C')
+    )
+
+
+def refresh_search_vectors(books):
+    """Recompute the search vector for the given books (queryset or ids) in one UPDATE"""
+    if not isinstance(books, QuerySet):
+        books = Book.objects.filter(pk__in=list(books))
+    return books.update(search_vector=book_search_vector())
+
+
+def books_matching_title_or_author(user, query):
+    """
+    Ids of the user's books whose title or author name match `query`. The
+    search vector's GIN index finds the candidates; since the vector also
+    holds quote and note text, matches are rechecked on the title/author
+    lexemes alone.
+    """
+    return list(
+        Book.objects.filter(user=user, search_vector=query)
+        .alias(title_author=weight_filtered('search_vector', TITLE_AUTHOR_WEIGHT))
+        .filter(title_author=query)
+        .values_list('pk', flat=True)
+    )
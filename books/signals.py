@@ -0,0 +1,150 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.conditional import bump_library_version
+from core.jobs import enqueue
+from core.models import Tag
+from notes.models import Note
+from quotes.models import Quote
+from .authors import invalidate_author_suggestions
+from .blobs import release_blob
+from .extraction import EXTRACTABLE_TYPES
+from .fragments import bump_card_versions
+from .models import Author, Book, BookFile, BookFileText
+from .search import refresh_search_vectors
+from .stats import invalidate_library_stats
+
+
+def _deleted_with_book(origin):
+    """True when a row is being removed as part of deleting its book"""
+    return isinstance(origin, Book) or getattr(origin, 'model', None) is Book
+
+
+@receiver(post_save, sender=Book)
+def refresh_book_search_vector(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_search_vectors([instance.pk])
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_stats(sender, instance, **kwargs):
+    invalidate_library_stats(instance.user_id)
+
+
+@receiver(post_save, sender=Author)
+def refresh_author_books_search_vector(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        refresh_search_vectors(instance.books.all())
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def invalidate_author_list(sender, instance, **kwargs):
+    invalidate_author_suggestions(instance.user_id)
+
+
+@receiver(post_save, sender=Note)
+@receiver(post_save, sender=Quote)
+def refresh_parent_search_vector_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_search_vectors([instance.book_id])
+
+
+@receiver(post_delete, sender=Note)
+@receiver(post_delete, sender=Quote)
+def refresh_parent_search_vector_on_delete(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_book(origin):
+        refresh_search_vectors([instance.book_id])
+
+
+@receiver(post_delete, sender=BookFile)
+def release_book_file_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+
+
+@receiver(post_save, sender=BookFile)
+def queue_text_extraction(sender, instance, created, raw=False, **kwargs):
+    # Extraction can take minutes for a large PDF, so it never runs in the request
+    if created and not raw and instance.file_type in EXTRACTABLE_TYPES:
+        enqueue('books.extraction.extract_book_file', book_file_id=instance.pk)
+
+
+# Book cards show counts, tags and the author name, none of which move the
+# book's updated_at, so their changes bump the card version instead
+
+@receiver(post_save, sender=Note)
+@receiver(post_save, sender=Quote)
+@receiver(post_save, sender=BookFile)
+def bump_card_on_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump_card_versions([instance.book_id])
+
+
+@receiver(post_delete, sender=Note)
+@receiver(post_delete, sender=Quote)
+@receiver(post_delete, sender=BookFile)
+def bump_card_on_delete(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_book(origin):
+        bump_card_versions([instance.book_id])
+
+
+@receiver(post_save, sender=Author)
+def bump_author_cards(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        bump_card_versions(instance.books.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def bump_tag_cards(sender, instance, raw=False, created=False, **kwargs):
+    # pre_delete: the tag's book links are gone by post_delete
+    if not raw and not created:
+        bump_card_versions(instance.books.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Book.tags.through)
+def bump_tagged_cards(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        bump_card_versions([instance.pk])
+    elif action == 'pre_clear':
+        bump_card_versions(instance.books.values_list('pk', flat=True))
+    else:
+        bump_card_versions(pk_set)
+
+
+# Library and quotes pages answer 304 until the user's library version moves
+# (core.conditional), so every write that can show up on them bumps it
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Note)
+@receiver(post_delete, sender=Note)
+@receiver(post_save, sender=Quote)
+@receiver(post_delete, sender=Quote)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Book.tags.through)
+@receiver(m2m_changed, sender=Quote.tags.through)
+def bump_owner_library_version(sender, instance, **kwargs):
+    bump_library_version(instance.user_id)
+
+
+@receiver(post_save, sender=BookFile)
+@receiver(post_delete, sender=BookFile)
+def bump_file_library_version(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_book(origin):
+        bump_library_version(Book.objects.filter(pk=instance.book_id).values_list('user_id', flat=True).first())
+
+
+@receiver(post_save, sender=BookFileText)
+def bump_extracted_text_library_version(sender, instance, **kwargs):
+    # Extracted text is searched from the library page
+    bump_library_version(
+        Book.objects.filter(files__pk=instance.book_file_id).values_list('user_id', flat=True).first()
+    )
@@ -0,0 +1,34 @@
+from django.core.cache import cache
+from django.db.models import Avg, Count, Q
+
+from core.versions import bump_version, current_version
+from .models import Book
+
+STATS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _stats_cache_key(user_id):
+    # A version bumped on commit: a request that computed the stats from
+    # data a writer is about to change caches them under the old version
+    return f'library-stats:{user_id}:{current_version("stats", user_id)}'
+
+
+def library_stats(user):
+    """Per-status book counts and average rating, from cache or one aggregate query"""
+    key = _stats_cache_key(user.pk)
+    stats = cache.get(key)
+    if stats is None:
+        stats = Book.objects.filter(user=user).aggregate(
+            total=Count('pk'),
+            reading=Count('pk', filter=Q(status='READING')),
+            finished=Count('pk', filter=Q(status='FINISHED')),
+            to_read=Count('pk', filter=Q(status='TO_READ')),
+            abandoned=Count('pk', filter=Q(status='ABANDONED')),
+            avg_rating=Avg('overall_rating'),
+        )
+        cache.set(key, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate_library_stats(user_id):
+    bump_version('stats', user_id)
@@ -0,0 +1,27 @@
+from django import template
+from django.core.files.storage import default_storage
+
+from books.thumbnails import rendition_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def cover_srcset(book, ext='webp'):
+    """
+    `srcset` value listing the resized renditions of a book cover.
+    Usage:
+        <source type="image/webp" srcset="{% cover_srcset book 'webp' %}" sizes="320px">
+    """
+    return ', '.join(
+        f"{default_storage.url(rendition_name(book.cover_image.name, width, ext))} {width}w"
+        for width in book.cover_thumbnails
+    )
+
+
+@register.simple_tag
+def cover_src(book, ext='jpg'):
+    """URL of the smallest rendition, for the `src` fallback of an <img>"""
+    if not book.cover_thumbnails:
+        return book.cover_image.url
+    return default_storage.url(rendition_name(book.cover_image.name, min(book.cover_thumbnails), ext))
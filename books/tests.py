@@ -1,3 +1,1080 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from PyPDF2 import PdfWriter
+
+from core.models import Job, Tag
+from notes.models import Note
+from quotes.models import Quote
+from .authors import resolve_author, resolve_authors
+from .backup import restore_library
+from .benchmark import compare_to_baseline, run_benchmarks, seed_library
+from .importer import import_library
+from .models import Author, Book, BookFile, BookFileText, FileBlob, UploadSession
+from .panels import PANEL_PAGE_SIZE
+from .stats import _stats_cache_key, library_stats
+from .thumbnails import COVER_FORMATS, rendition_name
+from .uploads import UploadError, finalize_upload
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+TEST_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    # Templates reference compiled CSS that only exists after collectstatic
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, STORAGES=TEST_STORAGES)
+class LibraryQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='secret')
+        cls.author = Author.objects.create(user=cls.user, name='Ursula K. Le Guin')
+        cls.tag = Tag.objects.create(user=cls.user, name='sci-fi')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _add_books(self, count):
+        for i in range(count):
+            book = Book.objects.create(user=self.user, title=f'Book {i}', author=self.author)
+            book.tags.add(self.tag)
+            Note.objects.create(book=book, user=self.user, body='A note')
+            Quote.objects.create(book=book, user=self.user, quote_text='A quote')
+            BookFile.objects.create(
+                book=book,
+                file=SimpleUploadedFile(f'book-{i}.txt', b'contents'),
+                original_filename=f'book-{i}.txt',
+            )
+
+    def _library_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('library'), params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_books(self):
+        self._add_books(1)
+        baseline = self._library_queries()
+        self._add_books(5)
+        self.assertEqual(self._library_queries(), baseline)
+
+    def test_htmx_partial_query_count_does_not_grow_with_books(self):
+        self._add_books(1)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('library'), HTTP_HX_REQUEST='true')
+        baseline = len(queries)
+        self._add_books(5)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('library'), HTTP_HX_REQUEST='true')
+        self.assertEqual(len(queries), baseline)
+
+    def test_cards_show_annotated_counts(self):
+        self._add_books(1)
+        book = Book.objects.get()
+        Note.objects.create(book=book, user=self.user, body='Another note')
+
+        response = self.client.get(reverse('library'))
+        card = response.context['books'][0]
+        self.assertEqual((card.notes_count, card.quotes_count, card.files_count), (2, 1, 1))
+
+    def test_counts_fall_back_to_queries_without_annotation(self):
+        self._add_books(1)
+        book = Book.objects.get()
+        with self.assertNumQueries(3):
+            self.assertEqual((book.notes_count, book.quotes_count, book.files_count), (1, 1, 1))
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class LibraryStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('stats-reader', password='secret')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_stats_are_invalidated_when_books_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(user=self.user, title='Dune', status='READING', overall_rating=4)
+        stats = self.client.get(reverse('library')).context['stats']
+        self.assertEqual((stats['total'], stats['reading'], stats['avg_rating']), (1, 1, 4))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            abandoned = Book.objects.create(user=self.user, title='Ulysses', status='ABANDONED', overall_rating=2)
+        stats = self.client.get(reverse('library')).context['stats']
+        self.assertEqual((stats['total'], stats['abandoned'], stats['avg_rating']), (2, 1, 3))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            abandoned.delete()
+        stats = self.client.get(reverse('library')).context['stats']
+        self.assertEqual((stats['total'], stats['abandoned']), (1, 0))
+
+    def test_stats_cached_before_the_commit_are_not_served_after_it(self):
+        user = User.objects.create_user('racing-reader')
+        self.assertEqual(library_stats(user)['total'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(user=user, title='Dune')
+            # A concurrent request, still seeing the old data, caches stats again
+            cache.set(_stats_cache_key(user.pk), {'total': 0})
+        self.assertEqual(library_stats(user)['total'], 1)
+
+    def test_htmx_partial_skips_stats(self):
+        response = self.client.get(reverse('library'), HTTP_HX_REQUEST='true')
+        self.assertNotIn('stats', response.context)
+
+
+def _cover_upload(name, width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'teal').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, STORAGES=TEST_STORAGES)
+class CoverThumbnailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cover-reader', password='secret')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _renditions(self, book):
+        return [
+            rendition_name(book.cover_image.name, width, ext)
+            for width in book.cover_thumbnails for ext in COVER_FORMATS
+        ]
+
+    def test_upload_generates_renditions_without_upscaling(self):
+        self.client.post(reverse('book_create'), {
+            'title': 'Small cover', 'author_name': 'Anonymous', 'status': 'TO_READ', 'cover_image': _cover_upload('small.png', 400, 600),
+        })
+        book = Book.objects.get(title='Small cover')
+        self.assertEqual(book.cover_thumbnails, [320, 400])
+        for name in self._renditions(book):
+            self.assertTrue(default_storage.exists(name), name)
+
+        response = self.client.get(reverse('book_detail', args=[book.pk]))
+        self.assertContains(response, 'type="image/webp"')
+
+    def test_replacing_cover_removes_previous_renditions(self):
+        self.client.post(reverse('book_create'), {
+            'title': 'Replaced', 'author_name': 'Anonymous', 'status': 'TO_READ', 'cover_image': _cover_upload('first.png', 800, 1200),
+        })
+        book = Book.objects.get(title='Replaced')
+        previous = self._renditions(book)
+
+        self.client.post(reverse('book_edit', args=[book.pk]), {
+            'title': 'Replaced', 'author_name': 'Anonymous', 'status': 'TO_READ', 'cover_image': _cover_upload('second.png', 800, 1200),
+        })
+        book.refresh_from_db()
+        self.assertEqual(book.cover_thumbnails, [320, 640])
+        for name in previous:
+            self.assertFalse(default_storage.exists(name), name)
+        for name in self._renditions(book):
+            self.assertTrue(default_storage.exists(name), name)
+
+    def test_covers_sharing_a_stem_keep_their_own_renditions(self):
+        for title, filename in [('Jpeg', 'cover.jpg'), ('Png', 'cover.png')]:
+            self.client.post(reverse('book_create'), {
+                'title': title, 'author_name': 'Anonymous', 'status': 'TO_READ', 'cover_image': _cover_upload(filename, 800, 1200),
+            })
+        jpeg, png = Book.objects.get(title='Jpeg'), Book.objects.get(title='Png')
+        self.assertFalse(set(self._renditions(jpeg)) & set(self._renditions(png)))
+
+        self.client.post(reverse('book_edit', args=[jpeg.pk]), {
+            'title': 'Jpeg', 'author_name': 'Anonymous', 'status': 'TO_READ', 'cover_image': _cover_upload('new.jpg', 800, 1200),
+        })
+        for name in self._renditions(png):
+            self.assertTrue(default_storage.exists(name), name)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, STORAGES=TEST_STORAGES, FILE_DOWNLOAD_OFFLOAD='')
+class BookFileDownloadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('downloader', password='secret')
+        book = Book.objects.create(user=cls.user, title='Moby Dick')
+        cls.book_file = BookFile.objects.create(
+            book=book,
+            file=SimpleUploadedFile('moby.epub', b'0123456789'),
+            original_filename='moby.epub',
+            mime_type='application/epub+zip',
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('book_file_view', args=[self.book_file.pk])
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_stale_if_range_sends_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(FILE_DOWNLOAD_OFFLOAD='x-accel-redirect', FILE_DOWNLOAD_ACCEL_PREFIX='/protected-media/')
+    def test_offload_to_web_server(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.book_file.file.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_other_users_cannot_download(self):
+        other = User.objects.create_user('stranger', password='secret')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get(reverse('book_file_raw', args=[self.book_file.pk])).status_code, 404)
+
+    def test_raw_serves_only_safe_types_inline(self):
+        pdf = BookFile.objects.create(
+            book=self.book_file.book, file=SimpleUploadedFile('moby.pdf', b'%PDF-1.4'),
+            original_filename='moby.pdf', mime_type='application/pdf',
+        )
+        response = self.client.get(reverse('book_file_raw', args=[pdf.pk]))
+        self.assertIn('inline', response['Content-Disposition'])
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+
+        for name, mime_type in [('notes.html', 'text/html'), ('cover.svg', ''), ('moby.epub', 'application/epub+zip')]:
+            with self.subTest(name=name):
+                upload = BookFile.objects.create(
+                    book=self.book_file.book, file=SimpleUploadedFile(name, b'<script>alert(1)</script>'),
+                    original_filename=name, mime_type=mime_type,
+                )
+                response = self.client.get(reverse('book_file_raw', args=[upload.pk]))
+                self.assertIn('attachment', response['Content-Disposition'])
+                self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+                self.assertNotIn('Content-Security-Policy', response)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, STORAGES=TEST_STORAGES)
+class ChunkedUploadTests(TestCase):
+    content = b'%PDF-1.4 chunked upload body'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('uploader', password='secret')
+        cls.book = Book.objects.create(user=cls.user, title='War and Peace')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _start(self, **extra):
+        response = self.client.post(reverse('upload_start', args=[self.book.pk]), {
+            'filename': 'war-and-peace.pdf', 'size': len(self.content), **extra,
+        })
+        self.assertEqual(response.status_code, 201)
+        return reverse('upload_session', args=[response.json()['upload_id']])
+
+    def _put(self, url, start, end):
+        return self.client.put(
+            url, self.content[start:end + 1], content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(self.content)}',
+        )
+
+    def test_chunks_are_assembled_and_verified(self):
+        url = self._start(sha256=hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(self._put(url, 0, 9).json()['offset'], 10)
+
+        # A repeated chunk is refused with the offset to resume from
+        response = self._put(url, 0, 9)
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 10))
+        self.assertEqual(self.client.get(url).json()['offset'], 10)
+
+        self._put(url, 10, len(self.content) - 1)
+        response = self.client.post(url + 'finalize/')
+        self.assertEqual(response.status_code, 201)
+
+        book_file = BookFile.objects.get(pk=response.json()['id'])
+        self.assertEqual(book_file.file_type, 'SOURCE_PDF')
+        self.assertEqual(book_file.mime_type, 'application/pdf')
+        with book_file.file.open('rb') as fh:
+            self.assertEqual(fh.read(), self.content)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_incomplete_upload_cannot_be_finalized(self):
+        url = self._start()
+        self._put(url, 0, 9)
+        self.assertEqual(self.client.post(url + 'finalize/').status_code, 409)
+        self.assertFalse(BookFile.objects.exists())
+
+    def test_checksum_mismatch_discards_upload(self):
+        url = self._start(sha256='0' * 64)
+        self._put(url, 0, len(self.content) - 1)
+        session = UploadSession.objects.get()
+
+        self.assertEqual(self.client.post(url + 'finalize/').status_code, 422)
+        self.assertFalse(BookFile.objects.exists())
+        self.assertFalse(default_storage.exists(session.file_name))
+
+    @override_settings(MAX_UPLOAD_SIZE=10)
+    def test_oversized_uploads_are_refused(self):
+        response = self.client.post(reverse('upload_start', args=[self.book.pk]), {
+            'filename': 'war-and-peace.pdf', 'size': len(self.content),
+        })
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_finalize_runs_once(self):
+        url = self._start()
+        self._put(url, 0, len(self.content) - 1)
+        session = UploadSession.objects.get()
+        book_file, _ = finalize_upload(session)
+
+        # A second request that loaded the session before the first finished
+        with self.assertRaises(UploadError) as raised:
+            finalize_upload(session)
+        self.assertEqual(raised.exception.status, 404)
+        self.assertEqual(list(BookFile.objects.all()), [book_file])
+
+    def test_other_users_cannot_append(self):
+        url = self._start()
+        self.client.force_login(User.objects.create_user('intruder', password='secret'))
+        self.assertEqual(self._put(url, 0, 9).status_code, 404)
+        self.assertEqual(self.client.post(url + 'finalize/').status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, STORAGES=TEST_STORAGES)
+class FileBlobTests(TestCase):
+    content = b'identical ebook bytes'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('collector', password='secret')
+        cls.first = Book.objects.create(user=cls.user, title='First edition')
+        cls.second = Book.objects.create(user=cls.user, title='Second edition')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _upload(self, book):
+        self.client.post(reverse('book_file_upload', args=[book.pk]), {
+            'file_type': 'SOURCE_PDF', 'file': SimpleUploadedFile('copy.pdf', self.content),
+        })
+        return BookFile.objects.get(book=book)
+
+    def test_identical_uploads_share_one_blob(self):
+        first, second = self._upload(self.first), self._upload(self.second)
+
+        blob = FileBlob.objects.get()
+        self.assertEqual(blob.sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual((first.blob_id, second.blob_id), (blob.pk, blob.pk))
+        self.assertEqual(first.file.name, second.file.name)
+
+        response = self.client.get(reverse('book_file_raw', args=[first.pk]))
+        self.assertEqual(response['ETag'], f'"{blob.sha256}"')
+
+    def test_blob_is_deleted_with_its_last_book_file(self):
+        first, second = self._upload(self.first), self._upload(self.second)
+        name = first.file.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.second.delete()
+        self.assertFalse(FileBlob.objects.exists())
+        self.assertFalse(default_storage.exists(name))
+
+    def test_chunked_upload_reuses_existing_blob(self):
+        self._upload(self.first)
+        response = self.client.post(reverse('upload_start', args=[self.second.pk]), {
+            'filename': 'copy.pdf', 'size': len(self.content),
+        })
+        url = reverse('upload_session', args=[response.json()['upload_id']])
+        self.client.put(
+            url, self.content, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes 0-{len(self.content) - 1}/{len(self.content)}',
+        )
+        staged = UploadSession.objects.get().file_name
+        self.client.post(url + 'finalize/')
+
+        self.assertEqual(FileBlob.objects.count(), 1)
+        self.assertFalse(default_storage.exists(staged))
+
+
+def _epub(title, author, body):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('mimetype', 'application/epub+zip')
+        archive.writestr('META-INF/container.xml', (
+            '<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container" version="1.0"><rootfiles>'
+            '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+            '</rootfiles></container>'
+        ))
+        archive.writestr('OEBPS/content.opf', (
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:title>{title}</dc:title><dc:creator>{author}</dc:creator></metadata>'
+            '<manifest><item id="ch1" href="text/chapter%201.xhtml" media-type="application/xhtml+xml"/></manifest>'
+            '<spine><itemref idref="ch1"/></spine></package>'
+        ))
+        archive.writestr('OEBPS/text/chapter 1.xhtml', (
+            f'<html><head><title>Ignored</title><style>p {{}}</style></head><body><p>{body}</p></body></html>'
+        ))
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, STORAGES=TEST_STORAGES)
+class TextExtractionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('extractor', password='secret')
+        cls.book = Book.objects.create(user=cls.user, title='Untitled upload')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _upload(self, name, content, file_type):
+        self.client.post(reverse('book_file_upload', args=[self.book.pk]), {
+            'file_type': file_type, 'file': SimpleUploadedFile(name, content),
+        })
+
+    def test_epub_text_is_extracted_in_the_background(self):
+        self._upload('novel.epub', _epub('Solaris', 'Stanisław Lem', 'The ocean mimics visitors &amp; memories.'), 'SOURCE_EPUB')
+        self.assertFalse(BookFileText.objects.exists())
+        self.assertEqual(Job.objects.get().status, 'PENDING')
+
+        call_command('run_jobs', workers=0, burst=True, stdout=io.StringIO(), stderr=io.StringIO())
+
+        extracted = BookFileText.objects.get()
+        self.assertEqual((extracted.title, extracted.author), ('Solaris', 'Stanisław Lem'))
+        self.assertEqual(extracted.text, 'The ocean mimics visitors & memories.')
+        self.assertEqual(Job.objects.get().status, 'DONE')
+
+        response = self.client.get(reverse('library'), {'q': 'ocean'})
+        self.assertEqual([book.pk for book in response.context['books']], [self.book.pk])
+
+    def test_pdf_page_count_and_metadata(self):
+        writer = PdfWriter()
+        for _ in range(3):
+            writer.add_blank_page(width=200, height=200)
+        writer.add_metadata({'/Title': 'Blank Verse', '/Author': 'Nobody'})
+        buffer = io.BytesIO()
+        writer.write(buffer)
+
+        self._upload('blank.pdf', buffer.getvalue(), 'SOURCE_PDF')
+        call_command('run_jobs', workers=0, burst=True, stdout=io.StringIO(), stderr=io.StringIO())
+
+        extracted = BookFileText.objects.get()
+        self.assertEqual((extracted.page_count, extracted.title, extracted.author), (3, 'Blank Verse', 'Nobody'))
+
+    def test_other_files_are_not_queued(self):
+        self._upload('notes.txt', b'plain text', 'SUMMARY')
+        self.assertFalse(Job.objects.exists())
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class BookDetailTabTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tab-reader', password='secret')
+        cls.book = Book.objects.create(user=cls.user, title='The Dispossessed')
+        cls.tag = Tag.objects.create(user=cls.user, name='utopia')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _tab(self, tab, **params):
+        return self.client.get(reverse('book_tab', args=[self.book.pk, tab]), params, HTTP_HX_REQUEST='true')
+
+    def test_detail_page_defers_tab_contents(self):
+        Note.objects.create(book=self.book, user=self.user, body='Anarres is a harsh moon')
+        response = self.client.get(reverse('book_detail', args=[self.book.pk]), {'tab': 'quotes'})
+        self.assertNotContains(response, 'Anarres is a harsh moon')
+        self.assertContains(response, reverse('book_tab', args=[self.book.pk, 'notes']))
+        self.assertEqual(response.context['active_tab'], 'quotes')
+
+        response = self._tab('notes')
+        self.assertContains(response, 'Anarres is a harsh moon')
+
+    def test_tabs_are_paginated(self):
+        for i in range(PANEL_PAGE_SIZE + 5):
+            Note.objects.create(book=self.book, user=self.user, body=f'Note {i}')
+
+        first = self._tab('notes')
+        self.assertEqual(len(first.context['notes']), PANEL_PAGE_SIZE)
+        self.assertTrue(first.context['page'].has_next)
+
+        rest = self._tab('notes', cursor=first.context['page'].next_cursor)
+        self.assertTemplateUsed(rest, 'books/partials/note_items.html')
+        self.assertEqual(len(rest.context['notes']), 5)
+        self.assertFalse(rest.context['page'].has_next)
+
+    def test_quotes_tab_query_count_does_not_grow(self):
+        def add_quote():
+            quote = Quote.objects.create(book=self.book, user=self.user, quote_text='A quote')
+            quote.tags.add(self.tag)
+
+        add_quote()
+        with CaptureQueriesContext(connection) as queries:
+            self._tab('quotes')
+        baseline = len(queries)
+        for _ in range(5):
+            add_quote()
+        with self.assertNumQueries(baseline):
+            self._tab('quotes')
+
+    def test_tab_without_htmx_redirects_to_deep_link(self):
+        response = self.client.get(reverse('book_tab', args=[self.book.pk, 'files']))
+        self.assertRedirects(response, reverse('book_detail', args=[self.book.pk]) + '?tab=files')
+
+    def test_htmx_create_sends_only_the_new_item(self):
+        Note.objects.create(book=self.book, user=self.user, body='An older note')
+        response = self.client.post(
+            reverse('note_create', args=[self.book.pk]),
+            {'note_type': 'GENERAL', 'body': 'Shevek leaves Anarres'},
+            HTTP_HX_REQUEST='true',
+        )
+        note = Note.objects.get(body='Shevek leaves Anarres')
+        self.assertContains(response, f'id="note-{note.pk}"')
+        self.assertContains(response, 'hx-swap-oob="afterbegin:#notes-items"')
+        self.assertContains(response, '<span id="book-notes-count" hx-swap-oob="innerHTML">2</span>')
+        self.assertNotContains(response, 'An older note')
+        # The modal's form comes back empty for the next note
+        self.assertTemplateUsed(response, 'books/partials/note_form.html')
+        self.assertNotContains(response, 'Shevek leaves Anarres</textarea>')
+
+    def test_htmx_invalid_note_returns_form_with_errors(self):
+        response = self.client.post(
+            reverse('note_create', args=[self.book.pk]),
+            {'note_type': 'REFLECTION', 'title': 'Odo', 'body': '', 'page_start': 'twelve'},
+            HTTP_HX_REQUEST='true',
+        )
+        self.assertEqual(response.status_code, 422)
+        self.assertTemplateUsed(response, 'books/partials/note_form.html')
+        self.assertContains(response, 'This field is required.', status_code=422)
+        self.assertContains(response, 'Enter a whole number.', status_code=422)
+        self.assertContains(response, 'value="Odo"', status_code=422)
+        self.assertContains(response, '<option value="REFLECTION" selected>', status_code=422)
+        self.assertFalse(Note.objects.filter(book=self.book).exists())
+
+    def test_htmx_upload_without_file_returns_form_with_errors(self):
+        response = self.client.post(
+            reverse('book_file_upload', args=[self.book.pk]),
+            {'file_type': 'SUMMARY'},
+            HTTP_HX_REQUEST='true',
+        )
+        self.assertEqual(response.status_code, 422)
+        self.assertTemplateUsed(response, 'books/partials/file_form.html')
+        self.assertContains(response, 'This field is required.', status_code=422)
+        self.assertFalse(BookFile.objects.filter(book=self.book).exists())
+
+    def test_htmx_quote_create_query_count_does_not_grow(self):
+        def create_quote():
+            return self.client.post(
+                reverse('quote_create', args=[self.book.pk]),
+                {'quote_text': 'True voyage is return', 'tags': [self.tag.pk]},
+                HTTP_HX_REQUEST='true',
+            )
+
+        create_quote()
+        with CaptureQueriesContext(connection) as queries:
+            create_quote()
+        baseline = len(queries)
+        for _ in range(PANEL_PAGE_SIZE):
+            Quote.objects.create(book=self.book, user=self.user, quote_text='Filler')
+        with self.assertNumQueries(baseline):
+            create_quote()
+
+    def test_deleting_last_item_renders_empty_panel(self):
+        note = Note.objects.create(book=self.book, user=self.user, body='The only note')
+        response = self.client.post(reverse('note_delete', args=[note.pk]), HTTP_HX_REQUEST='true')
+        self.assertContains(response, '<div id="notes-panel" hx-swap-oob="innerHTML">')
+        self.assertContains(response, '<span id="book-notes-count" hx-swap-oob="innerHTML">0</span>')
+        self.assertFalse(Note.objects.filter(pk=note.pk).exists())
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class BookCardCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('card-reader', password='secret')
+        cls.author = Author.objects.create(user=cls.user, name='Octavia E. Butler')
+        cls.book = Book.objects.create(user=cls.user, title='Kindred', author=cls.author)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _library(self):
+        return self.client.get(reverse('library')).content.decode()
+
+    def test_unchanged_cards_come_from_cache(self):
+        self._library()
+        # Bypasses save(), so neither updated_at nor the card version moves
+        Book.objects.filter(pk=self.book.pk).update(title='Parable of the Sower')
+        self.assertIn('Kindred', self._library())
+
+        self.book.refresh_from_db()
+        self.book.save()
+        self.assertIn('Parable of the Sower', self._library())
+
+    def test_related_changes_invalidate_the_card(self):
+        version = self.client.get(reverse('library')).context['books'][0].card_version
+        with self.captureOnCommitCallbacks(execute=True):
+            Note.objects.create(book=self.book, user=self.user, body='Dana is pulled back in time')
+        card = self.client.get(reverse('library')).context['books'][0]
+        self.assertNotEqual(card.card_version, version)
+
+        tag = Tag.objects.create(user=self.user, name='time-travel')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.tags.add(tag)
+        self.assertIn('time-travel', self._library())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.name = 'slavery'
+            tag.save()
+        self.assertIn('slavery', self._library())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.name = 'O. E. Butler'
+            self.author.save()
+        self.assertIn('O. E. Butler', self._library())
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class LibraryConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('etag-reader', password='secret')
+        cls.book = Book.objects.create(user=cls.user, title='Solaris')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_current_copy_gets_304_without_queries(self):
+        response = self.client.get(reverse('library'), {'status': 'READING'}, HTTP_HX_REQUEST='true')
+        etag = response['ETag']
+        self.assertIn('HX-Request', response['Vary'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                reverse('library'), {'status': 'READING', 'tag': ''},
+                HTTP_HX_REQUEST='true', HTTP_IF_NONE_MATCH=etag,
+            )
+        self.assertEqual(response.status_code, 304)
+
+        # The full page is a different representation of the same URL
+        response = self.client.get(reverse('library'), {'status': 'READING'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_library_writes_change_the_etag(self):
+        etag = self.client.get(reverse('library'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Note.objects.create(book=self.book, user=self.user, body='The ocean thinks')
+        response = self.client.get(reverse('library'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class LibrarySuggestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('suggest-reader', password='secret')
+        author = Author.objects.create(user=cls.user, name='Stanisław Lem')
+        cls.book = Book.objects.create(user=cls.user, title='The Cyberiad', author=author)
+        Book.objects.create(user=cls.user, title='Fiasco', author=author)
+        Tag.objects.create(user=cls.user, name='cybernetics')
+        Quote.objects.create(book=cls.book, user=cls.user, quote_text='Cybernetic poetry machines write verse')
+        other = User.objects.create_user('other-reader', password='secret')
+        Book.objects.create(user=other, title='Cyber Dreams')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_suggests_each_kind_for_a_prefix(self):
+        response = self.client.get(reverse('library_suggest'), {'q': 'cyber'}, HTTP_HX_REQUEST='true')
+        suggestions = response.context['suggestions']
+        self.assertEqual([book['title'] for book in suggestions['books']], ['The Cyberiad'])
+        self.assertEqual([tag['name'] for tag in suggestions['tags']], ['cybernetics'])
+        self.assertEqual(len(suggestions['quotes']), 1)
+        self.assertContains(response, reverse('book_detail', args=[self.book.pk]))
+
+        response = self.client.get(reverse('library_suggest'), {'q': 'Lem'})
+        self.assertEqual([author['name'] for author in response.context['suggestions']['authors']], ['Stanisław Lem'])
+
+    def test_misspelled_words_still_match(self):
+        response = self.client.get(reverse('library_suggest'), {'q': 'cyberad'}, HTTP_HX_REQUEST='true')
+        self.assertEqual([book['title'] for book in response.context['suggestions']['books']], ['The Cyberiad'])
+
+    def test_short_input_returns_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('library_suggest'), {'q': 'c'})
+        self.assertEqual(response.content.strip(), b'')
+        self.assertFalse(any('books_book' in query['sql'] for query in queries))
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class AuthorSuggestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author-reader', password='secret')
+        for name in ('Iain M. Banks', 'Isaac Asimov', 'Ian McEwan'):
+            Author.objects.create(user=cls.user, name=name)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_form_no_longer_embeds_every_author(self):
+        response = self.client.get(reverse('book_create'))
+        self.assertNotContains(response, 'Isaac Asimov')
+        self.assertContains(response, reverse('author_suggest'))
+
+    def test_prefix_suggestions_are_cached_until_an_author_is_added(self):
+        version = self.client.get(reverse('book_create')).context['author_suggestions_version']
+        params = {'q': 'i', 'v': version}
+        response = self.client.get(reverse('author_suggest'), params)
+        self.assertEqual(response.json()['names'], ['Iain M. Banks', 'Ian McEwan', 'Isaac Asimov'])
+        self.assertIn('immutable', response['Cache-Control'])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('author_suggest'), {'q': 'I ', 'v': version})
+        self.assertFalse(any('books_author' in query['sql'] for query in queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Author.objects.create(user=self.user, name='Iain Banks')
+        response = self.client.get(reverse('author_suggest'), {'q': 'iai', 'v': version})
+        self.assertEqual(response.json()['names'], ['Iain Banks', 'Iain M. Banks'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+
+class AuthorResolutionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('resolver', password='secret')
+        cls.author = Author.objects.create(user=cls.user, name='Ursula K. Le Guin')
+
+    def test_names_differing_in_case_and_spacing_share_an_author(self):
+        with self.assertNumQueries(1):
+            author = resolve_author(self.user, '  ursula k.  LE GUIN ')
+        self.assertEqual(author.pk, self.author.pk)
+        self.assertEqual(Author.objects.get(pk=self.author.pk).name, 'Ursula K. Le Guin')
+
+    def test_batch_resolution_creates_missing_authors_in_one_query(self):
+        with self.assertNumQueries(1):
+            authors = resolve_authors(self.user, ['Ursula K. Le Guin', 'N. K. Jemisin', 'n.k. jemisin', 'n. k. jemisin', ''])
+        self.assertEqual(authors['Ursula K. Le Guin'].pk, self.author.pk)
+        self.assertEqual(authors['N. K. Jemisin'].pk, authors['n. k. jemisin'].pk)
+        self.assertNotEqual(authors['N. K. Jemisin'].pk, authors['n.k. jemisin'].pk)
+        self.assertEqual(Author.objects.filter(user=self.user).count(), 3)
+
+    def test_duplicate_spellings_are_rejected_by_the_database(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Author.objects.create(user=self.user, name='URSULA K. LE GUIN')
+
+
+GOODREADS_EXPORT = """Book Id,Title,Author,Author l-f,My Rating,Year Published,Original Publication Year,Date Read,Bookshelves,Exclusive Shelf
+1,The Left Hand of Darkness,Ursula K. Le Guin,"Le Guin, Ursula K.",5,2000,1969,2023/04/02,"sci-fi, classics",read
+2,The Dispossessed,ursula k. le guin,"Le Guin, Ursula K.",0,1994,1974,,"sci-fi, to-read",to-read
+3,Kindred,Octavia E. Butler,"Butler, Octavia E.",4,2003,1979,,currently-reading,currently-reading
+4,   ,Nobody,,0,,,,,read
+"""
+
+
+@override_settings(STORAGES=TEST_STORAGES, MEDIA_ROOT=MEDIA_ROOT)
+class LibraryImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('importer', password='secret')
+
+    def test_goodreads_export_is_imported_in_batches(self):
+        totals = import_library(self.user, io.StringIO(GOODREADS_EXPORT), chunk_size=2)
+        self.assertEqual((totals['rows'], totals['created'], totals['skipped']), (3, 3, 0))
+
+        left_hand = Book.objects.get(title='The Left Hand of Darkness')
+        self.assertEqual(left_hand.status, 'FINISHED')
+        self.assertEqual(left_hand.overall_rating, 5)
+        self.assertEqual(left_hand.publication_year, 1969)
+        self.assertEqual(str(left_hand.finished_at), '2023-04-02')
+        self.assertEqual(sorted(left_hand.tags.values_list('name', flat=True)), ['classics', 'sci-fi'])
+
+        dispossessed = Book.objects.get(title='The Dispossessed')
+        self.assertEqual((dispossessed.status, dispossessed.overall_rating), ('TO_READ', None))
+        self.assertEqual(dispossessed.author_id, left_hand.author_id)
+        self.assertEqual(list(dispossessed.tags.values_list('name', flat=True)), ['sci-fi'])
+        self.assertEqual(Book.objects.get(title='Kindred').status, 'READING')
+
+        # Search vectors are filled although bulk_create skips signals
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('library'), {'q': 'octavia'})
+        self.assertEqual([book.title for book in response.context['books']], ['Kindred'])
+
+        totals = import_library(self.user, io.StringIO(GOODREADS_EXPORT))
+        self.assertEqual((totals['created'], totals['skipped']), (0, 3))
+
+    def test_query_count_depends_on_chunks_not_rows(self):
+        header, *rows = GOODREADS_EXPORT.splitlines()[:4]
+        with CaptureQueriesContext(connection) as small:
+            import_library(self.user, io.StringIO('\n'.join([header, rows[0]])), chunk_size=100)
+        Book.objects.all().delete()
+        with CaptureQueriesContext(connection) as large:
+            import_library(self.user, io.StringIO('\n'.join([header, *rows])), chunk_size=100)
+        self.assertEqual(len(large), len(small))
+
+    def test_upload_queues_a_background_import(self):
+        self.client.force_login(self.user)
+        export = SimpleUploadedFile('goodreads_library_export.csv', GOODREADS_EXPORT.encode('utf-8-sig'))
+        response = self.client.post(reverse('library_import'), {'export': export})
+        self.assertRedirects(response, reverse('library'))
+
+        job = Job.objects.get(task='books.importer.import_library_file')
+        call_command('run_jobs', workers=0, burst=True, stdout=io.StringIO(), stderr=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'DONE')
+        self.assertEqual(Book.objects.filter(user=self.user).count(), 3)
+        self.assertFalse(default_storage.exists(job.payload['name']))
+
+    def test_upload_rejects_other_csv_files(self):
+        self.client.force_login(self.user)
+        export = SimpleUploadedFile('books.csv', b'name,year\nDune,1965\n')
+        response = self.client.post(reverse('library_import'), {'export': export})
+        self.assertContains(response, 'Expected a Goodreads or StoryGraph CSV export')
+        self.assertFalse(Job.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, STORAGES=TEST_STORAGES)
+class LibraryExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('exporter', password='secret')
+        cls.other = User.objects.create_user('restorer', password='secret')
+        tag = Tag.objects.create(user=cls.user, name='anarchism')
+        cls.book = Book.objects.create(
+            user=cls.user, title='The Dispossessed', author=resolve_author(cls.user, 'Ursula K. Le Guin'),
+            status='FINISHED', overall_rating=5,
+        )
+        cls.book.tags.add(tag)
+        Note.objects.create(user=cls.user, book=cls.book, title='Walls', body='Both sides of the wall.')
+        quote = Quote.objects.create(user=cls.user, book=cls.book, quote_text='You cannot buy the revolution.')
+        quote.tags.add(tag)
+        cls.book_file = BookFile.objects.create(
+            book=cls.book, file_type='SUMMARY', file=SimpleUploadedFile('summary.txt', b'Anarres and Urras'),
+        )
+
+    def _download(self, **params):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('library_export'), params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_zip_holds_records_and_files(self):
+        archive = zipfile.ZipFile(io.BytesIO(self._download()))
+        path = f'files/{self.book_file.blob_id}.txt'
+        self.assertEqual(archive.read(path), b'Anarres and Urras')
+        types = [json.loads(line)['type'] for line in archive.read('library.jsonl').splitlines()]
+        self.assertEqual(types, ['export', 'tag', 'book', 'book_tag', 'note', 'quote', 'quote_tag', 'file'])
+
+        # With the original gone, the file is restored from the archive
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.delete()
+        self.assertFalse(FileBlob.objects.exists())
+        path = os.path.join(MEDIA_ROOT, 'export.zip')
+        archive.fp.seek(0)
+        with open(path, 'wb') as fh:
+            fh.write(archive.fp.read())
+        with self.captureOnCommitCallbacks(execute=True):
+            restore_library(self.other, path)
+        book_file = BookFile.objects.get(book__user=self.other)
+        self.assertEqual(book_file.blob_id, self.book_file.blob_id)
+        self.assertEqual(book_file.file.read(), b'Anarres and Urras')
+
+    def test_files_gone_from_storage_are_listed_instead(self):
+        lost = BookFile.objects.create(
+            book=self.book, file_type='OTHER', file=SimpleUploadedFile('lost.txt', b'Shevek on Urras'),
+        )
+        default_storage.delete(lost.file.name)
+
+        archive = zipfile.ZipFile(io.BytesIO(self._download()))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.read(f'files/{self.book_file.blob_id}.txt'), b'Anarres and Urras')
+        records = [json.loads(line) for line in archive.read('library.jsonl').splitlines()]
+        missing = {'type': 'missing_file', 'path': f'files/{lost.blob_id}.txt'}
+        self.assertEqual(records[-1], missing)
+        self.assertNotIn(missing['path'], archive.namelist())
+
+        path = os.path.join(MEDIA_ROOT, 'partial.zip')
+        archive.fp.seek(0)
+        with open(path, 'wb') as fh:
+            fh.write(archive.fp.read())
+        with self.captureOnCommitCallbacks(execute=True):
+            counts = restore_library(self.other, path)
+        self.assertEqual(counts['missing_file'], 1)
+
+    def test_export_restores_into_another_library(self):
+        path = os.path.join(MEDIA_ROOT, 'export.jsonl')
+        with open(path, 'wb') as fh:
+            fh.write(self._download(format='jsonl'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            counts = restore_library(self.other, path)
+        self.assertEqual(counts['book'], 1)
+
+        book = Book.objects.get(user=self.other)
+        self.assertEqual((book.title, book.author.name, book.status), ('The Dispossessed', 'Ursula K. Le Guin', 'FINISHED'))
+        self.assertEqual(book.created_at, self.book.created_at)
+        self.assertEqual(list(book.tags.values_list('name', flat=True)), ['anarchism'])
+        self.assertEqual(book.notes.get().body, 'Both sides of the wall.')
+        self.assertEqual(list(book.quotes.get().tags.values_list('user', flat=True)), [self.other.pk])
+        # The content is still stored, so the JSON Lines export restores the file too
+        self.assertEqual(book.files.get().blob_id, self.book_file.blob_id)
+        self.assertTrue(Book.objects.filter(user=self.other, search_vector='revolution').exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, STORAGES=TEST_STORAGES)
+class LibraryBulkActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('curator', password='secret')
+        cls.other = User.objects.create_user('stranger', password='secret')
+        cls.tag = Tag.objects.create(user=cls.user, name='favourites')
+        cls.books = [Book.objects.create(user=cls.user, title=f'Book {i}', status='FINISHED') for i in range(3)]
+        cls.foreign = Book.objects.create(user=cls.other, title='Not yours', status='READING')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _post(self, action, books, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('library_bulk'), {
+                'action': action, 'book': [book.pk for book in books], 'next': '/?status=FINISHED', **data,
+            })
+
+    def test_status_change_is_one_update_scoped_to_the_owner(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._post('status', [*self.books, self.foreign], status='TO_READ')
+        self.assertRedirects(response, '/?status=FINISHED', fetch_redirect_response=False)
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries), 1)
+        self.assertEqual(Book.objects.filter(user=self.user, status='TO_READ').count(), 3)
+        self.assertEqual(Book.objects.get(pk=self.foreign.pk).status, 'READING')
+
+    def test_tags_are_added_and_removed_in_bulk(self):
+        self._post('add_tags', [*self.books, self.foreign], tags=[self.tag.pk])
+        self.assertEqual(self.tag.books.count(), 3)
+        self.assertFalse(self.foreign.tags.exists())
+
+        self._post('remove_tags', self.books[:2], tags=[self.tag.pk])
+        self.assertEqual(list(self.tag.books.all()), [self.books[2]])
+
+    def test_other_users_tags_are_rejected(self):
+        foreign_tag = Tag.objects.create(user=self.other, name='theirs')
+        self._post('add_tags', self.books, tags=[foreign_tag.pk])
+        self.assertFalse(Book.tags.through.objects.exists())
+
+    def test_delete_leaves_other_libraries_alone(self):
+        self._post('delete', [*self.books, self.foreign])
+        self.assertFalse(Book.objects.filter(user=self.user).exists())
+        self.assertTrue(Book.objects.filter(pk=self.foreign.pk).exists())
+
+    def test_delete_is_set_based_and_releases_unused_blobs(self):
+        def attach(book, content):
+            Note.objects.create(book=book, user=self.user, body='A note')
+            Quote.objects.create(book=book, user=self.user, quote_text='A quote').tags.add(self.tag)
+            return BookFile.objects.create(book=book, file=SimpleUploadedFile('file.txt', content))
+
+        attach(self.books[0], b'Only in the first book')
+        with CaptureQueriesContext(connection) as queries:
+            self._post('delete', self.books[:1])
+        baseline = len(queries)
+
+        own = attach(self.books[1], b'Only in the second book')
+        shared = attach(self.books[2], b'Shared with a kept book')
+        for _ in range(3):
+            attach(self.books[1], b'Only in the second book')
+        kept = Book.objects.create(user=self.user, title='Kept')
+        BookFile.objects.create(book=kept, file=SimpleUploadedFile('copy.txt', b'Shared with a kept book'))
+        with self.assertNumQueries(baseline):
+            self._post('delete', self.books[1:])
+
+        self.assertEqual(list(Book.objects.filter(user=self.user)), [kept])
+        self.assertFalse(Note.objects.exists() or Quote.objects.exists())
+        self.assertFalse(FileBlob.objects.filter(pk=own.blob_id).exists())
+        self.assertFalse(default_storage.exists(own.blob.file.name))
+        self.assertTrue(FileBlob.objects.filter(pk=shared.blob_id).exists())
+
+    def test_cached_cards_and_stats_are_invalidated(self):
+        self.client.get(reverse('library'))
+        self._post('add_tags', self.books, tags=[self.tag.pk])
+        response = self.client.get(reverse('library'))
+        self.assertContains(response, 'favourites', count=3 + 2)  # three cards, filter and bulk tag options
+        self._post('status', self.books, status='READING')
+        response = self.client.get(reverse('library'))
+        self.assertEqual(response.context['stats']['reading'], 3)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, STORAGES=TEST_STORAGES)
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_library('bench', books=40, quotes=200, notes=60, tags=12)
+
+    def test_seed_creates_a_skewed_library(self):
+        self.assertEqual(Book.objects.filter(user=self.user).count(), 40)
+        self.assertEqual(Quote.objects.filter(user=self.user).count(), 200)
+        self.assertEqual(Note.objects.filter(user=self.user).count(), 60)
+        uses = list(
+            Tag.objects.filter(user=self.user).annotate(uses=Count('books')).order_by('pk').values_list('uses', flat=True)
+        )
+        self.assertGreater(uses[0], uses[-1])
+        self.assertTrue(Book.objects.filter(user=self.user, search_vector__isnull=False).exists())
+
+    def test_run_records_queries_and_rows(self):
+        results = run_benchmarks(self.user, iterations=2, only='book tab')
+        self.assertEqual(set(results), {'book tab=notes', 'book tab=quotes', 'book tab=files'})
+        for result in results.values():
+            self.assertGreater(result['queries'], 0)
+            self.assertGreater(result['rows'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+
+    def test_regressions_are_reported(self):
+        before = {'library': {'p50_ms': 10.0, 'p95_ms': 20.0, 'queries': 4, 'rows': 100}}
+        noisy = {'library': {'p50_ms': 13.0, 'p95_ms': 24.0, 'queries': 4, 'rows': 110}}
+        self.assertEqual(compare_to_baseline(noisy, before), [])
+        slower = {'library': {'p50_ms': 10.0, 'p95_ms': 40.0, 'queries': 5, 'rows': 100}}
+        self.assertEqual(compare_to_baseline(slower, before), [
+            'library: 4 -> 5 queries', 'library: p95_ms 20.0 -> 40.0',
+        ])
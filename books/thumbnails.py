@@ -0,0 +1,75 @@
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .fragments import bump_card_versions
+from .models import Book
+
+# Cards and the detail page display covers at most 320 CSS pixels wide;
+# the larger rendition covers 2x displays.
+COVER_WIDTHS = (320, 640)
+# Extension -> (Pillow format, save options)
+COVER_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def rendition_name(cover_name, width, ext):
+    """
+    Storage name of a cover rendition, stored in a thumbs/ folder next to the
+    cover. The cover's full filename is kept, since storage only keeps that
+    unique: cover.jpg and cover.png must not share renditions.
+    """
+    folder, filename = posixpath.split(cover_name)
+    return posixpath.join(folder, 'thumbs', f'{filename}-{width}w.{ext}')
+
+
+def generate_cover_renditions(cover_name, storage=default_storage):
+    """
+    Write WebP and JPEG renditions of a cover and return their pixel widths.
+
+    Covers narrower than a target width are never upscaled; the original
+    width is used instead, so the result may contain fewer widths.
+    """
+    with storage.open(cover_name, 'rb') as fh:
+        image = Image.open(fh)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    widths = sorted({min(width, image.width) for width in COVER_WIDTHS})
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        for ext, (fmt, options) in COVER_FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, fmt, **options)
+            name = rendition_name(cover_name, width, ext)
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(buffer.getvalue()))
+    return widths
+
+
+def delete_cover_renditions(cover_name, widths, storage=default_storage):
+    for width in widths:
+        for ext in COVER_FORMATS:
+            storage.delete(rendition_name(cover_name, width, ext))
+
+
+def update_cover_thumbnails(book, previous_cover='', previous_widths=()):
+    """Regenerate renditions after a cover upload and drop the previous cover's ones"""
+    if previous_cover and previous_widths:
+        delete_cover_renditions(previous_cover, previous_widths)
+
+    widths = generate_cover_renditions(book.cover_image.name) if book.cover_image else []
+    # Bypass save() so updated_at and the save signals are left alone
+    Book.objects.filter(pk=book.pk).update(cover_thumbnails=widths)
+    book.cover_thumbnails = widths
+    bump_card_versions([book.pk])
+    return widths
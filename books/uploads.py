@@ -0,0 +1,143 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .blobs import adopt_blob
+from .models import BookFile, UploadSession
+
+# Largest chunk accepted by a single append request; clients may send less
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+READ_SIZE = 64 * 1024
+CONTENT_RANGE_PATTERN = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadError(Exception):
+    """A chunk or finalize request that does not fit the upload session"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_content_range(header):
+    """(start, end, total) of a `Content-Range: bytes start-end/total` header"""
+    match = CONTENT_RANGE_PATTERN.match((header or '').strip())
+    if not match:
+        raise UploadError("A 'Content-Range: bytes start-end/total' header is required")
+    start, end, total = (int(value) for value in match.groups())
+    if end < start:
+        raise UploadError("Invalid Content-Range")
+    return start, end, total
+
+
+def file_sha256(storage, name):
+    """Hex SHA-256 of a stored file, read in small blocks"""
+    digest = hashlib.sha256()
+    with storage.open(name, 'rb') as fh:
+        for block in iter(lambda: fh.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def start_upload(user, book, filename, size, file_type='OTHER', mime_type='', sha256=''):
+    """Reserve a storage name for an upload and open a session for it"""
+    if size > settings.MAX_UPLOAD_SIZE:
+        raise UploadError(f"Files may not exceed {settings.MAX_UPLOAD_SIZE} bytes", status=413)
+    session_id = uuid.uuid4()
+    ext = os.path.splitext(filename)[1].lower()
+    # Saving an empty file claims the name; chunks are then written into it.
+    # At finalize it is moved into the blob store (or dropped as a duplicate).
+    name = default_storage.save(f'uploads/{user.id}/{session_id}{ext}', ContentFile(b''))
+    return UploadSession.objects.create(
+        id=session_id,
+        user=user,
+        book=book,
+        file_type=file_type,
+        file_name=name,
+        original_filename=filename,
+        mime_type=mime_type,
+        size=size,
+        sha256=sha256.lower(),
+    )
+
+
+def append_chunk(session, start, stream, length):
+    """
+    Write `length` bytes from `stream` at offset `start` of the upload.
+
+    The session must be locked (select_for_update) by the caller. Chunks are
+    written in place, so this needs storage backed by the local filesystem.
+    """
+    if start != session.received:
+        raise UploadError(f"Expected a chunk starting at byte {session.received}", status=409)
+    if length > UPLOAD_CHUNK_SIZE:
+        raise UploadError(f"Chunks may not exceed {UPLOAD_CHUNK_SIZE} bytes", status=413)
+    if start + length > session.size:
+        raise UploadError("Chunk goes past the announced file size")
+
+    written = 0
+    with open(default_storage.path(session.file_name), 'r+b') as fh:
+        fh.seek(start)
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            fh.write(data)
+            written += len(data)
+    if written != length:
+        # The offset is left untouched, so the client can resend the chunk
+        raise UploadError("Chunk body is shorter than its Content-Range")
+
+    session.received += written
+    session.save(update_fields=['received', 'updated_at'])
+    return session
+
+
+def discard_upload(session):
+    """Abort an upload and delete what was written so far"""
+    default_storage.delete(session.file_name)
+    session.delete()
+
+
+def finalize_upload(session):
+    """
+    Verify the assembled file and turn the session into a BookFile.
+
+    The session row is locked for the whole check, so a concurrent chunk
+    or a second finalize of the same upload waits, then sees the result.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().filter(pk=session.pk).first()
+        if session is None:
+            raise UploadError("Upload not found; it may already be finalized", status=404)
+        if session.received != session.size:
+            raise UploadError(
+                f"Upload incomplete: {session.received} of {session.size} bytes received", status=409
+            )
+
+        digest = file_sha256(default_storage, session.file_name)
+        if session.sha256 and digest != session.sha256:
+            # Committed before the error is raised, below
+            discard_upload(session)
+            book_file = None
+        else:
+            # The bytes are already in storage, so they are moved, never copied
+            blob = adopt_blob(session.file_name, digest, session.size)
+            book_file = BookFile.objects.create(
+                book=session.book,
+                blob=blob,
+                file=blob.file.name,
+                file_type=session.file_type,
+                original_filename=session.original_filename,
+                mime_type=session.mime_type,
+            )
+            session.delete()
+    if book_file is None:
+        raise UploadError("Checksum mismatch; the upload was discarded", status=422)
+    return book_file, digest
@@ -4,17 +4,29 @@ from . import views
 urlpatterns = [
     # Library/Dashboard
     path('', views.library_view, name='library'),
+    path('suggest/', views.library_suggest, name='library_suggest'),
+    path('import/', views.library_import, name='library_import'),
+    path('export/', views.library_export, name='library_export'),
+    path('bulk/', views.library_bulk, name='library_bulk'),
 
     # Book CRUD
     path('book/create/', views.book_create, name='book_create'),
     path('book/<int:pk>/', views.book_detail, name='book_detail'),
     path('book/<int:pk>/edit/', views.book_edit, name='book_edit'),
     path('book/<int:pk>/delete/', views.book_delete, name='book_delete'),
+    path('book/<int:pk>/tab/<str:tab>/', views.book_tab, name='book_tab'),
+    path('authors/suggest/', views.author_suggest, name='author_suggest'),
 
     # Book file operations
     path('book/<int:book_id>/file/upload/', views.book_file_upload, name='book_file_upload'),
     path('file/<int:pk>/delete/', views.book_file_delete, name='book_file_delete'),
     path('file/<int:pk>/view/', views.book_file_view, name='book_file_view'),
+    path('file/<int:pk>/raw/', views.book_file_raw, name='book_file_raw'),
+
+    # Chunked, resumable uploads for large files
+    path('book/<int:book_id>/uploads/', views.upload_start, name='upload_start'),
+    path('uploads/<uuid:upload_id>/', views.upload_session, name='upload_session'),
+    path('uploads/<uuid:upload_id>/finalize/', views.upload_finalize, name='upload_finalize'),
 
     # Note operations
     path('book/<int:book_id>/note/create/', views.note_create, name='note_create'),
@@ -1,41 +1,64 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Count
-from django.http import FileResponse, HttpResponseForbidden, Http404, HttpResponse
-from .models import Book, BookFile, Author
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.http import (
+    HttpResponseBadRequest, HttpResponseForbidden, Http404, HttpResponse, JsonResponse, StreamingHttpResponse,
+)
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_http_methods, require_POST
+from .models import Book, BookFile, BookFileText, UploadSession
 from notes.models import Note
 from quotes.models import Quote
 from core.models import Tag
-from .forms import BookForm, BookFileForm, NoteForm, QuoteForm
+from core.conditional import conditional_on_library
+from core.jobs import enqueue
+from core.pagination import InvalidCursor, KeysetPaginator
+from core.search import build_search_query, search_rank
+from .authors import author_suggestions, author_suggestions_version
+from .autocomplete import suggest
+from .backup import export_jsonl, export_zip
+from .bulk import add_tags, delete_books, remove_tags, set_status
+from .downloads import INLINE_CONTENT_TYPES, serve_file
+from .fragments import attach_card_versions
+from .panels import PANELS, load_panel, panel_template, render_panel_change
+from .stats import library_stats
+from .thumbnails import update_cover_thumbnails
+from .uploads import (
+    UPLOAD_CHUNK_SIZE, UploadError, append_chunk, discard_upload, finalize_upload, parse_content_range, start_upload,
+)
+from .forms import BookForm, BookFileForm, BulkBookActionForm, LibraryImportForm, NoteForm, QuoteForm
 import mimetypes
 import json
 import os
+import uuid
 
+BOOKS_PER_PAGE = 24
+# Author suggestion URLs carry the list version, so a year is safe
+AUTHOR_SUGGESTION_MAX_AGE = 60 * 60 * 24 * 365
 
-def _author_suggestions(user):
-    return list(
-        Author.objects.filter(user=user)
-        .order_by('name')
-        .values_list('name', flat=True)
-    )
+
+def _guess_file_type(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.pdf':
+        return 'SOURCE_PDF'
+    if ext == '.epub':
+        return 'SOURCE_EPUB'
+    return 'OTHER'
 
 
 def _handle_file_uploads(book, request):
     """Attach uploaded ebook and supporting files to the given book."""
     book_file = request.FILES.get('book_file')
     if book_file:
-        ext = os.path.splitext(book_file.name)[1].lower()
-        if ext == '.pdf':
-            file_type = 'SOURCE_PDF'
-        elif ext == '.epub':
-            file_type = 'SOURCE_EPUB'
-        else:
-            file_type = 'OTHER'
-
         BookFile.objects.create(
             book=book,
-            file_type=file_type,
+            file_type=_guess_file_type(book_file.name),
             file=book_file,
             original_filename=book_file.name,
             mime_type=mimetypes.guess_type(book_file.name)[0] or ''
@@ -51,21 +74,24 @@ def _handle_file_uploads(book, request):
         )
 
 
+@conditional_on_library
 @login_required
 def library_view(request):
     """Main library/dashboard view with filters and search"""
     books = (
         Book.objects.filter(user=request.user)
         .select_related('user', 'author')
-        .prefetch_related('tags', 'files')
+        .prefetch_related('tags')
+        .defer('search_vector')
+        .with_counts()
     )
 
     # Get filter parameters
     status_filter = request.GET.get('status', '')
     tag_filter = request.GET.get('tag', '')
     rating_filter = request.GET.get('rating', '')
-    search_query = request.GET.get('q', '')
-    sort_by = request.GET.get('sort', '-updated_at')
+    search_query = request.GET.get('q', '').strip()
+    sort_by = request.GET.get('sort', 'relevance' if search_query else '-updated_at')
     if sort_by == 'author':
         sort_by = 'author__name'
 
@@ -81,37 +107,38 @@ def library_view(request):
     if rating_filter:
         books = books.filter(overall_rating__gte=float(rating_filter))
 
-    # Apply search query
+    # Apply search query against the stored search vector, and the text
+    # extracted from the book's PDF/EPUB files (books.extraction)
     if search_query:
-        books = books.filter(
-            Q(title__icontains=search_query) |
-            Q(author__name__icontains=search_query) |
-            Q(notes__body__icontains=search_query) |
-            Q(quotes__quote_text__icontains=search_query)
-        ).distinct()
+        query = build_search_query(search_query)
+        in_files = BookFileText.objects.filter(book_file__book=OuterRef('pk'), search_vector=query)
+        books = books.filter(Q(search_vector=query) | Exists(in_files)).annotate(rank=search_rank(query))
 
     # Apply sorting
     valid_sort_fields = ['-updated_at', '-created_at', 'title', 'author__name', '-overall_rating', '-finished_at']
-    if sort_by in valid_sort_fields:
-        books = books.order_by(sort_by)
+    if sort_by == 'relevance' and search_query:
+        ordering = ['-rank', '-updated_at']
+    elif sort_by in valid_sort_fields:
+        ordering = [sort_by]
     else:
-        books = books.order_by('-updated_at')
+        ordering = ['-updated_at']
 
-    # Get all tags for the filter dropdown
-    user_tags = Tag.objects.filter(user=request.user).annotate(book_count=Count('books'))
+    # Keyset pagination: each page seeks past the last card of the previous one
+    cursor = request.GET.get('cursor')
+    try:
+        page = KeysetPaginator(books, ordering, per_page=BOOKS_PER_PAGE).page(cursor)
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor.")
 
-    # Get statistics
-    stats = {
-        'total': Book.objects.filter(user=request.user).count(),
-        'reading': Book.objects.filter(user=request.user, status='READING').count(),
-        'finished': Book.objects.filter(user=request.user, status='FINISHED').count(),
-        'to_read': Book.objects.filter(user=request.user, status='TO_READ').count(),
-    }
+    attach_card_versions(page.object_list)
+
+    # Infinite scroll only needs the next batch of cards
+    if cursor and request.htmx:
+        return render(request, 'books/partials/book_cards.html', {'books': page.object_list, 'page': page})
 
     context = {
-        'books': books,
-        'tags': user_tags,
-        'stats': stats,
+        'books': page.object_list,
+        'page': page,
         'current_status': status_filter,
         'current_tag': tag_filter,
         'current_rating': rating_filter,
@@ -123,9 +150,106 @@ def library_view(request):
     if request.htmx:
         return render(request, 'books/partials/book_list.html', context)
 
+    # Tags dropdown and statistics are only shown on the full page
+    context['tags'] = Tag.objects.filter(user=request.user).annotate(book_count=Count('books'))
+    context['stats'] = library_stats(request.user)
+    context['status_choices'] = Book.STATUS_CHOICES
+
     return render(request, 'books/library.html', context)
 
 
+@conditional_on_library
+@login_required
+def library_suggest(request):
+    """Search-as-you-type suggestions for the library search box"""
+    context = {'suggestions': suggest(request.user, request.GET.get('q', ''))}
+    return render(request, 'books/partials/search_suggestions.html', context)
+
+
+@login_required
+def author_suggest(request):
+    """
+    JSON author names starting with `q`. The form passes the current author
+    list version as `v`, so matching responses can be cached by the browser
+    until an author is added.
+    """
+    version = author_suggestions_version(request.user.pk)
+    response = JsonResponse({'names': author_suggestions(request.user, request.GET.get('q', ''))})
+    if request.GET.get('v') == str(version):
+        patch_cache_control(response, private=True, max_age=AUTHOR_SUGGESTION_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+@require_POST
+def library_bulk(request):
+    """Apply one action to the books selected in the library grid"""
+    form = BulkBookActionForm(request.POST, user=request.user)
+    if form.is_valid():
+        action = form.cleaned_data['action']
+        book_ids = form.cleaned_data['book']
+        tags = form.cleaned_data['tags']
+        if action == 'status':
+            count = set_status(request.user, book_ids, form.cleaned_data['status'])
+            messages.success(request, f'Updated the status of {count} book(s).')
+        elif action == 'add_tags':
+            count = add_tags(request.user, book_ids, tags)
+            messages.success(request, f'Tagged {count} book(s).')
+        elif action == 'remove_tags':
+            count = remove_tags(request.user, book_ids, tags)
+            messages.success(request, f'Removed tags from {count} book(s).')
+        else:
+            count = delete_books(request.user, book_ids)
+            messages.success(request, f'Deleted {count} book(s).')
+    else:
+        errors = [error for field_errors in form.errors.values() for error in field_errors]
+        messages.error(request, ' '.join(errors))
+
+    # Back to the same filtered view of the library
+    next_url = request.POST.get('next', '')
+    if url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
+    return redirect('library')
+
+
+@login_required
+def library_import(request):
+    """Upload a Goodreads/StoryGraph export to be imported in the background"""
+    if request.method == 'POST':
+        form = LibraryImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            name = default_storage.save(f'imports/{request.user.pk}/{uuid.uuid4()}.csv', form.cleaned_data['export'])
+            enqueue('books.importer.import_library_file', user_id=request.user.pk, name=name)
+            messages.success(request, 'Import started. Your books will appear in the library shortly.')
+            return redirect('library')
+    else:
+        form = LibraryImportForm()
+
+    return render(request, 'books/library_import.html', {'form': form})
+
+
+@login_required
+def library_export(request):
+    """
+    Download the whole library, streamed as it is read: a zip with
+    library.jsonl and the attached files, or JSON Lines alone with
+    `?format=jsonl`. `?files=0` leaves the files out of the zip.
+    """
+    stamp = timezone.now().strftime('%Y%m%d')
+    if request.GET.get('format') == 'jsonl':
+        response = StreamingHttpResponse(export_jsonl(request.user), content_type='application/x-ndjson')
+        filename = f'mindfolio-{stamp}.jsonl'
+    else:
+        include_files = request.GET.get('files') != '0'
+        response = StreamingHttpResponse(export_zip(request.user, include_files), content_type='application/zip')
+        filename = f'mindfolio-{stamp}.zip'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
+
 @login_required
 def book_create(request):
     """Create a new book"""
@@ -136,6 +260,8 @@ def book_create(request):
             book.user = request.user
             book.save()
             form.save_m2m()  # Save many-to-many relationships
+            if book.cover_image:
+                update_cover_thumbnails(book)
             _handle_file_uploads(book, request)
             messages.success(request, f'Book "{book.title}" created successfully!')
             if request.htmx:
@@ -152,7 +278,7 @@ def book_create(request):
         'form': form,
         'action': 'Create',
         'book': None,
-        'author_suggestions': _author_suggestions(request.user),
+        'author_suggestions_version': author_suggestions_version(request.user.pk),
     }
 
     if request.htmx:
@@ -165,11 +291,14 @@ def book_create(request):
 def book_edit(request, pk):
     """Edit an existing book"""
     book = get_object_or_404(Book, pk=pk, user=request.user)
+    previous_cover, previous_thumbnails = book.cover_image.name, book.cover_thumbnails
 
     if request.method == 'POST':
         form = BookForm(request.POST, request.FILES, instance=book, user=request.user)
         if form.is_valid():
             book = form.save()
+            if 'cover_image' in form.changed_data:
+                update_cover_thumbnails(book, previous_cover, previous_thumbnails)
             _handle_file_uploads(book, request)
             messages.success(request, f'Book "{book.title}" updated successfully!')
             return redirect('book_detail', pk=book.pk)
@@ -180,7 +309,7 @@ def book_edit(request, pk):
         'form': form,
         'action': 'Edit',
         'book': book,
-        'author_suggestions': _author_suggestions(request.user),
+        'author_suggestions_version': author_suggestions_version(request.user.pk),
     }
 
     return render(request, 'books/book_form.html', context)
@@ -189,7 +318,7 @@ def book_edit(request, pk):
 @login_required
 def book_delete(request, pk):
     """Delete a book"""
-    book = get_object_or_404(Book, pk=pk, user=request.user)
+    book = get_object_or_404(Book.objects.with_counts(), pk=pk, user=request.user)
 
     if request.method == 'POST':
         title = book.title
@@ -203,26 +332,50 @@ def book_delete(request, pk):
 @login_required
 def book_detail(request, pk):
     """Book detail view with tabs for overview, notes, quotes, and files"""
+    # Tab contents are fetched by book_tab when each tab is first shown
     book = get_object_or_404(
-        Book.objects.select_related('user')
-        .prefetch_related('tags', 'notes', 'quotes__tags', 'files'),
+        Book.objects.select_related('user', 'author')
+        .prefetch_related('tags')
+        .defer('search_vector')
+        .with_counts(),
         pk=pk,
         user=request.user
     )
 
     # Get the active tab from query params, default to 'notes'
     active_tab = request.GET.get('tab', 'notes')
-    if active_tab not in {'notes', 'quotes', 'files'}:
+    if active_tab not in PANELS:
         active_tab = 'notes'
 
     context = {
         'book': book,
         'active_tab': active_tab,
+        'note_form': NoteForm(),
+        'quote_form': QuoteForm(user=request.user),
+        'file_form': BookFileForm(),
     }
 
     return render(request, 'books/book_detail.html', context)
 
 
+@login_required
+def book_tab(request, pk, tab):
+    """One page of a book detail tab (notes, quotes or files), loaded by HTMX"""
+    book = get_object_or_404(Book.objects.defer('search_vector'), pk=pk, user=request.user)
+    if tab not in PANELS:
+        raise Http404("Unknown tab")
+    if not request.htmx:
+        return redirect(f"{reverse('book_detail', args=[book.pk])}?tab={tab}")
+
+    cursor = request.GET.get('cursor')
+    try:
+        context = load_panel(book, tab, cursor)
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor")
+
+    return render(request, panel_template(tab, 'items' if cursor else 'list'), context)
+
+
 @login_required
 def book_file_upload(request, book_id):
     """Upload a file for a book"""
@@ -237,22 +390,100 @@ def book_file_upload(request, book_id):
             messages.success(request, 'File uploaded successfully!')
 
             if request.htmx:
-                # Return the updated files list
-                context = {'book': book}
-                return render(request, 'books/partials/file_list.html', context)
+                return render_panel_change(request, book, 'files', 'created', book_file.pk, form=BookFileForm())
 
             return redirect('book_detail', pk=book.pk)
     else:
         form = BookFileForm()
 
-    context = {'form': form, 'book': book}
+    context = {'form': form, 'book': book, 'upload_chunk_size': UPLOAD_CHUNK_SIZE}
 
     if request.htmx:
-        return render(request, 'books/partials/file_upload_form.html', context)
+        return render(request, panel_template('files', 'form'), context, status=422 if form.errors else 200)
 
     return render(request, 'books/book_file_upload.html', context)
 
 
+@login_required
+@require_POST
+def upload_start(request, book_id):
+    """Open a chunked upload session for a large file"""
+    book = get_object_or_404(Book, pk=book_id, user=request.user)
+    filename = os.path.basename(request.POST.get('filename', '').strip())
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        size = -1
+    if not filename or size < 0:
+        return JsonResponse({'error': 'filename and size are required'}, status=400)
+
+    file_type = request.POST.get('file_type') or _guess_file_type(filename)
+    if file_type not in dict(BookFile.FILE_TYPE_CHOICES):
+        return JsonResponse({'error': f'Unknown file type {file_type!r}'}, status=400)
+
+    try:
+        session = start_upload(
+            request.user, book, filename, size,
+            file_type=file_type,
+            mime_type=mimetypes.guess_type(filename)[0] or '',
+            sha256=request.POST.get('sha256', ''),
+        )
+    except UploadError as exc:
+        return JsonResponse({'error': str(exc)}, status=exc.status)
+    return JsonResponse(
+        {'upload_id': str(session.pk), 'offset': 0, 'chunk_size': UPLOAD_CHUNK_SIZE},
+        status=201,
+    )
+
+
+@login_required
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+def upload_session(request, upload_id):
+    """
+    GET reports how many bytes arrived (to resume), PUT appends one chunk
+    described by its Content-Range header, DELETE aborts the upload.
+    """
+    if request.method == 'PUT':
+        try:
+            start, end, total = parse_content_range(request.headers.get('Content-Range'))
+            with transaction.atomic():
+                session = get_object_or_404(
+                    UploadSession.objects.select_for_update(), pk=upload_id, user=request.user
+                )
+                if total != session.size:
+                    raise UploadError("Content-Range total does not match the upload size")
+                append_chunk(session, start, request, end - start + 1)
+        except UploadError as exc:
+            offset = (
+                UploadSession.objects.filter(pk=upload_id, user=request.user)
+                .values_list('received', flat=True).first()
+            )
+            return JsonResponse({'error': str(exc), 'offset': offset}, status=exc.status)
+        return JsonResponse({'offset': session.received, 'size': session.size})
+
+    if request.method == 'DELETE':
+        with transaction.atomic():
+            # Waits for a chunk or finalize in progress
+            session = get_object_or_404(UploadSession.objects.select_for_update(), pk=upload_id, user=request.user)
+            discard_upload(session)
+        return HttpResponse(status=204)
+    session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    return JsonResponse({'offset': session.received, 'size': session.size})
+
+
+@login_required
+@require_POST
+def upload_finalize(request, upload_id):
+    """Check the assembled file and create its BookFile"""
+    session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    try:
+        book_file, digest = finalize_upload(session)
+    except UploadError as exc:
+        return JsonResponse({'error': str(exc)}, status=exc.status)
+    messages.success(request, 'File uploaded successfully!')
+    return JsonResponse({'id': book_file.pk, 'sha256': digest}, status=201)
+
+
 @login_required
 def book_file_delete(request, pk):
     """Delete a book file"""
@@ -264,8 +495,7 @@ def book_file_delete(request, pk):
         messages.success(request, 'File deleted successfully!')
 
         if request.htmx:
-            context = {'book': book}
-            return render(request, 'books/partials/file_list.html', context)
+            return render_panel_change(request, book, 'files', 'deleted', pk)
 
         return redirect('book_detail', pk=book.pk)
 
@@ -290,11 +520,35 @@ def book_file_view(request, pk):
         if content_type == 'application/pdf':
             return render(request, 'books/pdf_viewer.html', {'book_file': book_file, 'book': book_file.book})
         else:
-            response = FileResponse(book_file.file.open('rb'), content_type=content_type)
-            response['Content-Disposition'] = f'attachment; filename="{book_file.original_filename}"'
-            return response
+            return serve_file(
+                request, book_file.file, content_type=content_type, filename=book_file.original_filename,
+                etag=book_file.blob_id,
+            )
+    except FileNotFoundError:
+        raise Http404("File not found")
+
+
+@login_required
+def book_file_raw(request, pk):
+    """
+    Serve a book file inline, e.g. for byte-range requests from the PDF
+    viewer. The type comes from the upload, so only INLINE_CONTENT_TYPES
+    are shown inline, sandboxed; everything else is sent as a download.
+    """
+    book_file = get_object_or_404(BookFile, pk=pk, book__user=request.user)
+    content_type = book_file.mime_type or mimetypes.guess_type(book_file.file.name)[0] or 'application/octet-stream'
+    inline = content_type.split(';')[0].strip().lower() in INLINE_CONTENT_TYPES
+    try:
+        response = serve_file(
+            request, book_file.file, content_type=content_type,
+            filename=book_file.original_filename, as_attachment=not inline, etag=book_file.blob_id,
+        )
     except FileNotFoundError:
         raise Http404("File not found")
+    response['X-Content-Type-Options'] = 'nosniff'
+    if inline:
+        response['Content-Security-Policy'] = 'sandbox'
+    return response
 
 
 @login_required
@@ -312,8 +566,7 @@ def note_create(request, book_id):
             messages.success(request, 'Note created successfully!')
 
             if request.htmx:
-                context = {'book': book}
-                return render(request, 'books/partials/note_list.html', context)
+                return render_panel_change(request, book, 'notes', 'created', note.pk, form=NoteForm())
 
             return redirect('book_detail', pk=book.pk)
     else:
@@ -322,7 +575,7 @@ def note_create(request, book_id):
     context = {'form': form, 'book': book}
 
     if request.htmx:
-        return render(request, 'books/partials/note_form.html', context)
+        return render(request, panel_template('notes', 'form'), context, status=422 if form.errors else 200)
 
     return render(request, 'books/note_form.html', context)
 
@@ -340,8 +593,7 @@ def note_edit(request, pk):
             messages.success(request, 'Note updated successfully!')
 
             if request.htmx:
-                context = {'book': book}
-                return render(request, 'books/partials/note_list.html', context)
+                return render_panel_change(request, book, 'notes', 'updated', note.pk)
 
             return redirect('book_detail', pk=book.pk)
     else:
@@ -350,7 +602,7 @@ def note_edit(request, pk):
     context = {'form': form, 'note': note, 'book': book}
 
     if request.htmx:
-        return render(request, 'books/partials/note_form.html', context)
+        return render(request, panel_template('notes', 'form'), context, status=422 if form.errors else 200)
 
     return render(request, 'books/note_form.html', context)
 
@@ -366,8 +618,7 @@ def note_delete(request, pk):
         messages.success(request, 'Note deleted successfully!')
 
         if request.htmx:
-            context = {'book': book}
-            return render(request, 'books/partials/note_list.html', context)
+            return render_panel_change(request, book, 'notes', 'deleted', pk)
 
         return redirect('book_detail', pk=book.pk)
 
@@ -391,8 +642,7 @@ def quote_create(request, book_id):
             messages.success(request, 'Quote created successfully!')
 
             if request.htmx:
-                context = {'book': book}
-                return render(request, 'books/partials/quote_list.html', context)
+                return render_panel_change(request, book, 'quotes', 'created', quote.pk, form=QuoteForm(user=request.user))
 
             return redirect('book_detail', pk=book.pk)
     else:
@@ -401,7 +651,7 @@ def quote_create(request, book_id):
     context = {'form': form, 'book': book}
 
     if request.htmx:
-        return render(request, 'books/partials/quote_form.html', context)
+        return render(request, panel_template('quotes', 'form'), context, status=422 if form.errors else 200)
 
     return render(request, 'books/quote_form.html', context)
 
@@ -419,8 +669,7 @@ def quote_edit(request, pk):
             messages.success(request, 'Quote updated successfully!')
 
             if request.htmx:
-                context = {'book': book}
-                return render(request, 'books/partials/quote_list.html', context)
+                return render_panel_change(request, book, 'quotes', 'updated', quote.pk)
 
             return redirect('book_detail', pk=book.pk)
     else:
@@ -429,7 +678,7 @@ def quote_edit(request, pk):
     context = {'form': form, 'quote': quote, 'book': book}
 
     if request.htmx:
-        return render(request, 'books/partials/quote_form.html', context)
+        return render(request, panel_template('quotes', 'form'), context, status=422 if form.errors else 200)
 
     return render(request, 'books/quote_form.html', context)
 
@@ -445,8 +694,7 @@ def quote_delete(request, pk):
         messages.success(request, 'Quote deleted successfully!')
 
         if request.htmx:
-            context = {'book': book}
-            return render(request, 'books/partials/quote_list.html', context)
+            return render_panel_change(request, book, 'quotes', 'deleted', pk)
 
         return redirect('book_detail', pk=book.pk)
 
@@ -1,9 +1,59 @@
 from django.contrib import admin
-from .models import Tag
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import Job, RequestProfile, Tag
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = ['name', 'user', 'created_at']
+    list_select_related = ['user']
     list_filter = ['user', 'created_at']
     search_fields = ['name']
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['task', 'status', 'attempts', 'run_after', 'finished_at']
+    list_filter = ['status', 'task']
+    readonly_fields = ['locked_at', 'last_error', 'created_at', 'finished_at']
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ['path', 'view_name', 'user', 'trigger', 'status_code', 'duration_ms', 'sql_count', 'created_at']
+    list_select_related = ['user']
+    list_filter = ['trigger', 'view_name']
+    search_fields = ['path', 'user__username']
+    exclude = ['collapsed_stacks']
+    readonly_fields = [
+        'user', 'trigger', 'method', 'path', 'view_name', 'status_code', 'duration_ms', 'sql_count', 'sql_ms',
+        'created_at', 'flamegraph', 'stats', 'sql_log',
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/stacks/', self.admin_site.admin_view(self.download_stacks), name='core_requestprofile_stacks'),
+        ] + super().get_urls()
+
+    @admin.display(description='Flamegraph')
+    def flamegraph(self, obj):
+        return format_html(
+            '<a href="{}">Download collapsed stacks</a> (open in speedscope.app or feed to flamegraph.pl)',
+            reverse('admin:core_requestprofile_stacks', args=[obj.pk]),
+        )
+
+    def download_stacks(self, request, pk):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(profile.collapsed_stacks, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="profile-{profile.pk}.collapsed"'
+        return response
@@ -0,0 +1,61 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.messages.storage.session import SessionStorage
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
+
+from .versions import bump_version, current_version
+
+
+def library_version(user_id):
+    """Token that changes whenever anything in the user's library is written"""
+    return current_version('library', user_id)
+
+
+def bump_library_version(user_id):
+    """Invalidate the user's library pages once the transaction commits"""
+    bump_version('library', user_id)
+
+
+def library_etag(request, *args, **kwargs):
+    """
+    ETag of a library page: the user's library version, the normalized query
+    string and everything else the response depends on. Reads only the
+    session and the cache, so a matching request never reaches the database.
+    """
+    user_id = request.session.get(SESSION_KEY)
+    if user_id is None:
+        return None
+    # Pending flash messages are rendered (and consumed) by full pages
+    if CookieStorage.cookie_name in request.COOKIES or SessionStorage.session_key in request.session:
+        return None
+    query = sorted((key, value) for key, value in request.GET.items() if value)
+    parts = [
+        user_id,
+        library_version(user_id),
+        request.path,
+        query,
+        request.headers.get('HX-Request', ''),
+        # Full pages embed CSRF tokens, which must match the current secret
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ]
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+
+def conditional_on_library(view_func):
+    """
+    Answer GETs of a library page with 304 Not Modified while the client's
+    copy is current. Apply above login_required so the check runs first.
+    """
+    @wraps(view_func)
+    @cache_control(private=True, no_cache=True)
+    @vary_on_headers('HX-Request', 'Cookie')
+    @condition(etag_func=library_etag)
+    def wrapped(request, *args, **kwargs):
+        return view_func(request, *args, **kwargs)
+    return wrapped
@@ -0,0 +1,106 @@
+import threading
+import traceback
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+# While a job runs, its worker refreshes locked_at this often. A RUNNING job
+# not refreshed for STALE_AFTER lost its worker and is handed out again;
+# long jobs are not affected, however long they take.
+HEARTBEAT_INTERVAL = timedelta(seconds=30)
+STALE_AFTER = timedelta(minutes=5)
+# Failed attempts are retried after attempts * RETRY_DELAY
+RETRY_DELAY = timedelta(minutes=1)
+
+
+def enqueue(task, **payload):
+    """
+    Queue `task`, the dotted path of a function, to be called with `payload`
+    by a `run_jobs` worker. Inside a transaction the job only becomes
+    visible to workers once it commits.
+    """
+    return Job.objects.create(task=task, payload=payload)
+
+
+def claim_jobs(limit):
+    """
+    Mark up to `limit` due jobs RUNNING and return their ids. SKIP LOCKED
+    lets several runners poll the queue without handing out a job twice.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job_ids = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status='PENDING', run_after__lte=now)
+            .order_by('run_after', 'id')
+            .values_list('pk', flat=True)[:limit]
+        )
+        if job_ids:
+            Job.objects.filter(pk__in=job_ids).update(
+                status='RUNNING', locked_at=now, attempts=F('attempts') + 1,
+            )
+    return job_ids
+
+
+def requeue_stale_jobs():
+    """Put back jobs left RUNNING by a worker that died, or fail them when out of attempts"""
+    stale = Job.objects.filter(status='RUNNING', locked_at__lt=timezone.now() - STALE_AFTER)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='FAILED', locked_at=None, finished_at=timezone.now(), last_error='Worker stopped responding',
+    )
+    return stale.update(status='PENDING', locked_at=None) + failed
+
+
+class _Heartbeat(threading.Thread):
+    """Keeps a running job's locked_at fresh so it is never taken for stale"""
+
+    def __init__(self, job_id):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self._done = threading.Event()
+
+    def run(self):
+        try:
+            while not self._done.wait(HEARTBEAT_INTERVAL.total_seconds()):
+                Job.objects.filter(pk=self.job_id, status='RUNNING').update(locked_at=timezone.now())
+        finally:
+            # This thread's own connection
+            connection.close()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def run_job(job_id):
+    """Execute a claimed job and record the outcome; returns True on success"""
+    job = Job.objects.get(pk=job_id)
+    heartbeat = _Heartbeat(job_id)
+    heartbeat.start()
+    try:
+        import_string(job.task)(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+    else:
+        error = None
+    finally:
+        heartbeat.stop()
+
+    if error is None:
+        Job.objects.filter(pk=job_id).update(status='DONE', locked_at=None, finished_at=timezone.now())
+        return True
+    if job.attempts < job.max_attempts:
+        Job.objects.filter(pk=job_id).update(
+            status='PENDING', locked_at=None, last_error=error,
+            run_after=timezone.now() + RETRY_DELAY * job.attempts,
+        )
+    else:
+        Job.objects.filter(pk=job_id).update(
+            status='FAILED', locked_at=None, last_error=error, finished_at=timezone.now(),
+        )
+    return False
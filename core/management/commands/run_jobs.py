@@ -0,0 +1,84 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import worker
+from core.jobs import claim_jobs, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (see core.jobs) with a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Number of worker processes; 0 runs jobs inside this process")
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Seconds to wait between queue checks when idle (default: 2)")
+        parser.add_argument('--burst', action='store_true',
+                            help="Exit once no job is due instead of waiting for new ones")
+
+    def handle(self, *args, **options):
+        local = [alias for alias, cache in settings.CACHES.items() if cache['BACKEND'].endswith('.LocMemCache')]
+        if local:
+            # Jobs invalidate cached data the web processes read
+            self.stderr.write(
+                f"Warning: LocMemCache is configured for {', '.join(local)}, so changes made by jobs "
+                "will not reach the web server's cache. Point CACHE_BACKEND/FRAGMENT_CACHE_BACKEND "
+                "at a backend shared with it."
+            )
+        self.succeeded = self.failed = 0
+        try:
+            if options['workers'] == 0:
+                self._run_inline(options)
+            else:
+                self._run_pool(options)
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Jobs finished: {self.succeeded} succeeded, {self.failed} failed.")
+
+    def _record(self, succeeded):
+        if succeeded:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+
+    def _run_inline(self, options):
+        while True:
+            requeue_stale_jobs()
+            job_ids = claim_jobs(1)
+            if not job_ids:
+                if options['burst']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+            self._record(run_job(job_ids[0]))
+
+    def _run_pool(self, options):
+        workers = options['workers']
+        # Spawned workers start from a fresh interpreter with their own connections
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=worker.init_worker) as pool:
+            running = set()
+            while True:
+                requeue_stale_jobs()
+                free = workers - len(running)
+                if free:
+                    running.update(pool.submit(worker.execute, job_id) for job_id in claim_jobs(free))
+                if not running:
+                    if options['burst']:
+                        return
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, running = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        self._record(future.result())
+                    except Exception as exc:
+                        # run_job records task errors itself; this is e.g. a lost DB connection
+                        self.failed += 1
+                        self.stderr.write(f"Worker error: {exc}")
@@ -0,0 +1,180 @@
+"""
+Per-request timings: SQL (count and time), template rendering and total
+time, sent back in a Server-Timing header and aggregated into per-view
+histograms that the staff-only metrics view exposes in the Prometheus text
+format. Histograms live in process memory, so each gunicorn worker reports
+its own; every series carries a `pid` label to keep them apart.
+"""
+import os
+import threading
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+METRICS = {
+    # name: (help, buckets)
+    'request_duration_seconds': ("Time spent handling the request", DURATION_BUCKETS),
+    'request_sql_duration_seconds': ("Time spent in SQL queries", DURATION_BUCKETS),
+    'request_template_duration_seconds': ("Time spent rendering templates, excluding SQL", DURATION_BUCKETS),
+    'request_queries': ("SQL queries run by the request", QUERY_BUCKETS),
+}
+METRIC_PREFIX = 'mindfolio_'
+# Requests that did not resolve to a named URL (404s, static files) share one label
+UNNAMED_VIEW = 'other'
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    __slots__ = ('sql_count', 'sql_time', 'template_time', 'rendering')
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += perf_counter() - started
+            self.sql_count += 1
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One slot per bucket plus +Inf; cumulated when exported
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+_histograms = {}
+_lock = threading.Lock()
+
+
+def record(view, timings, total):
+    values = {
+        'request_duration_seconds': total,
+        'request_sql_duration_seconds': timings.sql_time,
+        'request_template_duration_seconds': timings.template_time,
+        'request_queries': timings.sql_count,
+    }
+    with _lock:
+        for name, value in values.items():
+            histogram = _histograms.get((name, view))
+            if histogram is None:
+                histogram = _histograms[(name, view)] = Histogram(METRICS[name][1])
+            histogram.observe(value)
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def _label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def render_metrics():
+    """All histograms of this process in the Prometheus text exposition format"""
+    pid = os.getpid()
+    with _lock:
+        snapshot = {key: (list(h.counts), h.sum, h.buckets) for key, h in _histograms.items()}
+
+    lines = []
+    for name, (help_text, _) in METRICS.items():
+        full_name = METRIC_PREFIX + name
+        lines.append(f'# HELP {full_name} {help_text}')
+        lines.append(f'# TYPE {full_name} histogram')
+        for (metric, view), (counts, total, buckets) in sorted(snapshot.items()):
+            if metric != name:
+                continue
+            labels = f'view="{_label(view)}",pid="{pid}"'
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{full_name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{full_name}_sum{{{labels}}} {total}')
+            lines.append(f'{full_name}_count{{{labels}}} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def _timed_render(render):
+    @wraps(render)
+    def wrapper(self, context=None, request=None):
+        timings = _current.get()
+        # Only the outermost render is timed; nested ones are part of it
+        if timings is None or timings.rendering:
+            return render(self, context, request)
+        timings.rendering = True
+        started, sql_before = perf_counter(), timings.sql_time
+        try:
+            return render(self, context, request)
+        finally:
+            timings.rendering = False
+            # Querysets evaluated by the template count as SQL, not rendering
+            timings.template_time += perf_counter() - started - (timings.sql_time - sql_before)
+    wrapper.timed = True
+    return wrapper
+
+
+def server_timing(timings, total):
+    return (
+        f'sql;dur={timings.sql_time * 1000:.1f};desc="{timings.sql_count} queries", '
+        f'tpl;dur={timings.template_time * 1000:.1f}, '
+        # Whatever is left: view code, file I/O, cache and other middleware
+        f'app;dur={max(total - timings.sql_time - timings.template_time, 0) * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+
+
+class ServerTimingMiddleware:
+    """
+    Times each request and adds a Server-Timing header (unless the
+    SERVER_TIMING setting is off). Place it near the top of MIDDLEWARE so the
+    total covers the rest of the stack. The per-request cost is a few
+    counter updates per query and one lock around the histogram update.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not getattr(Template.render, 'timed', False):
+            Template.render = _timed_render(Template.render)
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = perf_counter() - started
+
+        match = request.resolver_match
+        record((match.url_name if match else None) or UNNAMED_VIEW, timings, total)
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = server_timing(timings, total)
+        return response
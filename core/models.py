@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.utils import timezone
 
 
 class Tag(models.Model):
@@ -11,6 +13,86 @@ class Tag(models.Model):
     class Meta:
         ordering = ['name']
         unique_together = ['user', 'name']
+        indexes = [
+            # Search-as-you-type (books.autocomplete); needs pg_trgm
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='tag_name_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class Job(models.Model):
+    """
+    A unit of background work, stored in the database and executed by the
+    `run_jobs` command (see core.jobs). `task` is the dotted path of the
+    function to call with `payload` as keyword arguments.
+    """
+
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    task = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            # Workers only ever look for due pending jobs
+            models.Index(
+                fields=['run_after', 'id'], name='job_pending_idx', condition=models.Q(status='PENDING'),
+            ),
+            models.Index(
+                fields=['locked_at'], name='job_running_idx', condition=models.Q(status='RUNNING'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.get_status_display()})"
+
+
+class RequestProfile(models.Model):
+    """
+    A request run under the profiler (see core.profiling), either because a
+    staff user asked for it or because it was sampled and turned out slow.
+    """
+
+    TRIGGER_CHOICES = [
+        ('REQUESTED', 'Requested by staff'),
+        ('SAMPLED', 'Sampled'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    sql_count = models.PositiveIntegerField(default=0)
+    sql_ms = models.FloatField(default=0)
+    # cProfile statistics; only for requested profiles
+    stats = models.TextField(blank=True)
+    # Sampled stacks in the collapsed format read by flamegraph.pl and speedscope
+    collapsed_stacks = models.TextField(blank=True)
+    # [{'sql': ..., 'ms': ...}] in execution order
+    sql_log = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
@@ -0,0 +1,127 @@
+"""
+Repeated-query (N+1) detection. Queries are grouped by their normalized
+SQL and the line of project code that ran them; a group that grows past
+NPLUSONE_THRESHOLD is the signature of a lookup inside a loop.
+NPlusOneMiddleware logs such groups per request when NPLUSONE_MODE is
+'log' (the default with DEBUG) and raises when it is 'raise' (the test
+runner, core.testing). query_budget() asserts the same in a test block.
+"""
+import logging
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_NORMALIZERS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    # IN lists of any length are the same shape
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+_PROJECT_DIR = str(settings.BASE_DIR)
+
+
+class NPlusOneError(AssertionError):
+    """A query shape repeated more often than allowed"""
+
+
+def normalize_sql(sql):
+    """The statement with literals and placeholders replaced, so repeats compare equal"""
+    for pattern, replacement in _NORMALIZERS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def _call_site():
+    """file:line of the innermost project frame outside this module"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_PROJECT_DIR) and filename != __file__ and 'site-packages' not in filename:
+            return f'{filename[len(_PROJECT_DIR) + 1:]}:{frame.f_lineno}'
+        frame = frame.f_back
+    return '?'
+
+
+class QueryTracker:
+    """execute_wrapper counting queries per (shape, call site)"""
+
+    def __init__(self):
+        self.groups = Counter()
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        self.groups[(normalize_sql(sql), _call_site())] += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold):
+        """[(count, sql, call site)] of the groups seen more than `threshold` times, worst first"""
+        return sorted(
+            ((count, sql, site) for (sql, site), count in self.groups.items() if count > threshold),
+            reverse=True,
+        )
+
+
+@contextmanager
+def track_queries():
+    """Count the block's queries on every database connection"""
+    tracker = QueryTracker()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(tracker))
+        yield tracker
+
+
+def describe(repeats):
+    return '\n'.join(f'{count}x at {site}: {sql[:300]}' for count, sql, site in repeats)
+
+
+@contextmanager
+def query_budget(max_queries=None, max_repeats=None):
+    """
+    Fail the block when it runs more than `max_queries` queries, or any
+    query shape more than `max_repeats` times (default NPLUSONE_THRESHOLD):
+
+        with query_budget(max_queries=4):
+            self.client.get(reverse('library'))
+    """
+    with track_queries() as tracker:
+        yield tracker
+    problems = []
+    if max_queries is not None and tracker.total > max_queries:
+        problems.append(f'{tracker.total} queries, expected at most {max_queries}')
+    repeats = tracker.repeated(settings.NPLUSONE_THRESHOLD if max_repeats is None else max_repeats)
+    if repeats:
+        problems.append('Repeated queries:\n' + describe(repeats))
+    if problems:
+        raise NPlusOneError('\n'.join(problems))
+
+
+class NPlusOneMiddleware:
+    """Log or raise on repeated queries per request, as NPLUSONE_MODE says"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = settings.NPLUSONE_MODE
+        if not mode:
+            return self.get_response(request)
+
+        with track_queries() as tracker:
+            response = self.get_response(request)
+        repeats = tracker.repeated(settings.NPLUSONE_THRESHOLD)
+        if repeats:
+            message = f'Repeated queries in {request.method} {request.path}:\n{describe(repeats)}'
+            if mode == 'raise':
+                raise NPlusOneError(message)
+            logger.warning(message)
+        return response
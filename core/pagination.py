@@ -0,0 +1,166 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded"""
+
+
+class KeysetPage:
+    """One page of results plus the cursor needed to fetch the next one"""
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _resolve(obj, path):
+    """Follow a `field__subfield` path on a model instance"""
+    for attr in path.split('__'):
+        if obj is None:
+            return None
+        obj = getattr(obj, attr)
+    return obj
+
+
+def _is_nullable(model, path):
+    """Whether `path` can be NULL; annotations are assumed nullable"""
+    if path == 'pk':
+        return False
+    for name in path.split('__'):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return True
+        if field.null:
+            return True
+        model = field.related_model
+    return False
+
+
+def encode_cursor(values):
+    payload = json.dumps([_encode_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor(cursor) from exc
+    if not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by seeking past the last row of the previous page.
+
+    `ordering` is a list of field names (prefixed with '-' for descending),
+    e.g. ['-rank', '-updated_at']. The primary key is always appended as a
+    tiebreaker in the direction of the last key, and NULLs of nullable keys
+    sort last, so every row has a stable position. Unlike OFFSET paging,
+    fetching page N costs the same as fetching page 1 when an index matches
+    the ordering.
+    """
+
+    def __init__(self, queryset, ordering, per_page=25):
+        self.per_page = per_page
+        self.keys = [
+            (name.lstrip('-'), name.startswith('-'), _is_nullable(queryset.model, name.lstrip('-')))
+            for name in ordering
+        ]
+        if not any(field == 'pk' for field, _, _ in self.keys):
+            self.keys.append(('pk', self.keys[-1][1] if self.keys else False, False))
+        self.queryset = queryset.order_by(*self._order_by())
+
+    def _order_by(self):
+        for field, descending, nullable in self.keys:
+            expression = F(field)
+            if nullable:
+                yield expression.desc(nulls_last=True) if descending else expression.asc(nulls_last=True)
+            else:
+                yield expression.desc() if descending else expression.asc()
+
+    def _after(self, keys, values):
+        """Rows strictly after `values` in `keys` order"""
+        if not keys:
+            return Q(pk__in=[])
+        (field, descending, nullable), value = keys[0], values[0]
+        if value is None:
+            # Nothing sorts after NULL, so only ties can advance on later keys
+            return Q(**{f'{field}__isnull': True}) & self._after(keys[1:], values[1:])
+        beyond = Q(**{f'{field}__{"lt" if descending else "gt"}': value})
+        if nullable:
+            beyond |= Q(**{f'{field}__isnull': True})
+        return beyond | (Q(**{field: value}) & self._after(keys[1:], values[1:]))
+
+    def querysets(self, cursor=None):
+        """
+        Ordered querysets that together return the rows after `cursor`.
+
+        The leading key is bounded with a plain range condition (e.g.
+        `updated_at <= v`) so the database can start an index scan at the
+        cursor instead of filtering every earlier row. NULLs of a nullable
+        leading key cannot be part of that range, so they are fetched by a
+        second query once the non-NULL rows run out.
+        """
+        if not cursor:
+            return [self.queryset]
+        values = decode_cursor(cursor)
+        if len(values) != len(self.keys):
+            raise InvalidCursor(cursor)
+
+        (field, descending, nullable), value = self.keys[0], values[0]
+        rest = self._after(self.keys[1:], values[1:])
+        if value is None:
+            return [self.queryset.filter(Q(**{f'{field}__isnull': True}) & rest)]
+        bounded = self.queryset.filter(
+            Q(**{f'{field}__{"lte" if descending else "gte"}': value})
+            & (Q(**{f'{field}__{"lt" if descending else "gt"}': value}) | rest)
+        )
+        if not nullable:
+            return [bounded]
+        return [bounded, self.queryset.filter(**{f'{field}__isnull': True})]
+
+    def cursor_for(self, obj):
+        """Cursor that continues right after `obj`"""
+        return encode_cursor([_resolve(obj, field) for field, _, _ in self.keys])
+
+    def page(self, cursor=None):
+        rows = []
+        for queryset in self.querysets(cursor):
+            rows.extend(queryset[:self.per_page + 1 - len(rows)])
+            if len(rows) > self.per_page:
+                break
+        object_list = rows[:self.per_page]
+        next_cursor = self.cursor_for(object_list[-1]) if len(rows) > self.per_page else None
+        return KeysetPage(object_list, next_cursor)
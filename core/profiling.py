@@ -0,0 +1,151 @@
+"""
+On-demand request profiling. A staff user adds `?_profile=1` (or the header
+`X-Profile: 1`) to run a request under cProfile plus a stack sampler; with
+PROFILE_SAMPLE_RATE set, that fraction of all requests runs under the
+sampler alone and is kept when slower than PROFILE_SLOW_MS. Profiles are
+stored as RequestProfile rows and listed in the admin.
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+from collections import Counter
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+from .models import RequestProfile
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile'
+SAMPLE_INTERVAL = 0.005
+MAX_SQL_LOG = 1000
+STATS_LINES = 80
+
+
+class StackSampler(threading.Thread):
+    """Record the stack of one thread every `interval` seconds, as collapsed stacks"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def collapsed(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+
+class SQLLog:
+    """execute_wrapper keeping each statement and its duration"""
+
+    def __init__(self):
+        self.entries = []
+        self.count = 0
+        self.total = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (perf_counter() - started) * 1000
+            self.count += 1
+            self.total += elapsed
+            if len(self.entries) < MAX_SQL_LOG:
+                self.entries.append({'sql': sql, 'ms': round(elapsed, 3)})
+
+
+def _requested(request):
+    asked = request.GET.get(PROFILE_PARAM) == '1' or request.headers.get(PROFILE_HEADER) == '1'
+    # Only look at the user when asked, so normal requests load no session
+    return asked and request.user.is_staff
+
+
+def _prune():
+    """Keep only the newest PROFILE_KEEP profiles"""
+    cutoff = RequestProfile.objects.values_list('created_at', flat=True)[settings.PROFILE_KEEP:settings.PROFILE_KEEP + 1]
+    if cutoff:
+        RequestProfile.objects.filter(created_at__lte=cutoff[0]).delete()
+
+
+class ProfilingMiddleware:
+    """Must come after AuthenticationMiddleware, which provides request.user"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if _requested(request):
+            trigger = 'REQUESTED'
+        elif settings.PROFILE_SAMPLE_RATE and random.random() < settings.PROFILE_SAMPLE_RATE:
+            trigger = 'SAMPLED'
+        else:
+            return self.get_response(request)
+
+        sampler = StackSampler(threading.get_ident())
+        sql_log = SQLLog()
+        profiler = cProfile.Profile() if trigger == 'REQUESTED' else None
+        started = perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(sql_log))
+            sampler.start()
+            try:
+                if profiler:
+                    response = profiler.runcall(self.get_response, request)
+                else:
+                    response = self.get_response(request)
+            finally:
+                sampler.stop()
+        duration = (perf_counter() - started) * 1000
+
+        if trigger == 'SAMPLED' and duration < settings.PROFILE_SLOW_MS:
+            return response
+
+        stats = ''
+        if profiler:
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(STATS_LINES)
+            stats = out.getvalue()
+        match = request.resolver_match
+        user = getattr(request, 'user', None)
+        profile = RequestProfile.objects.create(
+            user=user if user is not None and user.is_authenticated else None,
+            trigger=trigger,
+            method=request.method,
+            path=request.get_full_path()[:2000],
+            view_name=(match.view_name if match else '')[:200],
+            status_code=response.status_code,
+            duration_ms=duration,
+            sql_count=sql_log.count,
+            sql_ms=sql_log.total,
+            stats=stats,
+            collapsed_stacks=sampler.collapsed(),
+            sql_log=sql_log.entries,
+        )
+        _prune()
+        if trigger == 'REQUESTED':
+            response['X-Profile-Id'] = str(profile.pk)
+        return response
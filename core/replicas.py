@@ -0,0 +1,81 @@
+"""
+Read-replica routing. With REPLICA_DATABASE set, ReplicaMiddleware lets the
+reads of a request go to that alias while every write goes to `default`.
+A request that writes (or any non-GET request) pins its own later reads to
+the primary, and a short-lived cookie keeps the user's next requests there
+for REPLICA_PIN_SECONDS, so nobody reads around their own change before the
+replica has caught up. Code running outside a request (jobs, management
+commands) always uses the primary.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'use_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_request = ContextVar('replica_request', default=None)
+
+
+class _RequestState:
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request.get()
+        if (
+            state is None
+            or state.pinned
+            or not settings.REPLICA_DATABASE
+            # Reads inside a transaction must see its uncommitted writes
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return settings.REPLICA_DATABASE
+
+    def db_for_write(self, model, **hints):
+        state = _request.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Place it above SessionMiddleware so session saves count as writes"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REPLICA_DATABASE:
+            return self.get_response(request)
+
+        state = _RequestState(pinned=request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES)
+        token = _request.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+
+        if state.wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                secure=request.is_secure(),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,44 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, SearchVectorField
+from django.db.models import F, FloatField, Func, Value
+from django.db.models.functions import Cast
+
+# Text search configuration shared by every stored search vector.
+SEARCH_CONFIG = 'english'
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def weighted_vector(expression, weight):
+    """Build a weighted tsvector for a single column or expression"""
+    return SearchVector(expression, weight=weight, config=SEARCH_CONFIG)
+
+
+def build_search_query(text):
+    """Turn free-form user input into a tsquery (supports quotes, OR and -)"""
+    return SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+
+
+def search_rank(query, vector_field='search_vector'):
+    """Relevance of `vector_field` for `query`, as a double precision value"""
+    return Cast(SearchRank(F(vector_field), query), output_field=FloatField())
+
+
+def weight_filtered(vector_field, weights):
+    """The lexemes of `vector_field` carrying one of `weights`, e.g. 'A'"""
+    return Func(
+        F(vector_field), Value('{%s}' % ','.join(weights.lower())),
+        function='ts_filter', output_field=SearchVectorField(),
+    )
+
+
+def build_prefix_query(text):
+    """
+    tsquery matching every word of `text`, the last one as a prefix, for
+    search-as-you-type. Returns None when `text` has no words.
+    """
+    words = WORD_PATTERN.findall(text)
+    if not words:
+        return None
+    terms = words[:-1] + [f'{words[-1]}:*']
+    return SearchQuery(' & '.join(terms), config=SEARCH_CONFIG, search_type='raw')
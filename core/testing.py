@@ -0,0 +1,19 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Fails any test request that repeats a query shape (core.nplusone), and
+    keeps reads on `default`: the replica alias is a separate connection
+    that can't see data inside a test's transaction.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._nplusone = override_settings(NPLUSONE_MODE='raise', REPLICA_DATABASE='')
+        self._nplusone.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._nplusone.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,297 @@
-from django.test import TestCase
+import io
+import time
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from books.tests import TEST_STORAGES
+from . import jobs, metrics
+from .jobs import claim_jobs, enqueue, requeue_stale_jobs, run_job
+from .models import Job, RequestProfile, Tag
+from .nplusone import NPlusOneError, NPlusOneMiddleware, normalize_sql, query_budget
+from .replicas import PIN_COOKIE, ReplicaMiddleware
+
+CALLS = []
+
+
+def record_call(**payload):
+    CALLS.append(payload)
+
+
+def always_fail():
+    raise RuntimeError('boom')
+
+
+def requeue_while_running():
+    time.sleep(0.3)
+    CALLS.append(requeue_stale_jobs())
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_claimed_job_runs_once(self):
+        job = enqueue('core.tests.record_call', value=1)
+        self.assertEqual(claim_jobs(10), [job.pk])
+        self.assertEqual(claim_jobs(10), [])
+
+        self.assertTrue(run_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('DONE', 1))
+        self.assertEqual(CALLS, [{'value': 1}])
+
+    def test_failures_are_retried_then_marked_failed(self):
+        job = enqueue('core.tests.always_fail')
+        job.max_attempts = 2
+        job.save()
+
+        claim_jobs(1)
+        self.assertFalse(run_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'PENDING')
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        claim_jobs(1)
+        run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('FAILED', 2))
+
+    def test_stale_running_jobs_are_requeued(self):
+        job = enqueue('core.tests.record_call')
+        claim_jobs(1)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(claim_jobs(1), [job.pk])
+
+    def test_worker_warns_about_a_process_local_cache(self):
+        def run_worker():
+            stderr = io.StringIO()
+            call_command('run_jobs', workers=0, burst=True, stdout=io.StringIO(), stderr=stderr)
+            return stderr.getvalue()
+
+        locmem = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/unused'}
+        with override_settings(CACHES={'default': shared, 'fragments': locmem}):
+            self.assertIn('LocMemCache is configured for fragments,', run_worker())
+        with override_settings(CACHES={'default': shared, 'fragments': shared}):
+            self.assertEqual(run_worker(), '')
+
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    def setUp(self):
+        CALLS.clear()
+        self.interval = jobs.HEARTBEAT_INTERVAL
+        jobs.HEARTBEAT_INTERVAL = timedelta(milliseconds=50)
+
+    def tearDown(self):
+        jobs.HEARTBEAT_INTERVAL = self.interval
+
+    def test_long_running_jobs_are_not_requeued(self):
+        job = enqueue('core.tests.requeue_while_running')
+        claim_jobs(1)
+        # As if the job had been running for longer than STALE_AFTER
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertTrue(run_job(job.pk))
+        self.assertEqual(CALLS, [0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('DONE', 1))
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='secret')
+        cls.staff = User.objects.create_user('admin', password='secret', is_staff=True)
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_responses_carry_server_timing(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('library'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^sql;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, app;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertNotIn('desc="0 queries"', timing)
+
+    def test_timings_are_aggregated_per_url_name(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('library'))
+        self.client.get(reverse('library'))
+
+        self.client.force_login(self.staff)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE mindfolio_request_duration_seconds histogram', body)
+        self.assertRegex(body, r'mindfolio_request_duration_seconds_count\{view="library",pid="\d+"\} 2\n')
+        self.assertRegex(body, r'mindfolio_request_queries_bucket\{view="library",pid="\d+",le="\+Inf"\} 2\n')
+
+    def test_metrics_are_staff_only(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_scrapers_authenticate_with_the_token(self):
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer scrape-me'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class RequestProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='secret')
+        cls.staff = User.objects.create_superuser('admin', password='secret')
+
+    def test_staff_can_profile_a_request(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('library'), {'_profile': '1'})
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual((profile.trigger, profile.view_name, profile.user), ('REQUESTED', 'library', self.staff))
+        self.assertIn('library_view', profile.stats)
+        self.assertEqual(profile.sql_count, len(profile.sql_log))
+        self.assertTrue(any('"books_book"' in entry['sql'] for entry in profile.sql_log))
+
+        response = self.client.get(reverse('admin:core_requestprofile_changelist'))
+        self.assertContains(response, '/?_profile=1')
+        response = self.client.get(reverse('admin:core_requestprofile_change', args=[profile.pk]))
+        self.assertContains(response, 'Download collapsed stacks')
+        response = self.client.get(reverse('admin:core_requestprofile_stacks', args=[profile.pk]))
+        self.assertEqual(response.content.decode(), profile.collapsed_stacks)
+
+    def test_other_users_cannot_profile(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('library'), {'_profile': '1'}, headers={'X-Profile': '1'})
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(PROFILE_SAMPLE_RATE=1.0, PROFILE_SLOW_MS=0, PROFILE_KEEP=2)
+    def test_sampled_requests_are_kept_up_to_the_limit(self):
+        self.client.force_login(self.user)
+        for _ in range(3):
+            self.client.get(reverse('library'))
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        profile = RequestProfile.objects.first()
+        self.assertEqual((profile.trigger, profile.stats), ('SAMPLED', ''))
+
+    @override_settings(PROFILE_SAMPLE_RATE=1.0, PROFILE_SLOW_MS=60_000)
+    def test_fast_sampled_requests_are_dropped(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('library'))
+        self.assertFalse(RequestProfile.objects.exists())
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class NPlusOneTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from books.models import Author, Book
+        cls.staff = User.objects.create_superuser('admin', password='secret')
+        for i in range(8):
+            author = Author.objects.create(user=cls.staff, name=f'Author {i}')
+            Book.objects.create(user=cls.staff, author=author, title=f'Book {i}')
+
+    def test_literals_and_in_lists_share_a_shape(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE id = 12 AND name = 'it''s' AND x IN (%s, %s)"),
+            normalize_sql('SELECT * FROM t WHERE id = %s AND name = %s AND x IN (1, 2, 3)'),
+        )
+
+    def test_query_budget_catches_a_loop(self):
+        from books.models import Book
+        with self.assertRaisesMessage(NPlusOneError, '8x at core/tests.py'):
+            with query_budget():
+                for book in Book.objects.all():
+                    book.author.name
+        with query_budget(max_repeats=1) as tracker:
+            [book.author.name for book in Book.objects.select_related('author')]
+        self.assertEqual(tracker.total, 1)
+
+    def test_query_budget_caps_the_total(self):
+        with self.assertRaisesMessage(NPlusOneError, '2 queries, expected at most 1'):
+            with query_budget(max_queries=1):
+                User.objects.count()
+                connection.cursor().execute('SELECT 1')
+
+    def test_pages_stay_within_the_threshold(self):
+        self.client.force_login(self.staff)
+        with query_budget():
+            self.assertEqual(self.client.get(reverse('library')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('admin:books_book_changelist')).status_code, 200)
+
+    def _authors_page(self, request):
+        from books.models import Book
+        return HttpResponse(', '.join(book.author.name for book in Book.objects.all()))
+
+    def test_middleware_raises_in_tests(self):
+        middleware = NPlusOneMiddleware(self._authors_page)
+        with self.assertRaisesMessage(NPlusOneError, 'Repeated queries in GET /authors/'):
+            middleware(RequestFactory().get('/authors/'))
+
+    @override_settings(NPLUSONE_MODE='log')
+    def test_middleware_logs_in_development(self):
+        middleware = NPlusOneMiddleware(self._authors_page)
+        with self.assertLogs('core.nplusone', 'WARNING') as logs:
+            response = middleware(RequestFactory().get('/authors/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('8x at core/tests.py', logs.output[0])
+
+
+@override_settings(REPLICA_DATABASE='replica', REPLICA_PIN_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    def _request(self, method='get', write=False, pinned=False):
+        """Run a request through the middleware; returns (response, alias of each read)"""
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(Tag))
+            if write:
+                self.assertEqual(router.db_for_write(Tag), 'default')
+                reads.append(router.db_for_read(Tag))
+            return HttpResponse()
+
+        factory = RequestFactory()
+        if pinned:
+            factory.cookies[PIN_COOKIE] = '1'
+        return ReplicaMiddleware(view)(getattr(factory, method)('/')), reads
+
+    def test_reads_go_to_the_replica(self):
+        response, reads = self._request()
+        self.assertEqual(reads, ['replica'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_a_write_pins_the_rest_of_the_request_and_the_next_ones(self):
+        response, reads = self._request(write=True)
+        self.assertEqual(reads, ['replica', 'default'])
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 10)
+
+        response, reads = self._request(pinned=True)
+        self.assertEqual(reads, ['default'])
+
+    def test_unsafe_methods_use_the_primary(self):
+        response, reads = self._request('post')
+        self.assertEqual(reads, ['default'])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertEqual(router.db_for_read(Tag), 'default')
+
+    @override_settings(REPLICA_DATABASE='')
+    def test_without_a_replica_nothing_changes(self):
+        response, reads = self._request(write=True)
+        self.assertEqual(reads, ['default', 'default'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
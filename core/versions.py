@@ -0,0 +1,30 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def _version_key(scope, user_id):
+    return f'{scope}-version:{user_id}'
+
+
+def current_version(scope, user_id):
+    """
+    Token that changes whenever the user's `scope` data is written, for use
+    in ETags and cache keys. A missing (evicted) token is replaced by a
+    fresh one, which only costs a cache miss.
+    """
+    key = _version_key(scope, user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(scope, user_id):
+    """Give the user's `scope` a new version once the transaction commits"""
+    if user_id:
+        transaction.on_commit(lambda: cache.set(_version_key(scope, user_id), time.time_ns(), VERSION_TIMEOUT))
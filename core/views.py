@@ -1,8 +1,15 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+
+from .metrics import render_metrics
 
 
 def login_view(request):
@@ -55,3 +62,18 @@ def logout_view(request):
     logout(request)
     messages.info(request, 'You have been logged out.')
     return redirect('login')
+
+
+def metrics_view(request):
+    """
+    Request histograms in the Prometheus text format, for staff users or a
+    scraper sending `Authorization: Bearer <METRICS_TOKEN>`
+    """
+    token = settings.METRICS_TOKEN
+    bearer = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not (token and hmac.compare_digest(bearer, token)):
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        if not request.user.is_staff:
+            return HttpResponse('Forbidden', status=403)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
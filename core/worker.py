@@ -0,0 +1,15 @@
+"""
+Entry points for `run_jobs` worker processes. Spawned workers import this
+module before Django is configured, so it must not import models at the
+top level.
+"""
+import django
+
+
+def init_worker():
+    django.setup()
+
+
+def execute(job_id):
+    from .jobs import run_job
+    return run_job(job_id)
@@ -52,8 +52,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.metrics.ServerTimingMiddleware",  # Server-Timing header and /metrics/
+    "core.nplusone.NPlusOneMiddleware",  # Repeated-query warnings, see below
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # Serve static files
+    "core.replicas.ReplicaMiddleware",  # Read replica routing, see DATABASES
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -61,6 +64,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django_htmx.middleware.HtmxMiddleware",  # HTMX support
+    "core.profiling.ProfilingMiddleware",  # ?_profile=1 for staff, see below
 ]
 
 ROOT_URLCONF = "mindfolio.urls"
@@ -99,6 +103,55 @@ DATABASES = {
     }
 }
 
+# Optional read replica (core.replicas). Set DB_REPLICA_HOST to send the reads
+# of GET requests there; writes, and a user's reads for REPLICA_PIN_SECONDS
+# after they write, stay on the primary. Pointing it at the primary itself
+# (e.g. DB_REPLICA_HOST=localhost) exercises the routing locally.
+if config('DB_REPLICA_HOST', default=''):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": config('DB_REPLICA_NAME', default=DATABASES["default"]["NAME"]),
+        "USER": config('DB_REPLICA_USER', default=DATABASES["default"]["USER"]),
+        "PASSWORD": config('DB_REPLICA_PASSWORD', default=DATABASES["default"]["PASSWORD"]),
+        "HOST": config('DB_REPLICA_HOST'),
+        "PORT": config('DB_REPLICA_PORT', default=DATABASES["default"]["PORT"]),
+        # Tests don't create a separate database for it
+        "TEST": {"MIRROR": "default"},
+    }
+REPLICA_DATABASE = "replica" if "replica" in DATABASES else ""
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=10, cast=int)
+DATABASE_ROUTERS = ["core.replicas.ReplicaRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# The default in-process cache only suits runserver on its own. Cached stats,
+# author suggestions and book cards are invalidated by whichever process
+# changes the data: every gunicorn worker and every run_jobs worker (imports,
+# file text extraction) must therefore use the same shared backend, e.g.
+# FileBasedCache on a directory they all mount, Redis or Memcached. run_jobs
+# warns when it starts with LocMemCache.
+# Rendered book cards (books.fragments) get their own alias. LocMemCache evicts
+# least recently used entries once MAX_ENTRIES is reached.
+
+CACHES = {
+    "default": {
+        "BACKEND": config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": config('CACHE_LOCATION', default='mindfolio'),
+    },
+    "fragments": {
+        "BACKEND": config('FRAGMENT_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": config('FRAGMENT_CACHE_LOCATION', default='mindfolio-fragments'),
+        "OPTIONS": {
+            "MAX_ENTRIES": config('FRAGMENT_CACHE_MAX_ENTRIES', default=5000, cast=int),
+        },
+    },
+}
+
+# Sessions are read through the cache, so conditional GETs answered with
+# 304 (core.conditional) do not query the database
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -154,6 +207,44 @@ STORAGES = {
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Uploads are hashed while they stream in, so identical files are stored
+# once (see books.blobs)
+FILE_UPLOAD_HANDLERS = [
+    "books.blobs.HashingMemoryFileUploadHandler",
+    "books.blobs.HashingTemporaryFileUploadHandler",
+]
+
+# Largest file a chunked upload may announce, in bytes (default 2 GiB)
+MAX_UPLOAD_SIZE = config('MAX_UPLOAD_SIZE', default=2 * 1024 ** 3, cast=int)
+
+# How book file downloads are sent: '' streams them from Django,
+# 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd) hands the
+# transfer to the web server after the ownership check. For nginx, map
+# FILE_DOWNLOAD_ACCEL_PREFIX to MEDIA_ROOT in an `internal` location.
+FILE_DOWNLOAD_OFFLOAD = config('FILE_DOWNLOAD_OFFLOAD', default='')
+FILE_DOWNLOAD_ACCEL_PREFIX = config('FILE_DOWNLOAD_ACCEL_PREFIX', default='/protected-media/')
+
+# Request timings (core.metrics): SERVER_TIMING adds the Server-Timing header
+# to responses; /metrics/ is open to staff users and, when METRICS_TOKEN is
+# set, to scrapers sending it as a bearer token
+SERVER_TIMING = config('SERVER_TIMING', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Request profiles (core.profiling): staff users profile a request by adding
+# ?_profile=1 or an `X-Profile: 1` header. PROFILE_SAMPLE_RATE runs that
+# share of all requests under the stack sampler and keeps those slower than
+# PROFILE_SLOW_MS. Only the newest PROFILE_KEEP profiles are kept.
+PROFILE_SAMPLE_RATE = config('PROFILE_SAMPLE_RATE', default=0.0, cast=float)
+PROFILE_SLOW_MS = config('PROFILE_SLOW_MS', default=1000, cast=int)
+PROFILE_KEEP = config('PROFILE_KEEP', default=500, cast=int)
+
+# Repeated-query detection (core.nplusone): a request running one query shape
+# from one line more than NPLUSONE_THRESHOLD times is logged ('log') or fails
+# ('raise'). The test runner always raises.
+NPLUSONE_MODE = config('NPLUSONE_MODE', default='log' if DEBUG else '')
+NPLUSONE_THRESHOLD = config('NPLUSONE_THRESHOLD', default=5, cast=int)
+TEST_RUNNER = 'core.testing.TestRunner'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -6,7 +6,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from core.views import login_view, register_view, logout_view
+from core.views import login_view, register_view, logout_view, metrics_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -16,6 +16,9 @@ urlpatterns = [
     path('register/', register_view, name='register'),
     path('logout/', logout_view, name='logout'),
 
+    # Prometheus metrics (core.metrics)
+    path('metrics/', metrics_view, name='metrics'),
+
     # App URLs
     path('', include('books.urls')),
     path('quotes/', include('quotes.urls')),
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-17 23:58
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build indexes without locking writes on large existing tables
+    atomic = False
+
+    dependencies = [
+        ('books', '0004_library_indexes'),
+        ('notes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='note',
+            index=models.Index(fields=['book', '-created_at'], name='note_book_created_idx'),
+        ),
+    ]
@@ -24,6 +24,9 @@ class Note(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['book', '-created_at'], name='note_book_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_note_type_display()}: {self.title or self.body[:50]}"
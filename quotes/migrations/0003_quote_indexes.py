@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-17 23:58
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build indexes without locking writes on large existing tables
+    atomic = False
+
+    dependencies = [
+        ('books', '0004_library_indexes'),
+        ('core', '0001_initial'),
+        ('quotes', '0002_quote_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='quote',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='quote_user_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='quote',
+            index=models.Index(fields=['user', 'page_number', 'id'], name='quote_user_page_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='quote',
+            index=models.Index(fields=['book', '-created_at'], name='quote_book_created_idx'),
+        ),
+    ]
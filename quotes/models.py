@@ -1,7 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from books.models import Book
 from core.models import Tag
+from core.search import weighted_vector
 
 
 class Quote(models.Model):
@@ -14,9 +17,21 @@ class Quote(models.Model):
     my_comment = models.TextField(blank=True)
     tags = models.ManyToManyField(Tag, related_name='quotes', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    search_vector = models.GeneratedField(
+        expression=weighted_vector('quote_text', 'A') + weighted_vector('my_comment', 'B'),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='quote_search_vector_idx'),
+            # Also serves oldest-first ordering through a backward scan
+            models.Index(fields=['user', '-created_at', '-id'], name='quote_user_created_idx'),
+            models.Index(fields=['user', 'page_number', 'id'], name='quote_user_page_idx'),
+            models.Index(fields=['book', '-created_at'], name='quote_book_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.quote_text[:50]}..." if len(self.quote_text) > 50 else self.quote_text
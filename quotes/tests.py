@@ -1,3 +1,54 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from books.models import Author, Book
+from .models import Quote
+
+
+class QuotesConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('quote-reader', password='secret')
+        cls.book = Book.objects.create(user=cls.user, title='Roadside Picnic')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_quotes_list_revalidates_against_library_version(self):
+        etag = self.client.get(reverse('quotes_list'), HTTP_HX_REQUEST='true')['ETag']
+        response = self.client.get(reverse('quotes_list'), HTTP_HX_REQUEST='true', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Quote.objects.create(book=self.book, user=self.user, quote_text='Happiness for everybody, free')
+        response = self.client.get(reverse('quotes_list'), HTTP_HX_REQUEST='true', HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Happiness for everybody, free')
+
+
+class QuotesSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('quote-searcher', password='secret')
+        author = Author.objects.create(user=cls.user, name='Arkady Strugatsky')
+        cls.book = Book.objects.create(user=cls.user, title='Roadside Picnic', author=author)
+        other = Book.objects.create(user=cls.user, title='Solaris')
+        Quote.objects.create(book=cls.book, user=cls.user, quote_text='Happiness for everybody, free')
+        Quote.objects.create(book=other, user=cls.user, quote_text='We need mirrors')
+        Quote.objects.create(book=other, user=cls.user, quote_text='Man has gone out to explore other worlds')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _search(self, text):
+        response = self.client.get(reverse('quotes_list'), {'q': text}, HTTP_HX_REQUEST='true')
+        return sorted(quote.quote_text for quote in response.context['quotes'])
+
+    def test_matches_quote_text_and_the_books_title_or_author(self):
+        self.assertEqual(self._search('mirrors'), ['We need mirrors'])
+        self.assertEqual(self._search('picnic'), ['Happiness for everybody, free'])
+        self.assertEqual(self._search('strugatsky'), ['Happiness for everybody, free'])
+
+    def test_other_quotes_of_a_matching_book_are_not_included(self):
+        # The book's search vector holds its quotes' text too
+        self.assertEqual(self._search('explore'), ['Man has gone out to explore other worlds'])
@@ -1,21 +1,34 @@
 from django.shortcuts import render
+from django.http import HttpResponseBadRequest
 from django.contrib.auth.decorators import login_required
 from django.db.models import Q
 from .models import Quote
 from books.models import Book
+from books.search import books_matching_title_or_author
+from core.conditional import conditional_on_library
 from core.models import Tag
+from core.pagination import InvalidCursor, KeysetPaginator
+from core.search import build_search_query, search_rank
 
+QUOTES_PER_PAGE = 30
 
+
+@conditional_on_library
 @login_required
 def quotes_list(request):
     """Global quotes page with filtering and search"""
-    quotes = Quote.objects.filter(user=request.user).select_related('book', 'user').prefetch_related('tags')
+    quotes = (
+        Quote.objects.filter(user=request.user)
+        .select_related('book', 'book__author', 'user')
+        .prefetch_related('tags')
+        .defer('search_vector', 'book__search_vector')
+    )
 
     # Get filter parameters
     book_filter = request.GET.get('book', '')
     tag_filter = request.GET.get('tag', '')
-    search_query = request.GET.get('q', '')
-    sort_by = request.GET.get('sort', '-created_at')
+    search_query = request.GET.get('q', '').strip()
+    sort_by = request.GET.get('sort', 'relevance' if search_query else '-created_at')
 
     # Apply book filter
     if book_filter:
@@ -25,28 +38,43 @@ def quotes_list(request):
     if tag_filter:
         quotes = quotes.filter(tags__id=tag_filter)
 
-    # Apply search query
+    # Apply search query: full-text match on the quote, plus the book it came
+    # from. Both arms are index lookups (the quote's search vector, and the
+    # book ids found through the books' one), so they combine as a bitmap OR.
     if search_query:
+        query = build_search_query(search_query)
+        book_ids = books_matching_title_or_author(request.user, query)
         quotes = quotes.filter(
-            Q(quote_text__icontains=search_query) |
-            Q(my_comment__icontains=search_query) |
-            Q(book__title__icontains=search_query) |
-            Q(book__author__name__icontains=search_query)
-        ).distinct()
+            Q(search_vector=query) | Q(book_id__in=book_ids)
+        ).annotate(rank=search_rank(query))
 
     # Apply sorting
     valid_sort_fields = ['-created_at', 'created_at', 'book__title', 'page_number']
-    if sort_by in valid_sort_fields:
-        quotes = quotes.order_by(sort_by)
+    if sort_by == 'relevance' and search_query:
+        ordering = ['-rank', '-created_at']
+    elif sort_by in valid_sort_fields:
+        ordering = [sort_by]
     else:
-        quotes = quotes.order_by('-created_at')
+        ordering = ['-created_at']
+
+    # Keyset pagination: each page seeks past the last quote of the previous one
+    cursor = request.GET.get('cursor')
+    try:
+        page = KeysetPaginator(quotes, ordering, per_page=QUOTES_PER_PAGE).page(cursor)
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor.")
+
+    # Infinite scroll only needs the next batch of quotes
+    if cursor and request.htmx:
+        return render(request, 'quotes/partials/quote_cards.html', {'quotes': page.object_list, 'page': page})
 
     # Get all books and tags for filter dropdowns
     user_books = Book.objects.filter(user=request.user).order_by('title')
     user_tags = Tag.objects.filter(user=request.user).order_by('name')
 
     context = {
-        'quotes': quotes,
+        'quotes': page.object_list,
+        'page': page,
         'books': user_books,
         'tags': user_tags,
         'current_book': book_filter,
@@ -59,4 +87,6 @@ def quotes_list(request):
     if request.htmx:
         return render(request, 'quotes/partials/quote_list.html', context)
 
+    context['quote_count'] = quotes.count()
+
     return render(request, 'quotes/quotes_list.html', context)